@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Acquisition Benchmark
+---------------------
+End-to-end benchmark of the experiment against the simulated instruments
+(devices.sim, run in a child process so they do not share the GIL or the CPU
+accounting of the drivers).
+
+Measured phases:
+  - ExperimentController.connect_all
+  - ExperimentController.set_experiment
+  - ExperimentController.run_experiment (steps/s, per-stage latency percentiles,
+    host CPU per trace, bytes moved per device)
+  - calibrate_voltage_to_frequency (utils/calibScan.py)
+  - set_target_detuning (utils/setDetuning.py)
+
+Results are written to a JSON file (benchmarks/results.json by default, not
+versioned) and compared with a stored baseline. A metric regresses when it is
+worse than the baseline by more than its relative tolerance (and an absolute
+floor for small timings); the script then exits with status 1. It also fails when
+the run_experiment step period is not clearly below the sum of its stage
+latencies, i.e. when the pipelined stages do not overlap.
+
+Run it from the repository root:
+    python -m benchmarks.acquisition --steps 500
+    python -m benchmarks.acquisition --steps 500 --update-baseline
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bragg import ExperimentController
+from utils.calibScan import calibrate_voltage_to_frequency
+from utils.calibration import Calibration
+from utils.setDetuning import set_target_detuning
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "results.json")  # Not versioned, see .gitignore
+DEFAULT_TOLERANCE = 0.15  # Relative slack before a metric counts as a regression
+ABSOLUTE_FLOOR = {"_s": 2e-3, "_ms": 0.5}  # Ignore differences below these, by unit suffix
+PERCENTILES = (50, 90, 99)
+MAX_OVERLAP_RATIO = 0.8  # Step period over the sum of the stage p50s, above it the stages do not overlap
+REFERENCE_FREQUENCY = 384229.0  # GHz, detunings are set from it (utils/setDetuning.py --ref)
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_s")
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Silences the driver prints, which would otherwise dominate the output."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def timed(func, *args, **kwargs):
+    """Calls func and returns (result, wall time in s)."""
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def traffic_delta(before, after):
+    """Per-device commands and bytes moved between two SimLab.stats() snapshots."""
+    metrics = {}
+    for device, counters in after.items():
+        for name, value in counters.items():
+            metrics[f"{device}_{name}"] = value - before[device][name]
+    return metrics
+
+
+def run_benchmark(args):
+    """
+    Runs every phase once against a fresh simulated lab.
+
+    Returns:
+        dict: Metric name -> value.
+    """
+    metrics = {}
+    sim_options = {"latency_scale": args.latency_scale, "seed": args.seed}
+    with quiet(not args.verbose):
+        exp = ExperimentController(signal_generator=args.signal_generator, backend="sim-process",
+                                   sim_options=sim_options)
+    try:
+        with quiet(not args.verbose):
+            report, metrics["connect_all_s"] = timed(exp.connect_all)
+        failed = [name for name, entry in report.items() if not entry["connected"]]
+        if failed:
+            raise RuntimeError(f"Simulated devices did not connect: {failed}")
+
+        with quiet(not args.verbose):
+            _, metrics["set_experiment_s"] = timed(
+                exp.set_experiment, f_low=750e6, f_high=760e6, f_step=1e6, step_time=0.01)
+            exp.sa.set_sweep_time(args.sweep_time)
+
+        traffic_before = exp.sim.stats()
+        cpu0 = time.process_time()
+        with quiet(not args.verbose):
+            results, elapsed = timed(exp.run_experiment, num_steps=args.steps, delay=args.delay,
+                                     pipeline_depth=args.pipeline_depth)
+        cpu = time.process_time() - cpu0
+        metrics["run_experiment_s"] = elapsed
+        metrics["run_experiment_steps_per_s"] = args.steps / elapsed
+        metrics["cpu_per_trace_ms"] = cpu / args.steps * 1e3
+        metrics["run_experiment_step_s"] = elapsed / args.steps
+        metrics["stage_sum_p50_s"] = 0.0
+        for stage in results[0]["timings"]:
+            durations = np.array([r["timings"][stage][1] for r in results])
+            for p in PERCENTILES:
+                metrics[f"stage_{stage}_p{p}_s"] = float(np.percentile(durations, p))
+            metrics["stage_sum_p50_s"] += metrics[f"stage_{stage}_p50_s"]
+        for name, value in traffic_delta(traffic_before, exp.sim.stats()).items():
+            metrics[f"run_{name}"] = value
+
+        if args.signal_generator.upper() == "RP":
+            with quiet(not args.verbose):
+                lut, metrics["calibrate_s"] = timed(
+                    calibrate_voltage_to_frequency, exp.signal_gen, exp.wavemeter,
+                    voltage_min=-5, voltage_max=2.5, num_steps=args.calib_steps,
+                    wait_time=args.delay, poly_order=3)
+                # Targets strictly inside the range just calibrated, which depends on the scan
+                low, high = Calibration.from_lut(lut).frequency_range
+                targets = np.linspace(low, high, args.detunings + 2)[1:-1]
+                detuning_times = []
+                for detuning in targets - REFERENCE_FREQUENCY:
+                    _, t = timed(set_target_detuning, exp.signal_gen, detuning, lut, REFERENCE_FREQUENCY)
+                    detuning_times.append(t)
+            for p in PERCENTILES:
+                metrics[f"set_target_detuning_p{p}_s"] = float(np.percentile(detuning_times, p))
+    finally:
+        with quiet(not args.verbose):
+            exp.shutdown()
+    return metrics
+
+
+def check_overlap(metrics, max_ratio=MAX_OVERLAP_RATIO):
+    """
+    Checks that the pipelined stages of run_experiment overlap: a step must take
+    clearly less than its stages run back to back.
+
+    Returns:
+        str or None: Failure message, None if the check passes.
+    """
+    step, total = metrics["run_experiment_step_s"], metrics["stage_sum_p50_s"]
+    if step > max_ratio * total:
+        return (f"run_experiment step period {step * 1e3:.1f} ms is above {max_ratio:.0%} of the "
+                f"sum of the stage latencies ({total * 1e3:.1f} ms): the stages do not overlap.")
+    return None
+
+
+def compare(metrics, baseline, default_tolerance):
+    """
+    Compares metrics with a baseline.
+
+    Returns:
+        list: (metric, baseline value, current value, relative change, status) rows,
+            status being "ok", "improved", "REGRESSION", "new" or "missing".
+    """
+    rows = []
+    reference = baseline.get("metrics", {})
+    tolerances = baseline.get("tolerances", {})
+    for metric in sorted(set(reference) | set(metrics)):
+        if metric not in reference:
+            rows.append((metric, None, metrics[metric], None, "new"))
+            continue
+        if metric not in metrics:
+            rows.append((metric, reference[metric], None, None, "missing"))
+            continue
+        old, new = reference[metric], metrics[metric]
+        change = (new - old) / old if old else 0.0
+        worse = old - new if higher_is_better(metric) else new - old
+        floor = next((v for suffix, v in ABSOLUTE_FLOOR.items() if metric.endswith(suffix)), 0.0)
+        allowed = max(tolerances.get(metric, default_tolerance) * abs(old), floor)
+        if worse > allowed:
+            status = "REGRESSION"
+        elif -worse > allowed:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((metric, old, new, change, status))
+    return rows
+
+
+def print_comparison(rows):
+    def fmt(value):
+        return "-" if value is None else f"{value:.6g}"
+
+    print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>9}  status")
+    for metric, old, new, change, status in rows:
+        change = "-" if change is None else f"{change:+.1%}"
+        print(f"{metric:<40} {fmt(old):>12} {fmt(new):>12} {change:>9}  {status}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end acquisition benchmark on simulated instruments.")
+    parser.add_argument("--steps", type=int, default=500, help="run_experiment steps (default 500)")
+    parser.add_argument("--delay", type=float, default=0.05, help="Settling time per step in s (default 0.05)")
+    parser.add_argument("--pipeline-depth", type=int, default=1, help="run_experiment pipeline depth")
+    parser.add_argument("--sweep-time", type=float, default=0.01, help="SA sweep time in s (default 0.01)")
+    parser.add_argument("--signal-generator", default="RP", choices=["RP", "AFG"],
+                        help="Signal generator; the calibration phases need RP")
+    parser.add_argument("--calib-steps", type=int, default=31, help="Calibration scan points")
+    parser.add_argument("--detunings", type=int, default=21, help="set_target_detuning calls")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Factor on the simulated latencies")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the simulated noise and jitter")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Results file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Default relative tolerance (per-metric values in the baseline win)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show the driver output")
+    args = parser.parse_args(argv)
+
+    metrics = run_benchmark(args)
+    result = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {k: v for k, v in vars(args).items()
+                         if k not in ("output", "baseline", "update_baseline", "verbose")},
+        },
+        "metrics": metrics,
+    }
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    overlap = check_overlap(metrics)
+    print(f"Step period {metrics['run_experiment_step_s'] * 1e3:.1f} ms, "
+          f"stages back to back {metrics['stage_sum_p50_s'] * 1e3:.1f} ms")
+    if overlap is not None:
+        print(overlap)
+        return 1
+
+    if args.update_baseline:
+        tolerances = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                tolerances = json.load(f).get("tolerances", {})
+        with open(args.baseline, "w") as f:
+            json.dump({**result, "tolerances": tolerances}, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        for metric, value in sorted(metrics.items()):
+            print(f"{metric:<40} {value:.6g}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("meta", {}).get("settings") != result["meta"]["settings"]:
+        print("Warning: baseline was recorded with different settings, comparison may not be meaningful.")
+    rows = compare(metrics, baseline, args.tolerance)
+    print_comparison(rows)
+    regressions = [row[0] for row in rows if row[4] == "REGRESSION"]
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    print("No regression.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,49 +2,148 @@ from devices.MuquansLaser import MuquansLaser
 from temp.control_synth import SynthHDController as RFGenerator
 from devices.WaveMeter import Wavemeter
 from devices.RPSignalGenerator import RedPitayaSignalGenerator
-# from devices.TektroAFG import TektronixAFG3000C
+from devices.TektroAFG import TektronixAFG3000C
 from devices.RigolSA import RigolSA
+from devices import instrumentation
+from utils.pipeline import AcquisitionPipeline
+from utils.runstore import RunWriter, RunReader
+from utils.settle import sampling
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import time
+import numpy as np
 import matplotlib.pyplot as plt
 
 
+# Driver arguments of the lab instruments
+LAB_DEVICE_CONFIG = {
+    # Responses end on their first line; add "prompt": "# " once the controller shell prompt is confirmed
+    "laser": {"host": "10.0.2.107", "port": 23},
+    "rf_gen": {"port": "COM4"},
+    "wavemeter": {"base_url": "http://localhost:5000"},
+    "sa": {"ip": "192.168.0.158"},
+    "rp": {"ip": "192.168.1.100"},
+    "afg": {"ip": "192.168.0.143"},
+}
+
+# Per-device connection deadlines in seconds (driver timeout + margin)
+DEFAULT_CONNECT_DEADLINES = {
+    "rf_gen": 6.0,
+    "laser": 6.0,
+    "signal_gen": 6.0,
+    "sa": 6.0,
+    "wavemeter": 6.0,
+}
+
+
 class ExperimentController:
     """
     Orchestrates the experiment by controlling the laser, RF generator, wavemeter,
     signal generator (Red Pitaya or Tektronix AFG3000C), and spectrum analyzer (Rigol SA).
     """
 
-    def __init__(self, signal_generator="AFG"):
+    def __init__(self, signal_generator="AFG", backend="lab", sim_options=None):
         """
         Initialize all devices with their respective connections.
 
         Args:
             signal_generator (str): Choose between "RP" (Red Pitaya) or "AFG" (Tektronix AFG3000C).
+            backend (str): "lab" for the real instruments, "sim" to start simulated
+                instruments on localhost (see devices.sim) and connect the drivers to them,
+                "sim-process" to run the simulated instruments in a child process.
+            sim_options (dict): Keyword arguments of devices.sim.SimLab (e.g. latency_scale, seed).
         """
         print("Initializing experiment setup...")
 
-        self.laser = MuquansLaser(host="10.0.2.107", port=23)
-        self.rf_gen = RFGenerator(port="COM4")
-        self.wavemeter = Wavemeter(base_url="http://localhost:5000")
-        self.sa = RigolSA(ip="192.168.0.158")
+        if backend == "lab":
+            self.sim = None
+            config = LAB_DEVICE_CONFIG
+        elif backend in ("sim", "sim-process"):
+            from devices.sim import SimLab, SimLabProcess
+            lab_type = SimLab if backend == "sim" else SimLabProcess
+            self.sim = lab_type(**(sim_options or {})).start()
+            config = self.sim.device_config()
+            print("Using simulated instruments.")
+        else:
+            raise ValueError("Invalid backend! Use 'lab', 'sim' or 'sim-process'.")
+
+        self.laser = MuquansLaser(**config["laser"])
+        self.rf_gen = RFGenerator(**config["rf_gen"], auto_connect=False)
+        self.wavemeter = Wavemeter(**config["wavemeter"])
+        self.sa = RigolSA(**config["sa"])
 
         # Signal Generator Selection
         if signal_generator.upper() == "RP":
-            self.signal_gen = RedPitayaSignalGenerator(ip="192.168.1.100")
+            self.signal_gen = RedPitayaSignalGenerator(**config["rp"])
             print("Using Red Pitaya as signal generator.")
         elif signal_generator.upper() == "AFG":
-            self.signal_gen = TektronixAFG3000C(ip="192.168.0.143")
+            self.signal_gen = TektronixAFG3000C(**config["afg"])
             print("Using Tektronix AFG3000C as signal generator.")
         else:
             raise ValueError("Invalid signal generator selection! Use 'RP' or 'AFG'.")
-        
-    def connect_all(self):
-        """Connect to all devices."""
+
+        self.connection_report = {}
+        self.experiment_params = {}
+        self.acquisition = "SA"  # Instrument recording each sweep, chosen in set_experiment
+        self.stats_dump = None
+
+    def connect_all(self, deadlines=None):
+        """
+        Connect to all devices concurrently.
+
+        Each handshake runs in its own thread, so the cold start costs the slowest
+        device instead of the sum of all of them. A device that has not answered
+        within its deadline is reported as timed out and the others are not held back.
+
+        Args:
+            deadlines (dict): Per-device deadline in seconds, keyed by "rf_gen", "laser",
+                "signal_gen", "sa" and "wavemeter". Missing keys use DEFAULT_CONNECT_DEADLINES.
+
+        Returns:
+            dict: Report keyed by device name. Each entry holds "connected" (bool),
+                "elapsed" (s) and "error" (str or None).
+        """
         print("\nConnecting to devices...")
-        self.laser.connect()
-        self.signal_gen.connect()
-        self.sa.connect()
-        print("All devices connected.")
+        deadlines = {**DEFAULT_CONNECT_DEADLINES, **(deadlines or {})}
+        handshakes = {
+            "rf_gen": self.rf_gen.connect,
+            "laser": self.laser.connect,
+            "signal_gen": self.signal_gen.connect,
+            "sa": self.sa.connect,
+            "wavemeter": self.wavemeter.check_connection,
+        }
+
+        def timed(handshake):
+            t0 = time.perf_counter()
+            connected = handshake()
+            return bool(connected), time.perf_counter() - t0
+
+        executor = ThreadPoolExecutor(max_workers=len(handshakes), thread_name_prefix="connect")
+        start = time.perf_counter()
+        futures = {name: executor.submit(timed, handshake) for name, handshake in handshakes.items()}
+
+        report = {}
+        for name, future in futures.items():
+            remaining = max(0.0, start + deadlines[name] - time.perf_counter())
+            try:
+                connected, elapsed = future.result(timeout=remaining)
+                error = None if connected else "connection failed"
+            except FutureTimeoutError:
+                connected, elapsed = False, deadlines[name]
+                error = f"no answer within {deadlines[name]} s"
+            except Exception as e:
+                connected, elapsed = False, time.perf_counter() - start
+                error = str(e)
+            report[name] = {"connected": connected, "elapsed": elapsed, "error": error}
+
+        # Do not wait for handshakes that overran their deadline
+        executor.shutdown(wait=False)
+        self.connection_report = report
+
+        for name, entry in report.items():
+            status = "OK" if entry["connected"] else f"FAILED ({entry['error']})"
+            print(f"  {name:<10} {entry['elapsed']:6.2f} s  {status}")
+        print(f"Connect phase finished in {time.perf_counter() - start:.2f} s.")
+        return report
 
     def set_experiment(
         self,
@@ -64,6 +163,8 @@ class ExperimentController:
         rbw=1e3,
         vbw=1e3,
         sa_sweep_time=1,
+        frequency_plan=None,
+        acquisition="SA",
     ):
         """
         Configures the experiment with fully customizable parameters.
@@ -82,7 +183,14 @@ class ExperimentController:
             rbw (float): Spectrum Analyzer - Resolution Bandwidth (Hz).
             vbw (float): Spectrum Analyzer - Video Bandwidth (Hz).
             sa_sweep_time (float): Spectrum Analyzer - Sweep Time (s).
+            frequency_plan (FrequencyPlan): RF Generator - Points of a tabular sweep, used
+                instead of the linear f_low/f_high/f_step sweep (temp/control_synth.py).
+            acquisition (str): "SA" to record each sweep with the spectrum analyzer in
+                zero span, "RP" to capture it on the Red Pitaya fast inputs in one
+                hardware-triggered buffer (needs the Red Pitaya as signal generator).
         """
+        # Keep every parameter of the run for the result metadata
+        self.experiment_params = {name: value for name, value in locals().items() if name != "self"}
         print("\nConfiguring experiment parameters...")
 
         # Configure laser
@@ -90,16 +198,24 @@ class ExperimentController:
         self.laser.set_power(edfa_power)
 
         # Configure RF generator (Differential Sweep)
-        self.rf_gen.configure_differential_sweep(
-            f_low=f_low,
-            f_high=f_high,
-            f_step=f_step,
-            diff_freq=diff_freq,
-            step_time=step_time,
-            trigger_mode="full_sweep",
-        )
-        sweep_duration = (f_high - f_low) / f_step * step_time
-        print(f"RF Generator: Sweep from {f_low/1e6} MHz to {f_high/1e6} MHz")
+        if frequency_plan is None:
+            self.rf_gen.configure_differential_sweep(
+                f_low=f_low,
+                f_high=f_high,
+                f_step=f_step,
+                diff_freq=diff_freq,
+                step_time=step_time,
+                trigger_mode="full_sweep",
+            )
+            sweep_duration = (f_high - f_low) / f_step * step_time
+            print(f"RF Generator: Sweep from {f_low/1e6} MHz to {f_high/1e6} MHz")
+        else:
+            self.rf_gen.configure_table_sweep(frequency_plan, diff_freq=diff_freq, step_time=step_time)
+            sweep_duration = frequency_plan.duration(step_time)
+            self.experiment_params["frequency_plan"] = frequency_plan.frequencies.tolist()
+            print(f"RF Generator: Table sweep of {len(frequency_plan)} points "
+                  f"from {frequency_plan.frequencies[0]/1e6} MHz to {frequency_plan.frequencies[-1]/1e6} MHz")
+        self.experiment_params["sweep_duration"] = sweep_duration
         print(f"RF Generator: Sweep Duration = {sweep_duration} s")
 
         # Configure Red Pitaya or AFG (same API) for pulses and DC output
@@ -111,51 +227,244 @@ class ExperimentController:
         )
         self.signal_gen.set_dc_voltage(dc_voltage)
 
-        # Configure Spectrum Analyzer (Rigol)
-        self.sa.set_center_frequency(sa_center_freq)
-        self.sa.set_rbw_vbw(rbw_hz=rbw, vbw_hz=vbw)
-        self.sa.enable_zero_span_mode()
-        # self.sa.set_sweep_time(sa_sweep_time)
-        self.sa.set_trigger(mode="EXT", edge="POS")
+        if acquisition.upper() == "RP":
+            # Configure Red Pitaya fast inputs: one buffer per sweep, started by the trigger pulse
+            if not isinstance(self.signal_gen, RedPitayaSignalGenerator):
+                raise ValueError("RP acquisition needs the Red Pitaya as signal generator.")
+            if frequency_plan is None:
+                step_frequencies = f_low + f_step * np.arange(int(round((f_high - f_low) / f_step)) + 1)
+            else:
+                step_frequencies = frequency_plan.frequencies
+            capture = self.signal_gen.configure_sweep_capture(sweep_duration, step_frequencies, step_time)
+            self.experiment_params["capture_decimation"] = capture["decimation"]
+            self.experiment_params["capture_sample_rate"] = capture["sample_rate"]
+        elif acquisition.upper() == "SA":
+            # Configure Spectrum Analyzer (Rigol)
+            self.sa.set_center_frequency(sa_center_freq)
+            self.sa.set_rbw_vbw(rbw_hz=rbw, vbw_hz=vbw)
+            self.sa.enable_zero_span_mode()
+            # self.sa.set_sweep_time(sa_sweep_time)
+            self.sa.set_trigger(mode="EXT", edge="POS")
+        else:
+            raise ValueError("Invalid acquisition! Use 'SA' or 'RP'.")
+        self.acquisition = acquisition.upper()
 
         print("\nExperiment setup completed.")
 
-    def run_experiment(self, num_steps=5, delay=1):
+    def run_experiment(self, num_steps=5, delay=1, pipeline_depth=1, output_dir=None):
         """
         Runs the experiment by iterating through different control points,
         collecting wavemeter and spectrum analyzer data.
+
+        The steps are pipelined: once the control voltage has settled, the wavemeter
+        reading and the sweep run concurrently on their own instruments. The next
+        voltage is applied as soon as the sweep of the previous point has ended, so
+        the trace transfer and the wavemeter reading of a point overlap with the
+        voltage change and settling of the next one, and the step period is set by
+        settle + sweep rather than by the sum of all the stages.
+
+        If the wavemeter is sampling in the background (wavemeter.start_sampling()),
+        the laser frequency is the mean of the readings of the second half of the
+        settling time (None if it holds no valid reading), with no HTTP request on
+        the critical path. Otherwise it is one
+        HTTP read, which must complete before the next voltage is applied.
+
+        With the Red Pitaya acquisition, the capture shares the connection of the
+        control voltage, so its transfer cannot overlap with the next voltage.
+
+        Args:
+            num_steps (int): Number of voltage steps (ramp from 0 V to 1.8 V).
+            delay (float): Settling time (s) after each voltage change.
+            pipeline_depth (int): Number of earlier steps that may still be in flight.
+            output_dir (str): If given, every step is streamed to this run directory as
+                soon as it completes (see utils.runstore) instead of being kept in memory.
+
+        Returns:
+            list or RunReader: One dict per step with "step", "voltage", "laser_frequency",
+                "spectrum" and the per-stage "timings" (start, duration) in seconds.
+                With output_dir, a memory-mapped RunReader over the stored run.
         """
         print("\nStarting experiment loop...")
-        results = []
 
-        for step in range(num_steps):
+        def set_voltage(step, values):
             print(f"\n--- Step {step+1}/{num_steps} ---")
-
             # Adjust frequency control voltage dynamically
-            voltage = (step / (num_steps - 1)) * 1.8  # Ramp from 0V to 1.8V
+            voltage = (step / (num_steps - 1)) * 1.8 if num_steps > 1 else 0.0  # Ramp from 0V to 1.8V
             self.signal_gen.set_dc_voltage(voltage)
+            return voltage
+
+        def settle(step, values):
+            time.sleep(delay)
+            return time.time()
 
-            # Read laser frequency from Wavemeter
-            laser_freq = self.wavemeter.get_frequency(channel=0)
+        def read_wavemeter(step, values):
+            # Window pinned to the end of settling, the voltage may have moved on since
+            return self.wavemeter.read_frequency(channel=0, window=delay / 2, now=values["settle"])
 
-            # Trigger single sweep on the SA and fetch data
-            self.sa.start_sweep(continuous=False)
-            trace_data = self.sa.fetch_trace()
+        if self.acquisition == "RP":
+            # The Red Pitaya records the sweep, on the same connection as the voltage
+            acquisition_lane = "signal_gen"
 
-            # Store results
+            def start_sweep(step, values):
+                self.signal_gen.arm_capture()
+
+            def wait_sweep(step, values):
+                self.signal_gen.wait_capture()
+
+            def fetch_trace(step, values):
+                return self.signal_gen.read_capture()[1]
+        else:
+            acquisition_lane = "sa"
+
+            def start_sweep(step, values):
+                self.sa.arm()
+
+            def wait_sweep(step, values):
+                # Operation Complete: the trace is held until the next arm()
+                self.sa.wait_sweep()
+
+            def fetch_trace(step, values):
+                return self.sa.fetch_trace(binary=True)
+
+        # Without background sampling the wavemeter reads the laser live
+        sampler = self.wavemeter.sampler
+        voltage_after = [("sweep_done", -1)]
+        if sampler is None or sampler.channel != 0 or not sampler.running:
+            voltage_after.append(("wavemeter", -1))
+
+        pipeline = AcquisitionPipeline(depth=pipeline_depth)
+        pipeline.add_stage("voltage", set_voltage, lane="signal_gen", after=voltage_after)
+        pipeline.add_stage("settle", settle, after=["voltage"])
+        pipeline.add_stage("wavemeter", read_wavemeter, after=["settle"])
+        pipeline.add_stage("sweep", start_sweep, lane=acquisition_lane, after=["settle"])
+        pipeline.add_stage("sweep_done", wait_sweep, lane=acquisition_lane, after=["sweep"])
+        # Same lane as the next arm(), which is submitted after it and cannot overwrite the trace
+        pipeline.add_stage("fetch", fetch_trace, lane=acquisition_lane, after=["sweep_done"])
+
+        if output_dir is not None:
+            metadata = {**self.experiment_params, "num_steps": num_steps, "delay": delay}
+            with RunWriter(output_dir, metadata=metadata) as writer:
+                def store_step(step, values, timings):
+                    writer.append(step, values["voltage"], values["wavemeter"], values["fetch"])
+
+                pipeline.run(num_steps, on_step=store_step, keep_results=False)
+            print(f"\nExperiment completed. Results stored in {output_dir}")
+            return RunReader(output_dir)
+
+        results = []
+        for step, values in enumerate(pipeline.run(num_steps)):
             results.append({
                 "step": step,
-                "voltage": voltage,
-                "laser_frequency": laser_freq,
-                "spectrum": trace_data
+                "voltage": values["voltage"],
+                "laser_frequency": values["wavemeter"],
+                "spectrum": values["fetch"],
+                "timings": values["timings"],
             })
 
-            # Wait before next step
-            time.sleep(delay)
-
         print("\nExperiment completed.")
         return results
 
+    def run_hardware_scan(self, voltages, dwell_time, settle_fraction=0.5, ramp=False, capture=False,
+                          sample_rate=50.0):
+        """
+        Scans the control voltage at hardware speed.
+
+        The whole staircase is uploaded once as an arbitrary waveform burst of the
+        signal generator and started by a single trigger, so the steps follow the
+        generator clock with no command in between. The wavemeter is sampled in the
+        background during the scan and each step gets the readings of the last
+        (1 - settle_fraction) of its dwell time.
+
+        With capture=True (Red Pitaya only), the fast inputs record the whole scan in
+        one buffer triggered by the generator start (AWG_PE) and each step also gets
+        its slice of the buffer. This replaces the sweep capture configured by
+        set_experiment(), call it again before run_experiment().
+
+        Args:
+            voltages (array): Control voltage of each step in V, in scan order.
+            dwell_time (float): Time spent on each step in seconds.
+            settle_fraction (float): Part of each step left for the laser to settle.
+            ramp (bool): Go linearly from each voltage to the next instead of stepping.
+            capture (bool): Record the scan on the Red Pitaya fast inputs.
+            sample_rate (float): Wavemeter sampling rate in Hz.
+
+        Returns:
+            list: One dict per step with "step", "voltage", "laser_frequency" (mean
+                in GHz, None without valid reading), "laser_std", "samples" (valid
+                wavemeter readings), "window" (start, end) in seconds from the scan
+                start and "spectrum" (capture slice in V, None without capture).
+        """
+        if not hasattr(self.signal_gen, "load_voltage_staircase"):
+            raise ValueError("The signal generator cannot play a voltage staircase.")
+        if capture and not isinstance(self.signal_gen, RedPitayaSignalGenerator):
+            raise ValueError("Scan capture needs the Red Pitaya as signal generator.")
+        print("\nStarting hardware-timed scan...")
+        scan = self.signal_gen.load_voltage_staircase(voltages, dwell_time, ramp=ramp)
+        voltages, duration = scan["voltages"], scan["duration"]
+        if capture:
+            # The capture axis holds the voltage of each step
+            capture = self.signal_gen.configure_sweep_capture(duration, voltages, dwell_time, trigger="AWG_PE")
+            self.signal_gen.arm_capture()
+
+        with sampling(self.wavemeter, channel=0, rate=sample_rate) as sampler:
+            self.signal_gen.start_staircase()
+            start = time.time()
+            time.sleep(duration)
+            # The readings of the last step must be in before the windows are cut
+            sampler.wait_for_sample(start + duration, timeout=max(1.0, 2.0 / sample_rate))
+            steps = []
+            for step, voltage in enumerate(voltages):
+                window = ((step + settle_fraction) * dwell_time, (step + 1) * dwell_time)
+                stats = sampler.window_stats(window[1] - window[0], now=start + window[1])
+                steps.append({
+                    "step": step,
+                    "voltage": float(voltage),
+                    "laser_frequency": stats["mean"] if stats["count"] else None,
+                    "laser_std": stats["std"],
+                    "samples": stats["count"],
+                    "window": window,
+                    "spectrum": None,
+                })
+
+        if capture:
+            _, data = self.signal_gen.fetch_capture()
+            times = capture["time"]
+            for entry in steps:
+                inside = (times >= entry["window"][0]) & (times < entry["window"][1])
+                entry["spectrum"] = data[..., inside]
+
+        # Leave the generator on a plain DC output at the last voltage
+        self.signal_gen.set_dc_voltage(float(voltages[-1]))
+        print(f"\nHardware-timed scan completed: {len(steps)} steps in {duration:.3f} s.")
+        return steps
+
+    def stats(self, reset=False):
+        """
+        I/O statistics of all drivers: per device and command, call count, bytes
+        moved and duration percentiles (see devices.instrumentation).
+
+        Args:
+            reset (bool): Clear the statistics after reading them.
+
+        Returns:
+            dict: {device: {"count", "total_s", "bytes_sent", "bytes_received", "commands"}}
+        """
+        stats = instrumentation.snapshot()
+        if reset:
+            instrumentation.reset()
+        return stats
+
+    def start_stats_dump(self, interval=60.0, path=None):
+        """
+        Dumps the I/O statistics periodically from a background thread until shutdown().
+
+        Args:
+            interval (float): Seconds between dumps.
+            path (str): JSON lines file to append to. None prints a table.
+        """
+        if self.stats_dump is None:
+            self.stats_dump = instrumentation.PeriodicDump(interval, path=path).start()
+
     def shutdown(self):
         """Gracefully shut down all devices."""
         print("\nShutting down experiment...")
@@ -167,6 +476,12 @@ class ExperimentController:
 
         self.laser.disconnect()
         self.signal_gen.disconnect()
+        self.wavemeter.close()
+        if self.sim is not None:
+            self.sim.stop()
+        if self.stats_dump is not None:
+            self.stats_dump.stop()
+            self.stats_dump = None
 
         print("All devices shut down.")
 
@@ -1,5 +1,7 @@
-import telnetlib
 import time
+from devices import instrumentation
+from devices.state_cache import StateCache
+from devices.telnet_transport import TelnetTransport
 
 # Available commands:
 # sml780_tool Enable_Current_Laser_Diode on
@@ -13,8 +15,10 @@ import time
 # seed_on() - Turns ON the seed laser via Telnet.
 # seed_off() - Turns OFF the seed laser via Telnet.
 # set_power(power: float) - Sets the EDFA power level via Telnet.
+# ramp_power(power: float, step: float) - Ramps the EDFA power in steps, queued in one go.
 # shutdown_edfa() - Shuts down the EDFA via Telnet.
 # shutdown() - Turns OFF the EDFA and seed laser.
+# invalidate_state() - Forgets the cached seed/EDFA settings so the next commands are always sent.
 
 
 class MuquansLaser:
@@ -26,7 +30,8 @@ class MuquansLaser:
       - Shutting down the EDFA
     """
 
-    def __init__(self, host: str = '10.0.2.107', port: int = 23, timeout: int = 5):
+    def __init__(self, host: str = '10.0.2.107', port: int = 23, timeout: int = 5, prompt: str = None,
+                 response_timeout: float = 2):
         """
         Initializes the Laser object.
 
@@ -34,23 +39,37 @@ class MuquansLaser:
             host (str): IP address of the laser controller. 
             port (int): Telnet port (default: 23).
             timeout (int): Connection timeout in seconds.
+            prompt (str): Controller shell prompt (e.g. "# "). A response is complete when
+                the prompt arrives; if None, on the first response line.
+            response_timeout (float): Time to wait for a command response in seconds.
         """
         self.host = host
         self.port = port
         self.timeout = timeout
-        self.tn = None  # Telnet connection object
+        self.prompt = prompt
+        self.response_timeout = response_timeout
+        self.tn = None  # Telnet transport (devices/telnet_transport.py)
         self.laser_on = False
         self.current_power = 0.0
+        self.state = StateCache()  # Settings acknowledged by the controller
 
     def connect(self):
         """
         Establish a Telnet connection to the laser.
+
+        Returns:
+            bool: True if the connection was established.
         """
         try:
-            self.tn = telnetlib.Telnet(self.host, self.port, self.timeout)
+            transport = TelnetTransport(self.host, self.port, timeout=self.timeout, prompt=self.prompt)
+            transport.connect()
+            self.tn = transport
+            self.state.invalidate()
             print(f"Connected to Laser at {self.host}:{self.port}")
+            return True
         except Exception as e:
             print(f"Failed to connect to Laser: {e}")
+            return False
 
     def disconnect(self):
         """
@@ -59,15 +78,26 @@ class MuquansLaser:
         if self.tn:
             self.tn.close()
             self.tn = None
+            self.state.invalidate()
             print("Laser connection closed.")
 
+    def invalidate_state(self):
+        """
+        Forgets the cached seed/EDFA settings so the next commands are always sent.
+        """
+        self.state.invalidate()
+
     def seed_on(self):
         """
         Turns ON the seed laser via Telnet.
         """
+        if self.state.matches("seed", "on"):
+            print("Seed laser already enabled.")
+            return
         command = "sml780_tool Enable_Current_Laser_Diode on"
         response = self._send_command(command)
         if response:
+            self.state.update("seed", "on")
             self.laser_on = True
             print(f"Seed laser enabled. Response: {response}")
 
@@ -75,9 +105,13 @@ class MuquansLaser:
         """
         Turns OFF the seed laser via Telnet.
         """
+        if self.state.matches("seed", "off"):
+            print("Seed laser already disabled.")
+            return
         command = "sml780_tool Enable_Current_Laser_Diode off"
         response = self._send_command(command)
         if response:
+            self.state.update("seed", "off")
             self.laser_on = False
             print(f"Seed laser disabled. Response: {response}")
 
@@ -92,18 +126,52 @@ class MuquansLaser:
         if not (0.0 <= power <= 2.5):
             raise ValueError("Power must be between 0 and 2.5")
 
+        if self.state.matches("edfa_set", power):
+            print(f"EDFA power already set to {power}.")
+            return
         command = f"sml780_tool edfa_set {power}"
         response = self._send_command(command)
         if response:
+            self.state.update("edfa_set", power)
             self.current_power = power
             print(f"EDFA power set to {power}. Response: {response}")
 
+    def ramp_power(self, power: float, step: float = 0.25):
+        """
+        Ramps the EDFA power from the current setpoint to power. All the steps are
+        queued at once and run at the controller's pace.
+
+        Args:
+            power (float): Final power setpoint (0 to 2.5).
+            step (float): Largest power change per command.
+        """
+        if not (0.0 <= power <= 2.5):
+            raise ValueError("Power must be between 0 and 2.5")
+        if step <= 0:
+            raise ValueError("Step must be positive")
+        if self.state.matches("edfa_set", power):
+            print(f"EDFA power already set to {power}.")
+            return
+        start = self.current_power
+        num_steps = max(1, int(-(-abs(power - start) // step)))
+        setpoints = [round(start + (power - start) * (i + 1) / num_steps, 4) for i in range(num_steps)]
+        responses = self._send_commands([f"sml780_tool edfa_set {p}" for p in setpoints])
+        self.state.invalidate("edfa_set")
+        for setpoint, response in zip(setpoints, responses):
+            if not response:
+                print(f"EDFA ramp stopped at {self.current_power}.")
+                return
+            self.current_power = setpoint
+        self.state.update("edfa_set", power)
+        print(f"EDFA power ramped to {power} in {num_steps} steps.")
+
     def shutdown_edfa(self):
         """
         Shuts down the EDFA via Telnet.
         """
         command = "sml780_tool edfa_shutdown"
         response = self._send_command(command)
+        self.state.invalidate("edfa_set")
         if response:
             self.current_power = 0.0
             print(f"EDFA shutdown. Response: {response}")
@@ -114,8 +182,7 @@ class MuquansLaser:
         2. Turns OFF the seed laser
         """
         print("Shutting down the laser system...")
-        self.shutdown_edfa()  # Turn off the EDFA
-        time.sleep(1) 
+        self.shutdown_edfa()  # Turn off the EDFA, acknowledged before the seed goes off
         self.seed_off()  # Turn off the seed laser
         print("Laser system shutdown complete.")
 
@@ -129,15 +196,37 @@ class MuquansLaser:
         Returns:
             str: Response from the laser (if any).
         """
+        return self._send_commands([command])[0]
+
+    def _send_commands(self, commands):
+        """
+        Queues several commands via Telnet and reads their responses in order.
+
+        Args:
+            commands (list): Commands to send.
+
+        Returns:
+            list: Response of each command, None from the first failed one on.
+        """
         if self.tn is None:
             print("Error: Not connected to laser.")
-            return None
-
-        try:
-            self.tn.write(command.encode('ascii') + b"\n")
-            time.sleep(0.1)  # Allow processing time
-            response = self.tn.read_until(b"\n", timeout=2).decode('ascii').strip()
-            return response
-        except Exception as e:
-            print(f"Error sending command '{command}': {e}")
-            return None
+            return [None] * len(commands)
+
+        start = time.perf_counter_ns()
+        futures = [self.tn.submit(command, self.response_timeout) for command in commands]
+        responses = []
+        for command, future in zip(commands, futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                instrumentation.record("laser", "query", " ".join(command.split()[:2]), start, error=True)
+                print(f"Error sending command '{command}': {e!r}")
+                for pending in futures:
+                    pending.cancel()
+                return responses + [None] * (len(commands) - len(responses))
+            # Command name without its value, e.g. "sml780_tool edfa_set"
+            instrumentation.record("laser", "query", " ".join(command.split()[:2]), start,
+                                   sent=len(command) + 1, received=len(response) + 1)
+            start = time.perf_counter_ns()
+            responses.append(response)
+        return responses
@@ -1,4 +1,4 @@
-from windfreak import SynthHD
+from temp.synth_hd import SynthHD
 
 
 # Methods:
@@ -10,6 +10,7 @@ from windfreak import SynthHD
 # enable_sweep(enable: bool) - Enables or disables the continuous frequency sweep.
 # set_trigger_mode(mode: str) - Sets the trigger mode for the RF generator.
 # read_parameter(channel: int, param: str) - Reads a parameter from the RF generator safely.
+# invalidate_state() - Forgets the cached settings so the next writes are always sent.
 # shutdown() - Disables the RF generator and closes the connection.
 
 
@@ -188,6 +189,14 @@ class RFGenerator:
             print(f"Error reading {param}: {str(e)}")
             return None
 
+    def invalidate_state(self):
+        """
+        Forgets the cached settings (unchanged settings are not resent to the SynthHD),
+        e.g. after the generator was changed from the Windfreak GUI.
+        """
+        if self.synth:
+            self.synth.invalidate_state()
+
     def shutdown(self):
         """
         Shutdown the RF generator and closes the connection.
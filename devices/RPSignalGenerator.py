@@ -1,5 +1,10 @@
 import devices.vendor.redpitaya_scpi as scpi
+from devices.state_cache import StateCache
+from devices.waveforms import staircase_waveform
+import threading
 import time
+from contextlib import contextmanager
+import numpy as np
 import matplotlib.pyplot as plt
 # Methods:
 # connect() - Establishes a connection to the Red Pitaya.
@@ -9,10 +14,75 @@ import matplotlib.pyplot as plt
 # Channel 2: 
 # set_dc_voltage(voltage: float) - Sets a DC voltage on Channel 2 for frequency control.
 # set_triangle_ramp(high_voltage: float, low_voltage: float, frequency: float) - Configures a triangle (ramp) waveform on Channel 2.
+# load_voltage_staircase(voltages, dwell_time) - Uploads a whole voltage scan as an arbitrary waveform burst on Channel 2.
+# start_staircase() - Triggers the uploaded staircase.
 
+# Fast inputs:
+# configure_sweep_capture(sweep_duration, step_frequencies, step_time) - Sets up a hardware-triggered capture of a whole RF sweep.
+# arm_capture() - Starts the acquisition and waits for the trigger.
+# wait_capture(timeout) - Waits for the trigger and for the buffer to fill.
+# read_capture() - Reads the completed capture as (RF frequency axis, data).
+# fetch_capture(timeout) - wait_capture() followed by read_capture().
+# capture_sweep(timeout) - arm_capture() followed by fetch_capture().
+# start_streaming(...) - Acquires triggered frames continuously in the background (see RedPitayaStream).
+# stop_streaming() - Stops the background acquisition.
+
+# batch(check_errors: bool = True) - Context manager sending the enclosed commands as one write.
+# check_errors() - Drains the SCPI error queue.
+# invalidate_state() - Forgets the cached settings so the next setters resend them.
 # disable_outputs() - Turns off both signal generator outputs.
 # disconnect() - Closes the connection to Red Pitaya.
 
+SAMPLE_RATE = 125e6  # Fast input sample rate (STEMlab 125-14), in S/s
+BUFFER_SIZE = 16384  # Samples per acquisition buffer
+MAX_DECIMATION = 65536
+AWG_POINTS = 16384  # Samples of the arbitrary waveform buffer
+
+
+def capture_decimation(duration: float, buffer_size: int = BUFFER_SIZE, sample_rate: float = SAMPLE_RATE) -> int:
+    """
+    Smallest decimation (power of 2) whose buffer covers duration.
+
+    Args:
+        duration (float): Time to capture in seconds.
+        buffer_size (int): Samples per buffer.
+        sample_rate (float): Undecimated sample rate in S/s.
+
+    Returns:
+        int: Decimation factor.
+
+    Raises:
+        ValueError: If duration is longer than a buffer at the highest decimation.
+    """
+    decimation = 1
+    while buffer_size * decimation / sample_rate < duration:
+        decimation *= 2
+        if decimation > MAX_DECIMATION:
+            raise ValueError(f"A {duration:.3f} s sweep does not fit in one buffer "
+                             f"(at most {buffer_size * MAX_DECIMATION / sample_rate:.3f} s).")
+    return decimation
+
+
+def sweep_frequency_axis(times, step_frequencies, step_time: float):
+    """
+    RF frequency at each sample of a stepped sweep starting at t = 0.
+
+    Args:
+        times (array): Sample times in seconds since the trigger.
+        step_frequencies (array): Frequency of each sweep step in Hz.
+        step_time (float): Time spent per step in seconds.
+
+    Returns:
+        numpy.ndarray: Frequency in Hz, NaN after the last step.
+    """
+    step_frequencies = np.asarray(step_frequencies, dtype=float)
+    index = np.floor(np.asarray(times) / step_time).astype(np.int64)
+    axis = np.full(len(index), np.nan)
+    valid = index < len(step_frequencies)
+    axis[valid] = step_frequencies[index[valid]]
+    return axis
+
+
 class RedPitayaSignalGenerator:
     """
     Driver for the Red Pitaya used as a 2-channel signal generator.
@@ -20,23 +90,137 @@ class RedPitayaSignalGenerator:
     - Channel 2: Fixed DC voltage or Triangle waveform.
     """
 
-    def __init__(self, ip: str = "10.0.2.102"):
+    def __init__(self, ip: str = "10.0.2.102", timeout: float = 5, port: int = 5000):
         """
         Initializes the Red Pitaya Signal Generator.
         
         Args:
             ip (str): IP address of the Red Pitaya.
+            timeout (float): Socket timeout in seconds.
+            port (int): SCPI server port.
         """
         self.ip = ip
+        self.port = port
+        self.timeout = timeout
         self.rp = None
+        self._batch = None  # Commands collected by an open batch()
+        self.state = StateCache()  # Last settings sent, to skip redundant writes
+        self.capture = None  # Sweep capture set up by configure_sweep_capture()
+        self._capture_buffers = {}  # Reused receive buffer of each input
+        self.stream = None  # Running RedPitayaStream, if any
+        self.lock = threading.RLock()  # Held for each exchange, the connection is shared with the stream
 
     def connect(self):
-        """Establishes a connection to the Red Pitaya."""
+        """
+        Establishes a connection to the Red Pitaya.
+
+        Returns:
+            bool: True if the connection was established.
+        """
         try:
-            self.rp = scpi.scpi(self.ip)
-            print(f"Connected to Red Pitaya at {self.ip}")
+            self.rp = scpi.scpi(self.ip, timeout=self.timeout, port=self.port)
+            self.state.invalidate()
+            # The SCPI client only prints socket errors, so probe the link explicitly
+            idn = self.rp.idn_q()
+            print(f"Connected to Red Pitaya at {self.ip} ({idn})")
+            return True
         except Exception as e:
             print(f"Error connecting to Red Pitaya: {e}")
+            self.rp = None
+            return False
+
+    @contextmanager
+    def batch(self, check_errors: bool = True):
+        """
+        Collects the SCPI commands sent inside the block and flushes them as a single
+        ';'-joined write when the block exits, i.e. one TCP round trip instead of one
+        per command. Nested batches join the outermost one. If the block raises, the
+        collected commands are discarded.
+
+        Example:
+            with rp.batch():
+                rp.set_trigger_pulse(1.8, 0, 1e-3, 90)
+                rp.set_dc_voltage(1.5)
+
+        Args:
+            check_errors (bool): Append a single *STB? to the write and drain the error
+                queue if it reports errors, instead of checking after each command.
+        """
+        if self._batch is not None:
+            yield self
+            return
+
+        self._batch = []
+        try:
+            yield self
+            commands = self._batch
+        except BaseException:
+            # Discarded commands were already recorded in the state cache
+            self.state.invalidate()
+            raise
+        finally:
+            self._batch = None
+        if not commands:
+            return
+
+        # A leading ':' resets the header path, so each command stays absolute
+        message = ';'.join(':' + command for command in commands)
+        try:
+            with self.lock:
+                if check_errors:
+                    status = int(self.rp.txrx_txt(message + ';*STB?'))
+                    if status & 0x4 and self.check_errors():
+                        # Some settings were rejected, so the cache no longer matches the instrument
+                        self.state.invalidate()
+                else:
+                    self.rp.tx_txt(message)
+        except BaseException:
+            self.state.invalidate()
+            raise
+
+    def check_errors(self):
+        """
+        Drains the SCPI error queue of the Red Pitaya.
+
+        Returns:
+            list: Error strings reported by the instrument (empty if none).
+        """
+        errors = []
+        while True:
+            with self.lock:
+                err = self.rp.err_n()
+            if err.startswith('0,'):
+                break
+            errors.append(err)
+            print(f"Red Pitaya error: {err}")
+        return errors
+
+    def invalidate_state(self):
+        """Forgets the cached output settings so the next setters resend them."""
+        self.state.invalidate()
+
+    def _send(self, command: str):
+        """Sends a command, or queues it if a batch is open."""
+        if self._batch is not None:
+            self._batch.append(command)
+        else:
+            with self.lock:
+                self.rp.tx_txt(command)
+
+    def _query(self, command: str) -> str:
+        """Sends a query and returns the stripped answer."""
+        with self.lock:
+            return self.rp.txrx_txt(command).strip()
+
+    def _set(self, header: str, value) -> bool:
+        """
+        Sends '<header> <value>' unless the setting already holds this value.
+
+        Returns:
+            bool: True if the command was sent (or queued).
+        """
+        value = str(value)
+        return self.state.apply(header, value, lambda: self._send(f"{header} {value}"))
 
     def set_trigger_pulse(self, high_level: float, low_level: float, period: float, duty_cycle: float):
         """
@@ -53,15 +237,19 @@ class RedPitayaSignalGenerator:
         offset = low_level
         duty_fraction = duty_cycle / 100.0
 
-        # Configure channel 1 for PWM output
-        self.rp.tx_txt('SOUR1:FUNC PWM')
-        self.rp.tx_txt('SOUR1:FREQ:FIX ' + str(frequency))
-        self.rp.tx_txt('SOUR1:VOLT ' + str(amplitude))
-        self.rp.tx_txt('SOUR1:VOLT:OFFS ' + str(offset))
-        self.rp.tx_txt('SOUR1:DCYC ' + str(duty_fraction))
-        self.rp.tx_txt('OUTPUT1:STATE ON')
-        # Trigger the generator immediately:
-        self.rp.tx_txt('SOUR1:TRig:INT')
+        # Configure channel 1 for PWM output, sent as a single write with only the changed settings
+        with self.batch():
+            changed = [
+                self._set('SOUR1:FUNC', 'PWM'),
+                self._set('SOUR1:FREQ:FIX', frequency),
+                self._set('SOUR1:VOLT', amplitude),
+                self._set('SOUR1:VOLT:OFFS', offset),
+                self._set('SOUR1:DCYC', duty_fraction),
+                self._set('OUTPUT1:STATE', 'ON'),
+            ]
+            if any(changed):
+                # Trigger the generator immediately:
+                self._send('SOUR1:TRig:INT')
         print(f"Channel 1 set to PWM: freq={frequency:.3f} Hz, amplitude={amplitude} V, offset={offset} V, duty cycle={duty_cycle}%")
 
     def set_triangle_ramp(self, high_voltage: float, low_voltage: float, frequency: float):
@@ -76,16 +264,24 @@ class RedPitayaSignalGenerator:
         amplitude = high_voltage - low_voltage
         offset = (high_voltage + low_voltage) / 2.0
 
-        # Set Channel 2 function to triangle waveform
-        self.rp.tx_txt('SOUR2:FUNC TRIANGLE')
-        # Set the frequency
-        self.rp.tx_txt('SOUR2:FREQ:FIX ' + str(frequency))
-        # Set amplitude and offset
-        self.rp.tx_txt('SOUR2:VOLT ' + str(amplitude))
-        self.rp.tx_txt('SOUR2:VOLT:OFFS ' + str(offset))
-        # Enable output on Channel 2 and trigger the waveform generation
-        self.rp.tx_txt('OUTPUT2:STATE ON')
-        self.rp.tx_txt('SOUR2:TRig:INT')
+        with self.batch():
+            changed = [
+                # Set Channel 2 function to triangle waveform
+                self._set('SOUR2:FUNC', 'TRIANGLE'),
+                # Set the frequency
+                self._set('SOUR2:FREQ:FIX', frequency),
+                # Set amplitude and offset
+                self._set('SOUR2:VOLT', amplitude),
+                self._set('SOUR2:VOLT:OFFS', offset),
+                # Free running, in case a staircase burst was loaded
+                self._set('SOUR2:BURS:STAT', 'CONTINUOUS'),
+                self._set('SOUR2:TRIG:SOUR', 'INT'),
+                # Enable output on Channel 2
+                self._set('OUTPUT2:STATE', 'ON'),
+            ]
+            if any(changed):
+                # Trigger the waveform generation
+                self._send('SOUR2:TRig:INT')
         print(f"Channel 2 set to TRIANGLE ramp: frequency={frequency:.3f} Hz, amplitude={amplitude} V, offset={offset} V")
    
     def set_dc_voltage(self, voltage: float):
@@ -104,17 +300,75 @@ class RedPitayaSignalGenerator:
             voltage = -5.5
         scaled_voltage = voltage / 5.0
 
-        if scaled_voltage >= 0:
-            self.rp.tx_txt('SOUR2:FUNC DC')
-            self.rp.tx_txt('SOUR2:VOLT ' + str(scaled_voltage))
-        else:
-            self.rp.tx_txt('SOUR2:FUNC DC_NEG')
-            # For DC_NEG, set the magnitude (output becomes negative)
-            self.rp.tx_txt('SOUR2:VOLT ' + str(abs(scaled_voltage)))
-        self.rp.tx_txt('OUTPUT2:STATE ON')
-        self.rp.tx_txt('SOUR2:TRig:INT')
+        # Only the changed settings are sent, usually just the amplitude during a scan
+        with self.batch():
+            if scaled_voltage >= 0:
+                changed = [self._set('SOUR2:FUNC', 'DC'),
+                           self._set('SOUR2:VOLT', scaled_voltage)]
+            else:
+                # For DC_NEG, set the magnitude (output becomes negative)
+                changed = [self._set('SOUR2:FUNC', 'DC_NEG'),
+                           self._set('SOUR2:VOLT', abs(scaled_voltage))]
+            # Free running, in case a staircase burst was loaded
+            changed.append(self._set('SOUR2:BURS:STAT', 'CONTINUOUS'))
+            changed.append(self._set('SOUR2:TRIG:SOUR', 'INT'))
+            changed.append(self._set('OUTPUT2:STATE', 'ON'))
+            if any(changed):
+                self._send('SOUR2:TRig:INT')
         print(f"Channel 2 set to DC voltage (after amplifer): {voltage} V")
 
+    def load_voltage_staircase(self, voltages, dwell_time: float, ramp: bool = False, external: bool = False):
+        """
+        Uploads a whole voltage scan to Channel 2 as one arbitrary waveform burst.
+
+        Each voltage (after the amplifier, clamped to -5..5 V) is held for dwell_time,
+        so the scan runs on the generator clock with no command per step. The
+        waveform is only sent again if it changed. The burst starts on
+        start_staircase(), or on the external trigger edge with external=True; an
+        acquisition armed on the AWG_PE trigger starts with it.
+
+        Args:
+            voltages (array): Voltage of each step in V, in playback order.
+            dwell_time (float): Time spent on each step in seconds.
+            ramp (bool): Go linearly from each voltage to the next instead of stepping.
+            external (bool): Start on the rising edge of the external trigger input.
+
+        Returns:
+            dict: "voltages" (clamped), "dwell_time", "duration" (s) and "points"
+                (waveform length).
+        """
+        voltages = np.clip(np.atleast_1d(np.asarray(voltages, dtype=float)), -5.0, 5.0)
+        if dwell_time <= 0:
+            raise ValueError("Dwell time must be positive.")
+        # Scaled to the -1 to 1 V output range, played at 1 V amplitude
+        data = staircase_waveform(voltages / 5.0, AWG_POINTS, ramp=ramp)
+        duration = len(voltages) * dwell_time
+        trigger = 'EXT_PE' if external else 'INT'
+        key = ('SOUR2:STAIRCASE', trigger)
+        waveform = (data.tobytes(), duration)
+
+        def upload():
+            with self.lock:
+                self.rp.sour_set(2, 'ARBITRARY', volt=1, freq=1.0 / duration, offset=0, data=data,
+                                 burst=True, ncyc=1, nor=1, trig=trigger)
+            # sour_set() wrote these without going through the cache
+            self.state.invalidate('SOUR2:FUNC', 'SOUR2:VOLT', 'SOUR2:FREQ:FIX', 'SOUR2:VOLT:OFFS')
+            self.state.update('SOUR2:BURS:STAT', 'BURST')
+            self.state.update('SOUR2:TRIG:SOUR', trigger)
+
+        if not self.state.matches('SOUR2:BURS:STAT', 'BURST'):
+            # A DC or ramp setting replaced the waveform since the last upload
+            self.state.invalidate(key)
+        self.state.apply(key, waveform, upload)
+        self._set('OUTPUT2:STATE', 'ON')
+        print(f"Channel 2 staircase loaded: {len(voltages)} steps of {dwell_time * 1e3:.3f} ms "
+              f"({duration:.3f} s, {len(data)} points, trigger {trigger})")
+        return {"voltages": voltages, "dwell_time": dwell_time, "duration": duration, "points": len(data)}
+
+    def start_staircase(self):
+        """Starts the staircase loaded by load_voltage_staircase() (software trigger)."""
+        self._send('SOUR2:TRig:INT')
+
     def measure_absorption_saturation(self, duration=5):
         """
         Measures the Absorption Saturée (AS) signal from IN1 while scanning with a triangle wave on OUT2.
@@ -142,17 +396,407 @@ class RedPitayaSignalGenerator:
         plt.show()
 
         return absorption_signal
+
+    def configure_sweep_capture(self, sweep_duration: float, step_frequencies, step_time: float,
+                                channels=(1,), trigger: str = "EXT_PE", gain: str = "LV"):
+        """
+        Sets up the fast inputs to capture a whole RF sweep in one buffer.
+
+        The decimation is the smallest one covering sweep_duration, and the trigger
+        (by default the external trigger input, wired to the pulse that starts the
+        SynthHD sweep) is placed on the first sample, so the buffer starts with the
+        sweep and sample times map directly onto the sweep steps.
+
+        Args:
+            sweep_duration (float): Sweep duration in seconds.
+            step_frequencies (array): RF frequency of each sweep step in Hz.
+            step_time (float): Time spent per step in seconds.
+            channels (tuple): Fast inputs to read (1 and/or 2).
+            trigger (str): Trigger source (e.g. "EXT_PE", "EXT_NE", "CH1_PE").
+            gain (str): Input gain jumper setting, "LV" or "HV".
+
+        Returns:
+            dict: "decimation", "sample_rate" (S/s after decimation), "duration" (s),
+                "time" and "frequency" (axes of the buffer), "channels" and "trigger".
+        """
+        decimation = capture_decimation(sweep_duration)
+        # The trigger sits in the middle of the buffer unless delayed by half a buffer
+        with self.lock:
+            self.rp.acq_set(dec=decimation, trig_delay=BUFFER_SIZE // 2, units="VOLTS", sample_format="BIN",
+                            averaging=True, gain=[gain, gain])
+        times = np.arange(BUFFER_SIZE) * decimation / SAMPLE_RATE
+        self.capture = {
+            "decimation": decimation,
+            "sample_rate": SAMPLE_RATE / decimation,
+            "duration": BUFFER_SIZE * decimation / SAMPLE_RATE,
+            "time": times,
+            "frequency": sweep_frequency_axis(times, step_frequencies, step_time),
+            "channels": tuple(channels),
+            "trigger": trigger,
+        }
+        self._capture_buffers = {channel: bytearray(4 * BUFFER_SIZE) for channel in channels}
+        print(f"Sweep capture: decimation {decimation}, {self.capture['duration']:.3f} s per buffer, "
+              f"trigger {trigger}")
+        return self.capture
+
+    def arm_capture(self):
+        """Starts the acquisition and arms the trigger (one write)."""
+        if self.capture is None:
+            raise RuntimeError("Call configure_sweep_capture() first.")
+        with self.batch(check_errors=False):
+            self._send('ACQ:START')
+            self._send(f"ACQ:TRig {self.capture['trigger']}")
+
+    def wait_capture(self, timeout: float = None, poll_interval: float = 0.01):
+        """
+        Waits for the trigger and for the buffer to fill, without reading it.
+
+        Args:
+            timeout (float): Longest wait for the trigger and the fill, in seconds
+                (default: two buffer durations plus one second).
+            poll_interval (float): Time between status queries in seconds.
+
+        Raises:
+            TimeoutError: If no complete buffer is acquired within timeout.
+        """
+        if self.capture is None:
+            raise RuntimeError("Call configure_sweep_capture() first.")
+        if timeout is None:
+            timeout = 2 * self.capture["duration"] + 1.0
+        pending = self._wait_for_buffer(timeout, poll_interval)
+        if pending is not None:
+            raise TimeoutError(f"Red Pitaya capture not complete after {timeout:.1f} s ({pending}).")
+
+    def read_capture(self):
+        """
+        Reads each input of the completed capture as one binary block (see wait_capture()).
+
+        Returns:
+            tuple: (frequency axis in Hz, data in V). Data is 1-D for one input,
+                one row per input otherwise.
+        """
+        capture = self.capture
+        # Decoded in place from the reused buffers, copied out before the next capture
+        with self.lock:
+            data = np.array([self.rp.acq_data(channel, binary=True, convert=True, units="VOLTS",
+                                              out=self._capture_buffers[channel])
+                             for channel in capture["channels"]], dtype=np.float32)
+        return capture["frequency"], data[0] if len(data) == 1 else data
+
+    def fetch_capture(self, timeout: float = None, poll_interval: float = 0.01):
+        """
+        Waits for the trigger and for the buffer to fill, then reads each input as one
+        binary block: wait_capture() then read_capture().
+
+        Args:
+            timeout (float): Longest wait for the trigger and the fill, in seconds
+                (default: two buffer durations plus one second).
+            poll_interval (float): Time between status queries in seconds.
+
+        Returns:
+            tuple: (frequency axis in Hz, data in V), see read_capture().
+
+        Raises:
+            TimeoutError: If no complete buffer is acquired within timeout.
+        """
+        self.wait_capture(timeout, poll_interval)
+        return self.read_capture()
+
+    def _wait_for_buffer(self, timeout: float, poll_interval: float = 1e-3, stop: threading.Event = None):
+        """
+        Waits for the trigger of the current acquisition, then for its buffer to fill.
+
+        The trigger state is checked first: a buffer left full by the previous
+        acquisition reports FILL 1 until the new trigger fires. The driver lock is
+        only held for each status query, so other users of the connection get in
+        between polls.
+
+        Returns:
+            str or None: None once the buffer is full, otherwise the status query
+                still pending at the timeout (or when stop was set).
+        """
+        deadline = time.perf_counter() + timeout
+        for query, done in (('ACQ:TRig:STAT?', 'TD'), ('ACQ:TRig:FILL?', '1')):
+            while self._query(query) != done:
+                if time.perf_counter() > deadline or (stop is not None and stop.is_set()):
+                    return query
+                if poll_interval:
+                    time.sleep(poll_interval)
+        return None
+
+    def capture_sweep(self, timeout: float = None):
+        """
+        Captures one sweep: arm_capture() then fetch_capture().
+
+        Returns:
+            tuple: (frequency axis in Hz, data in V), see fetch_capture().
+        """
+        self.arm_capture()
+        return self.fetch_capture(timeout)
+
     def disable_outputs(self):
         """Turns off both signal generator outputs."""
         if self.rp:
-            self.rp.tx_txt('OUTPUT1:STATE OFF')
-            self.rp.tx_txt('OUTPUT2:STATE OFF')
+            with self.batch():
+                self._set('OUTPUT1:STATE', 'OFF')
+                self._set('OUTPUT2:STATE', 'OFF')
             print("Both outputs disabled.")
 
+    def start_streaming(self, channels=(1, 2), decimation: int = 1, samples: int = BUFFER_SIZE,
+                        trigger: str = "EXT_PE", trigger_period: float = None, capacity: int = 64,
+                        gain: str = "LV", poll_interval: float = 1e-3):
+        """
+        Starts acquiring triggered frames in the background (see RedPitayaStream).
+
+        Returns:
+            RedPitayaStream: The running stream, also available as self.stream.
+        """
+        self.stop_streaming()
+        self.stream = RedPitayaStream(self, channels=channels, decimation=decimation, samples=samples,
+                                      trigger=trigger, trigger_period=trigger_period, capacity=capacity,
+                                      gain=gain, poll_interval=poll_interval).start()
+        return self.stream
+
+    def stop_streaming(self):
+        """Stops the background acquisition, if any."""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+
     def disconnect(self):
         """Closes the connection to the Red Pitaya."""
+        self.stop_streaming()
         if self.rp:
             self.rp.close()
             self.rp = None
+            self.state.invalidate()
             print("Disconnected from Red Pitaya.")
 
+
+
+class RedPitayaStream:
+    """
+    Continuous triggered acquisition from the fast inputs.
+
+    A worker thread re-arms the trigger, waits for a full buffer and pulls every input
+    as one binary block, decoded into the next slot of a preallocated ring of float32
+    frames. Consumers read the frames through subscriptions, each with its own read
+    position, so a slow consumer loses (and counts) the frames overwritten before it
+    got to them without holding the acquisition back.
+
+    Triggers missed while a frame was being transferred are counted from the trigger
+    period when it is known; arming periods without any trigger are counted as timeouts.
+    """
+
+    def __init__(self, generator: RedPitayaSignalGenerator, channels=(1, 2), decimation: int = 1,
+                 samples: int = BUFFER_SIZE, trigger: str = "EXT_PE", trigger_period: float = None,
+                 capacity: int = 64, gain: str = "LV", trigger_timeout: float = 1.0,
+                 poll_interval: float = 1e-3):
+        """
+        Args:
+            generator (RedPitayaSignalGenerator): Connected driver whose connection is used.
+            channels (tuple): Fast inputs to read (1 and/or 2).
+            decimation (int): Acquisition decimation.
+            samples (int): Samples read per input, starting at the trigger.
+            trigger (str): Trigger source (e.g. "EXT_PE", "CH1_PE").
+            trigger_period (float): Period of the trigger pulse in seconds, to count the
+                triggers missed between frames. None if unknown.
+            capacity (int): Frames kept in the ring; the oldest are overwritten.
+            gain (str): Input gain jumper setting, "LV" or "HV".
+            trigger_timeout (float): Longest wait for one trigger before re-arming (s).
+            poll_interval (float): Time between trigger and fill status queries (s).
+        """
+        if capacity < 1 or not 0 < samples <= BUFFER_SIZE:
+            raise ValueError(f"Capacity must be positive and samples in [1, {BUFFER_SIZE}].")
+        self.generator = generator
+        self.channels = tuple(channels)
+        self.decimation = decimation
+        self.samples = samples
+        self.trigger = trigger
+        self.trigger_period = trigger_period
+        self.gain = gain
+        self.trigger_timeout = trigger_timeout
+        self.poll_interval = poll_interval
+        self.frames = np.zeros((capacity, len(self.channels), samples), dtype=np.float32)
+        self.timestamps = np.zeros(capacity)
+        self.total = 0  # Frames written since start, ring index is total % capacity
+        self.dropped_triggers = 0  # Triggers that fired while no acquisition was armed
+        self.trigger_timeouts = 0  # Arming periods that ended without a trigger
+        self.error = None  # Exception that stopped the worker, if any
+        self._subscriptions = []
+        self._buffers = {channel: bytearray(4 * samples) for channel in self.channels}
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    @property
+    def capacity(self):
+        return len(self.frames)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def overruns(self):
+        """Frames overwritten before a subscriber read them, summed over subscribers."""
+        with self._condition:
+            return sum(subscription.overruns for subscription in self._subscriptions)
+
+    def start(self):
+        """Configures the inputs and starts the worker thread. Returns the stream for chaining."""
+        if self._thread is None:
+            with self.generator.lock:
+                # Trigger on the first sample: half a buffer of delay
+                self.generator.rp.acq_set(dec=self.decimation, trig_delay=BUFFER_SIZE // 2, units="VOLTS",
+                                          sample_format="BIN", averaging=True, gain=[self.gain, self.gain])
+            self._stop.clear()
+            self._started = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name="redpitaya-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the worker thread and the acquisition. The ring stays readable."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            with self._condition:
+                self._condition.notify_all()
+            if self.generator.rp is not None:
+                self.generator._send('ACQ:STOP')
+
+    def subscribe(self, latest: bool = True):
+        """
+        Args:
+            latest (bool): Start with the next frame; False to start with the oldest
+                frame still in the ring.
+
+        Returns:
+            StreamSubscription: Reader of the frames.
+        """
+        with self._condition:
+            subscription = StreamSubscription(self, self.total if latest else max(0, self.total - self.capacity))
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._condition:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def average(self, n_frames: int, timeout: float = None):
+        """
+        Mean of the next n_frames frames.
+
+        Returns:
+            numpy.ndarray: (channels, samples) average, float64.
+        """
+        subscription = self.subscribe()
+        try:
+            total = np.zeros(self.frames.shape[1:])
+            for _ in range(n_frames):
+                frame = subscription.get(timeout)
+                if frame is None:
+                    raise TimeoutError(f"No frame from the Red Pitaya stream within {timeout} s.")
+                total += frame[2]
+            return total / n_frames
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        """
+        Returns:
+            dict: "frames" acquired, "rate" (frames/s), "dropped_triggers",
+                "trigger_timeouts", "overruns" and the worker "error" if it stopped on one.
+        """
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return {
+            "frames": self.total,
+            "rate": self.total / elapsed if elapsed > 0 else 0.0,
+            "dropped_triggers": self.dropped_triggers,
+            "trigger_timeouts": self.trigger_timeouts,
+            "overruns": self.overruns,
+            "error": None if self.error is None else str(self.error),
+        }
+
+    def _run(self):
+        generator = self.generator
+        last_trigger = None
+        try:
+            while not self._stop.is_set():
+                # Not through batch(): that one belongs to the caller's thread
+                with generator.lock:
+                    generator.rp.tx_txt(f"ACQ:START;:ACQ:TRig {self.trigger}")
+                # Same two-phase wait as fetch_capture(), so a stale full buffer is never read
+                if generator._wait_for_buffer(self.trigger_timeout, self.poll_interval, stop=self._stop) is not None:
+                    if self._stop.is_set():
+                        return
+                    self.trigger_timeouts += 1
+                else:
+                    triggered = time.perf_counter()
+                    if self.trigger_period and last_trigger is not None:
+                        self.dropped_triggers += max(0, round((triggered - last_trigger) / self.trigger_period) - 1)
+                    last_trigger = triggered
+                    self._read_frame()
+        except Exception as e:
+            self.error = e
+            print(f"Red Pitaya stream stopped: {e}")
+
+    def _read_frame(self):
+        with self._condition:
+            # The slot about to be overwritten is taken away from subscribers still behind it
+            oldest = self.total - self.capacity + 1
+            for subscription in self._subscriptions:
+                if subscription.position < oldest:
+                    subscription.overruns += oldest - subscription.position
+                    subscription.position = oldest
+        slot = self.total % self.capacity
+        with self.generator.lock:
+            for row, channel in enumerate(self.channels):
+                # Decoded from the reused receive buffer straight into the ring slot
+                self.frames[slot, row] = self.generator.rp.acq_data(
+                    channel, old=True, num_samples=self.samples, binary=True, convert=True, units="VOLTS",
+                    out=self._buffers[channel])
+        with self._condition:
+            self.timestamps[slot] = time.time()
+            self.total += 1
+            self._condition.notify_all()
+
+
+class StreamSubscription:
+    """
+    Read position of one consumer in a RedPitayaStream ring.
+    """
+
+    def __init__(self, stream: RedPitayaStream, position: int):
+        self.stream = stream
+        self.position = position  # Index of the next frame to read
+        self.overruns = 0  # Frames overwritten before they were read
+
+    def get(self, timeout: float = None):
+        """
+        Next frame, waiting for it if needed.
+
+        Returns:
+            tuple or None: (index, timestamp, data) with data a (channels, samples)
+                copy, None on timeout or once the stream has stopped.
+        """
+        stream = self.stream
+        with stream._condition:
+            if not stream._condition.wait_for(lambda: stream.total > self.position or not stream.running,
+                                              timeout):
+                return None
+            if stream.total <= self.position:
+                return None
+            slot = self.position % stream.capacity
+            frame = (self.position, float(stream.timestamps[slot]), stream.frames[slot].copy())
+            self.position += 1
+            return frame
+
+    def pending(self):
+        """Frames available without waiting."""
+        with self.stream._condition:
+            return self.stream.total - self.position
@@ -1,3 +1,7 @@
+import time
+import numpy as np
+from devices import instrumentation
+from devices.state_cache import StateCache
 import pyvisa
 
 
@@ -10,9 +14,21 @@ import pyvisa
 # set_sweep_time(time_sec: float) - Sets the sweep time.
 # set_trigger(mode: str, edge: str = "POS") - Configures the trigger mode.
 # start_sweep(continuous: bool = True) - Starts the sweep.
-# fetch_trace() - Fetches the spectrum data from the SA.
+# arm() - Starts a single sweep whose end is reported by the Operation Complete bit.
+# sweep_done() - Non-blocking check that the armed sweep has ended.
+# wait_sweep(timeout: float = None) - Waits for the armed sweep to end, without fetching its trace.
+# result(timeout: float = None) - Waits for the armed sweep to end and fetches its trace.
+# acquire_single(timeout: float = None) - arm() followed by result().
+# set_trace_format(binary: bool = True) - Selects ASCII or 32-bit binary trace transfers.
+# fetch_trace(binary: bool = False, with_axis: bool = False) - Fetches the spectrum data from the SA.
+# get_trace_axis(n_points: int) - Frequency (or time, in zero span) axis of the current trace.
+# parse_trace(data: str) - Converts an ASCII trace string to a NumPy array.
+# invalidate_state() - Forgets the cached settings so the next setters resend them.
 # disconnect() - Closes the connection to the SA.
 
+ESR_OPERATION_COMPLETE = 0x01
+ESR_ERRORS = 0x3C  # Query, device, execution and command error bits
+
 
 class RigolSA:
     """
@@ -20,26 +36,67 @@ class RigolSA:
     Uses SCPI commands to control center frequency, RBW, VBW, sweep, trigger, and zero span.
     """
 
-    def __init__(self, ip: str):
+    def __init__(self, ip: str, resource: str = None, visa_library: str = "@py"):
         """
         Initializes the Spectrum Analyzer.
 
         Args:
             ip (str): IP address of the Rigol Spectrum Analyzer.
+            resource (str): VISA resource string overriding the one built from ip
+                (e.g. 'TCPIP0::127.0.0.1::5555::SOCKET' for a raw socket).
+            visa_library (str): VISA backend passed to pyvisa.ResourceManager.
         """
         self.ip = ip
-        self.resource = f"TCPIP::{ip}::INSTR"
-        self.rm = pyvisa.ResourceManager("@py")
+        self.resource = resource or f"TCPIP::{ip}::INSTR"
+        self.rm = pyvisa.ResourceManager(visa_library)
         self.sa = None
+        self.state = StateCache()  # Last settings sent, to skip redundant writes
+        self._axis = None  # Cached trace axis, reset whenever span or sweep settings change
+        self._armed = None  # (perf_counter() at arm, sweep time in s) of the pending single sweep
+        self._done = False  # Operation Complete seen for the armed sweep
 
     def connect(self):
-        """Establishes a connection to the Rigol Spectrum Analyzer."""
+        """
+        Establishes a connection to the Rigol Spectrum Analyzer.
+
+        Returns:
+            bool: True if the connection was established.
+        """
         try:
-            self.sa = self.rm.open_resource(self.resource)
+            self.sa = instrumentation.InstrumentedResource(self.rm.open_resource(self.resource), "rigol")
             self.sa.timeout = 5000  # Set timeout to 5 seconds
+            if self.resource.upper().endswith("::SOCKET"):
+                # Raw sockets have no message framing, responses end with a newline
+                self.sa.read_termination = "\n"
+                self.sa.write_termination = "\n"
+            self.state.invalidate()
+            self._axis = None
+            self._armed = None
             print(f"Connected to Rigol SA at {self.ip}")
+            return True
         except Exception as e:
             print(f"Error connecting to SA: {e}")
+            return False
+
+    @property
+    def binary_format(self):
+        """True if the SA is known to transfer traces as REAL,32 blocks."""
+        return self.state.matches(":FORMat:TRACe:DATA", "REAL,32")
+
+    def invalidate_state(self):
+        """Forgets the cached settings, e.g. after using the front panel."""
+        self.state.invalidate()
+        self._axis = None
+
+    def _set(self, header: str, value):
+        """
+        Writes '<header> <value>' unless the setting already holds this value.
+
+        Returns:
+            bool: True if the command was sent.
+        """
+        value = str(value)
+        return self.state.apply(header, value, lambda: self.sa.write(f"{header} {value}"))
 
     def set_center_frequency(self, freq_hz: float):
         """
@@ -49,7 +106,8 @@ class RigolSA:
             freq_hz (float): Center frequency in Hz.
         """
         if self.sa:
-            self.sa.write(f":SENSe:FREQuency:CENTer {freq_hz}")
+            if self._set(":SENSe:FREQuency:CENTer", freq_hz):
+                self._axis = None
             print(f"Center frequency set to {freq_hz / 1e6} MHz")
 
     def set_rbw_vbw(self, rbw_hz: float, vbw_hz: float):
@@ -61,14 +119,15 @@ class RigolSA:
             vbw_hz (float): Video bandwidth in Hz.
         """
         if self.sa:
-            self.sa.write(f":SENSe:BANDwidth:RESolution {rbw_hz}")  # Set RBW
-            self.sa.write(f":SENSe:BANDwidth:VIDeo {vbw_hz}")  # Set VBW
+            self._set(":SENSe:BANDwidth:RESolution", rbw_hz)  # Set RBW
+            self._set(":SENSe:BANDwidth:VIDeo", vbw_hz)  # Set VBW
             print(f"RBW set to {rbw_hz / 1e3} kHz, VBW set to {vbw_hz / 1e3} kHz")
 
     def enable_zero_span_mode(self):
         """Enables zero span mode."""
         if self.sa:
-            self.sa.write(":SENSe:FREQuency:SPAN 0")
+            if self._set(":SENSe:FREQuency:SPAN", 0):
+                self._axis = None
             print("Zero span mode enabled")
 
     def set_sweep_time(self, time_sec: float):
@@ -79,7 +138,8 @@ class RigolSA:
             time_sec (float): Sweep time in seconds.
         """
         if self.sa:
-            self.sa.write(f":SWE:TIME {time_sec}")
+            if self._set(":SWE:TIME", time_sec):
+                self._axis = None
             print(f"Sweep time set to {time_sec} seconds")
 
     def set_trigger(self, mode: str = "EXT", edge: str = "POS"):
@@ -91,9 +151,9 @@ class RigolSA:
             edge (str): Trigger edge ('POS' for positive, 'NEG' for negative).
         """
         if self.sa:
-            self.sa.write(f":TRIGger:SEQuence:SOURce {mode.upper()}")
+            self._set(":TRIGger:SEQuence:SOURce", mode.upper())
             if mode.upper() == "EXT":
-                self.sa.write(f":TRIGger:SEQuence:EXTernal:SLOPe {edge.upper()}")
+                self._set(":TRIGger:SEQuence:EXTernal:SLOPe", edge.upper())
             print(f"Trigger mode set to {mode.upper()}")
 
     def start_sweep(self, continuous: bool = True):
@@ -104,25 +164,229 @@ class RigolSA:
             continuous (bool): If True, sets continuous sweep; otherwise, single sweep.
         """
         if self.sa:
-            self.sa.write(f":INITiate:CONTinuous {'ON' if continuous else 'OFF'}")
+            self._set(":INITiate:CONTinuous", 'ON' if continuous else 'OFF')
             if not continuous:
                 self.sa.write(":INITiate:IMMediate")
             print(f"Sweep {'continuous' if continuous else 'single'} started")
 
-    def fetch_trace(self):
+    def arm(self):
+        """
+        Starts a single sweep without waiting for it.
+
+        The status registers are cleared and *OPC is armed in the same write as
+        :INITiate:IMMediate, so the Operation Complete bit of *ESR? is only set once
+        this sweep has ended (after its trigger, with an external trigger). The sweep
+        time is read back in the same round trip.
+
+        Returns:
+            float: Sweep time in seconds (None if not connected).
+        """
+        if self.sa:
+            self._set(":INITiate:CONTinuous", 'OFF')
+            armed_at = time.perf_counter()
+            sweep_time = float(self.sa.query("*CLS;:INITiate:IMMediate;*OPC;:SENSe:SWEep:TIME?"))
+            self._armed = (armed_at, sweep_time)
+            self._done = False
+            return sweep_time
+
+    def sweep_done(self):
+        """
+        Checks once whether the armed sweep has ended (one *ESR? query).
+
+        Returns:
+            bool: True once the sweep is complete.
+
+        Raises:
+            RuntimeError: If no sweep was armed.
+        """
+        if self._armed is None:
+            raise RuntimeError("No sweep armed, call arm() first.")
+        if not self._done:
+            esr = int(self.sa.query("*ESR?"))
+            if esr & ESR_ERRORS:
+                print(f"SA reported errors while sweeping (ESR={esr:#04x})")
+            self._done = bool(esr & ESR_OPERATION_COMPLETE)
+        return self._done
+
+    def wait_sweep(self, timeout: float = None, poll_interval: float = 1e-3, max_poll_interval: float = 0.05):
+        """
+        Waits for the armed sweep to end, without reading its trace.
+
+        Nothing is queried before the sweep time has elapsed since arm(), then *ESR?
+        is polled with an interval doubling from poll_interval up to
+        max_poll_interval. Once it returns, the trace of the sweep is held by the
+        analyzer until the next arm(), so the sweep conditions may already change
+        while it is fetched.
+
+        Args:
+            timeout (float): Longest wait in seconds, counted from arm() (default:
+                twice the sweep time plus 5 s).
+            poll_interval (float): First interval between status queries in seconds.
+            max_poll_interval (float): Longest interval between status queries in seconds.
+
+        Raises:
+            RuntimeError: If no sweep was armed.
+            TimeoutError: If the sweep has not ended within timeout.
+        """
+        if not self.sa:
+            return
+        if self._armed is None:
+            raise RuntimeError("No sweep armed, call arm() first.")
+        armed_at, sweep_time = self._armed
+        if timeout is None:
+            timeout = 2 * sweep_time + 5.0
+        deadline = armed_at + timeout
+        # The sweep cannot end before its sweep time
+        remaining = armed_at + sweep_time - time.perf_counter()
+        if remaining > 0:
+            time.sleep(min(remaining, timeout))
+        interval = poll_interval
+        while not self.sweep_done():
+            now = time.perf_counter()
+            if now >= deadline:
+                raise TimeoutError(f"SA sweep not complete after {timeout:.1f} s.")
+            time.sleep(min(interval, deadline - now))
+            interval = min(2 * interval, max_poll_interval)
+        self._armed = None
+
+    def result(self, timeout: float = None, binary: bool = True, with_axis: bool = False,
+               poll_interval: float = 1e-3, max_poll_interval: float = 0.05):
+        """
+        Waits for the armed sweep to end (see wait_sweep()) and fetches its trace, so
+        the trace is read as soon as the sweep ends and never before (no stale trace
+        from the previous sweep).
+
+        Args:
+            timeout (float): Longest wait in seconds, counted from arm() (default:
+                twice the sweep time plus 5 s).
+            binary (bool): Fetch the trace as a binary block (see fetch_trace()).
+            with_axis (bool): Also return the trace axis (see fetch_trace()).
+            poll_interval (float): First interval between status queries in seconds.
+            max_poll_interval (float): Longest interval between status queries in seconds.
+
+        Returns:
+            Trace as returned by fetch_trace() (None if not connected).
+
+        Raises:
+            RuntimeError: If no sweep was armed.
+            TimeoutError: If the sweep has not ended within timeout.
+        """
+        if not self.sa:
+            return None
+        self.wait_sweep(timeout, poll_interval, max_poll_interval)
+        return self.fetch_trace(binary=binary, with_axis=with_axis)
+
+    def acquire_single(self, timeout: float = None, binary: bool = True, with_axis: bool = False):
+        """
+        Runs one single sweep and returns its trace as soon as it ends.
+
+        Args:
+            timeout (float): Longest wait in seconds (see result()).
+            binary (bool): Fetch the trace as a binary block (see fetch_trace()).
+            with_axis (bool): Also return the trace axis (see fetch_trace()).
+
+        Returns:
+            Trace as returned by fetch_trace() (None if not connected).
+        """
+        if self.sa:
+            self.arm()
+            return self.result(timeout, binary=binary, with_axis=with_axis)
+
+    def set_trace_format(self, binary: bool = True):
+        """
+        Selects the trace transfer format.
+
+        Args:
+            binary (bool): True for 32-bit floats in a big-endian IEEE 488.2 block
+                (4 bytes per point), False for comma-separated ASCII (~15 bytes per point).
+        """
+        if self.sa:
+            if binary:
+                self._set(":FORMat:TRACe:DATA", "REAL,32")
+                self._set(":FORMat:BORDer", "NORMal")  # MSB first
+            else:
+                self._set(":FORMat:TRACe:DATA", "ASCii")
+            print(f"Trace format set to {'REAL,32' if binary else 'ASCII'}")
+
+    def fetch_trace(self, binary: bool = False, with_axis: bool = False):
         """
         Fetches the spectrum data from the SA.
 
+        Args:
+            binary (bool): Transfer the trace as a binary block and decode it straight
+                into a float32 NumPy array. The SA format is switched on first use.
+            with_axis (bool): Also return the frequency axis (Hz), or the time axis (s)
+                in zero span mode.
+
         Returns:
-            str: Data string from the analyzer.
+            str: Data string from the analyzer (ASCII mode), or
+            numpy.ndarray: Trace values (binary mode), or
+            tuple: (axis, trace) arrays if with_axis is True.
         """
         if self.sa:
-            data = self.sa.query(":TRACe:DATA? TRACE1")
+            if binary:
+                if not self.binary_format:
+                    self.set_trace_format(binary=True)
+                data = self.sa.query_binary_values(
+                    ":TRACe:DATA? TRACE1", datatype="f", is_big_endian=True, container=np.array
+                )
+            else:
+                # The format is unknown after connect, the SA may still be in REAL,32
+                if not self.state.matches(":FORMat:TRACe:DATA", "ASCii"):
+                    self.set_trace_format(binary=False)
+                data = self.sa.query(":TRACe:DATA? TRACE1")
             print("Fetched trace data")
+            if with_axis:
+                trace = data if binary else self.parse_trace(data)
+                return self.get_trace_axis(len(trace)), trace
             return data
 
+    def get_trace_axis(self, n_points: int):
+        """
+        Builds the axis of the current trace from the span and sweep settings.
+
+        The axis is cached until the center frequency, span or sweep time is changed
+        through this driver.
+
+        Args:
+            n_points (int): Number of points in the trace.
+
+        Returns:
+            numpy.ndarray: Frequencies in Hz, or times in s in zero span mode.
+        """
+        if self.sa:
+            if self._axis is None or len(self._axis) != n_points:
+                span = float(self.sa.query(":SENSe:FREQuency:SPAN?"))
+                if span == 0:
+                    sweep_time = float(self.sa.query(":SENSe:SWEep:TIME?"))
+                    self._axis = np.linspace(0, sweep_time, n_points)
+                else:
+                    start = float(self.sa.query(":SENSe:FREQuency:STARt?"))
+                    stop = float(self.sa.query(":SENSe:FREQuency:STOP?"))
+                    self._axis = np.linspace(start, stop, n_points)
+            return self._axis
+
+    @staticmethod
+    def parse_trace(data: str):
+        """
+        Converts an ASCII trace string returned by fetch_trace() to a NumPy array.
+
+        Args:
+            data (str): Trace string, optionally prefixed by the "#<n><length>" block header.
+
+        Returns:
+            numpy.ndarray: Trace values as float64.
+        """
+        data = data.strip()
+        if data.startswith('#'):
+            n_digits = int(data[1])
+            data = data[2 + n_digits:]
+        return np.array([x for x in data.split(',') if x.strip()], dtype=float)
+
     def disconnect(self):
         """Closes the connection to the SA."""
         if self.sa:
             self.sa.close()
+            self.state.invalidate()
+            self._armed = None
             print("Rigol SA disconnected.")
\ No newline at end of file
@@ -1,12 +1,22 @@
+import numpy as np
 import pyvisa
+from devices import instrumentation
+from devices.state_cache import StateCache
+from devices.waveforms import staircase_waveform
 
 # Methods:
 # connect() - Establishes a connection to the AFG3000C.
 # set_trigger_pulse(high_level, low_level, period, duty_cycle) - Configures a pulse train on Channel 1.
 # set_dc_voltage(voltage) - Sets a DC voltage on Channel 2 for frequency control.
+# load_voltage_staircase(voltages, dwell_time) - Uploads a whole voltage scan as an arbitrary waveform burst on Channel 2.
+# start_staircase() - Triggers the uploaded staircase.
 # disable_outputs() - Turns off both signal generator outputs.
+# invalidate_state() - Forgets the cached settings so the next setters resend them.
 # disconnect() - Closes the connection to AFG3000C.
 
+EMEMORY_POINTS = 16384  # Points of the staircase waveforms in edit memory
+DAC_MAX = 16382  # Largest data value of a waveform point (14 bits)
+
 
 class TektronixAFG3000C:
     """
@@ -15,26 +25,43 @@ class TektronixAFG3000C:
     - Channel 2: DC voltage for frequency control.
     """
 
-    def __init__(self, ip: str):
+    def __init__(self, ip: str, resource: str = None, visa_library: str = ""):
         """
         Initializes the Tektronix AFG3000C Signal Generator.
 
         Args:
-            ip (str): VISA resource string (e.g., 'TCPIP0::ip::INSTR').
+            ip (str): IP address of the AFG3000C.
+            resource (str): VISA resource string overriding the one built from ip
+                (e.g. 'TCPIP0::127.0.0.1::4000::SOCKET' for a raw socket).
+            visa_library (str): VISA backend passed to pyvisa.ResourceManager
+                (default: the installed VISA library).
         """
         self.ip = ip
-        self.resource = f"TCPIP::{ip}::INSTR"
-        self.rm = pyvisa.ResourceManager()
+        self.resource = resource or f"TCPIP::{ip}::INSTR"
+        self.rm = pyvisa.ResourceManager(visa_library)
         self.instrument = None
+        self.state = StateCache()  # Last settings sent, to skip redundant writes
 
     def connect(self):
-        """Establishes a connection to the AFG3000C."""
+        """
+        Establishes a connection to the AFG3000C.
+
+        Returns:
+            bool: True if the connection was established.
+        """
         try:
-            self.instrument = self.rm.open_resource(self.resource)
+            self.instrument = instrumentation.InstrumentedResource(self.rm.open_resource(self.resource), "afg")
+            if self.resource.upper().endswith("::SOCKET"):
+                # Raw sockets have no message framing, responses end with a newline
+                self.instrument.read_termination = "\n"
+                self.instrument.write_termination = "\n"
             self.instrument.write("*RST")  # Reset the instrument
+            self.state.invalidate()
             print(f"Connected to AFG3000C at {self.resource}")
+            return True
         except Exception as e:
             print(f"Error connecting to AFG3000C: {e}")
+            return False
 
     def set_trigger_pulse(
         self, high_level: float, low_level: float, period: float, duty_cycle: float
@@ -60,12 +87,12 @@ class TektronixAFG3000C:
             print("Invalid period! Must be greater than 0.")
             return
 
-        # Configure Pulse on Channel 1
-        self.instrument.write("SOURce1:FUNCtion PULSe")
-        self.instrument.write(f"SOURce1:PULSe:PERiod {period}")
-        self.instrument.write(f"SOURce1:PULSe:DCYCle {duty_cycle}")
-        self.instrument.write(f"SOURce1:VOLTage:HIGH {high_level}")
-        self.instrument.write(f"SOURce1:VOLTage:LOW {low_level}")
+        # Configure Pulse on Channel 1 (unchanged settings are not resent)
+        self._set("SOURce1:FUNCtion", "PULSe")
+        self._set("SOURce1:PULSe:PERiod", period)
+        self._set("SOURce1:PULSe:DCYCle", duty_cycle)
+        self._set("SOURce1:VOLTage:HIGH", high_level)
+        self._set("SOURce1:VOLTage:LOW", low_level)
 
         print(
             f"Pulse set: High {high_level}V, Low {low_level}V, Period {period}s, Duty {duty_cycle}%"
@@ -85,25 +112,107 @@ class TektronixAFG3000C:
         # Limit to the supported range (-5V to +5V)
         voltage = max(-5, min(5, voltage))
 
-        # Configure DC Output on Channel 2
-        self.instrument.write("SOURce2:FUNCtion DC")
-        self.instrument.write(f"SOURce2:VOLTage:OFFSet {voltage}")
+        # Configure DC Output on Channel 2 (only the offset changes during a scan)
+        self._set("SOURce2:FUNCtion", "DC")
+        self._set("SOURce2:BURSt:STATe", "OFF")
+        self._set("SOURce2:VOLTage:OFFSet", voltage)
+        # The offset and the HIGH/LOW levels are linked: a staircase must resend its levels
+        self.state.invalidate("SOURce2:VOLTage:HIGH", "SOURce2:VOLTage:LOW")
 
         print(f"DC output set to {voltage} V")
 
+    def load_voltage_staircase(self, voltages, dwell_time: float, ramp: bool = False, external: bool = False):
+        """
+        Uploads a whole voltage scan to Channel 2 as one arbitrary waveform burst.
+
+        The staircase is written to edit memory as a binary block and played once
+        per trigger, each voltage (clamped to -5..5 V) held for dwell_time, so the
+        scan runs on the generator clock with no command per step. The waveform is
+        only sent again if it changed.
+
+        Args:
+            voltages (array): Voltage of each step in V, in playback order.
+            dwell_time (float): Time spent on each step in seconds.
+            ramp (bool): Go linearly from each voltage to the next instead of stepping.
+            external (bool): Same signature as the Red Pitaya. The burst is always armed
+                on the external trigger input (rising edge), which start_staircase()
+                also fires, so leave the input unconnected for software starts only.
+
+        Returns:
+            dict: "voltages" (clamped), "dwell_time", "duration" (s) and "points"
+                (waveform length), None if not connected.
+        """
+        if not self.instrument:
+            print("Not connected to AFG3000C!")
+            return None
+        if dwell_time <= 0:
+            raise ValueError("Dwell time must be positive.")
+
+        voltages = np.clip(np.atleast_1d(np.asarray(voltages, dtype=float)), -5.0, 5.0)
+        low, high = float(voltages.min()), float(voltages.max())
+        if high - low < 1e-3:
+            high = low + 1e-3  # The output range cannot be empty
+        # Points span the DAC range between the LOW and HIGH levels
+        codes = staircase_waveform((voltages - low) / (high - low) * DAC_MAX, EMEMORY_POINTS, ramp=ramp)
+        data = np.round(codes).astype(np.uint16)
+        duration = len(voltages) * dwell_time
+
+        def upload():
+            self.instrument.write_binary_values("TRACe:DATA EMEMory,", data, datatype="H", is_big_endian=True)
+
+        self.state.apply("TRACe:DATA EMEMory", data.tobytes(), upload)
+        self._set("SOURce2:FUNCtion", "EMEMory")
+        self._set("SOURce2:FREQuency", 1.0 / duration)
+        self._set("SOURce2:VOLTage:HIGH", high)
+        self._set("SOURce2:VOLTage:LOW", low)
+        # The levels moved the offset: the next set_dc_voltage must resend it
+        self.state.invalidate("SOURce2:VOLTage:OFFSet")
+        self._set("SOURce2:BURSt:MODE", "TRIGgered")
+        self._set("SOURce2:BURSt:NCYCles", 1)
+        self._set("SOURce2:BURSt:STATe", "ON")
+        self._set("TRIGger:SEQuence:SOURce", "EXTernal")
+        self._set("TRIGger:SEQuence:SLOPe", "POSitive")
+        self._set("OUTPut2", "ON")
+
+        print(f"Channel 2 staircase loaded: {len(voltages)} steps of {dwell_time * 1e3:.3f} ms "
+              f"({duration:.3f} s, {len(data)} points)")
+        return {"voltages": voltages, "dwell_time": dwell_time, "duration": duration, "points": len(data)}
+
+    def start_staircase(self):
+        """Starts the staircase loaded by load_voltage_staircase() (software trigger)."""
+        if not self.instrument:
+            print("Not connected to AFG3000C!")
+            return
+        self.instrument.write("TRIGger:SEQuence:IMMediate")
+
     def disable_outputs(self):
         """Turns off both signal generator outputs."""
         if not self.instrument:
             print("Not connected to AFG3000C!")
             return
 
-        self.instrument.write("OUTPut1 OFF")
-        self.instrument.write("OUTPut2 OFF")
+        self._set("OUTPut1", "OFF")
+        self._set("OUTPut2", "OFF")
 
         print("Outputs disabled.")
 
+    def invalidate_state(self):
+        """Forgets the cached settings so the next setters resend them."""
+        self.state.invalidate()
+
+    def _set(self, header: str, value):
+        """
+        Writes '<header> <value>' unless the setting already holds this value.
+
+        Returns:
+            bool: True if the command was sent.
+        """
+        value = str(value)
+        return self.state.apply(header, value, lambda: self.instrument.write(f"{header} {value}"))
+
     def disconnect(self):
         """Closes the connection to AFG3000C."""
         if self.instrument:
             self.instrument.close()
+            self.state.invalidate()
             print("AFG3000C disconnected.")
@@ -1,19 +1,92 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from devices import instrumentation
+
+# Status codes returned by the wavemeter API instead of a frequency
+UNDEREXPOSED = -3000.0
+OVEREXPOSED = -4000.0
+
+# Status of a sampled reading
+STATUS_OK = 0
+STATUS_NO_SIGNAL = 1
+STATUS_UNDEREXPOSED = 2
+STATUS_OVEREXPOSED = 3
+STATUS_ERROR = 4  # HTTP or decoding error, value is NaN
+
+SAMPLE_DTYPE = np.dtype([("timestamp", "f8"), ("value", "f8"), ("status", "i1")])
+
+
+def reading_status(data):
+    """Status code of a value returned by the API."""
+    if data == UNDEREXPOSED:
+        return STATUS_UNDEREXPOSED
+    if data == OVEREXPOSED:
+        return STATUS_OVEREXPOSED
+    if data == 0.0:
+        return STATUS_NO_SIGNAL
+    return STATUS_OK
 
 
 class Wavemeter:
     """
     Wavemeter driver to fetch frequency data from an HTTP API.
+
+    Requests go through one pooled keep-alive session, so consecutive reads reuse
+    the same TCP connection instead of opening a new one each time.
     """
 
-    def __init__(self, base_url: str = "http://192.168.0.169:5000"):
+    def __init__(self, base_url: str = "http://192.168.0.169:5000", timeout: float = 5, pool_size: int = 8):
         """
         Initializes the Wavemeter.
 
         Args:
             base_url (str): Base URL of the wavemeter API.
+            timeout (float): HTTP timeout in seconds.
+            pool_size (int): Connections kept alive, i.e. concurrent reads without reconnecting.
         """
         self.base_url = base_url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None
+        self.sampler = None
+
+    def close(self):
+        """
+        Stops the sampler and closes the pooled connections and the worker threads
+        of get_frequencies.
+        """
+        self.stop_sampling()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+    def check_connection(self, timeout: float = 5):
+        """
+        Checks that the wavemeter API answers, whatever the exposure state.
+
+        Args:
+            timeout (float): HTTP timeout in seconds.
+
+        Returns:
+            bool: True if the API responded.
+        """
+        try:
+            response = self.session.get(f"{self.base_url}/api/freq/0", timeout=timeout)
+            response.raise_for_status()
+            print(f"Wavemeter reachable at {self.base_url}")
+            return True
+        except requests.exceptions.RequestException as e:
+            print(f"Wavemeter not reachable: {e}")
+            return False
 
     def get_frequency(self, channel: int = 0):
         """
@@ -26,22 +99,247 @@ class Wavemeter:
             float or None: The measured frequency in Hz, or None if an error occurs.
         """
         try:
-            response = requests.get(f"{self.base_url}/api/freq/{channel}", timeout=5)
-            response.raise_for_status()  # Raise an error for HTTP issues
+            data = self._fetch(channel)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching frequency from Wavemeter: {e}")
+            return None
+        if data == UNDEREXPOSED:
+            print('Underexposed')
+            return None
+        if data == OVEREXPOSED:
+            print('OVERexposed')
+            return None
+        if data!=0.0:
+            print(f"Wavemeter Channel {channel}: {data} GHz")
+            return data
+        else:
+            print("No signal or not the good channel:", data)
+            return None
+
+    def get_frequencies(self, channels):
+        """
+        Fetches several channels concurrently over the pooled connections.
 
-            data = response.json()
-            if data == -3000.0:
-                print('Underexposed')
+        Args:
+            channels (iterable): Wavemeter channels to read.
+
+        Returns:
+            dict: {channel: {"frequency": float or None, "raw": value returned by the API
+                (None on HTTP error), "timestamp": time.time() of the answer}}
+        """
+        channels = list(channels)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="wavemeter")
+        return dict(zip(channels, self._executor.map(self._read_channel, channels)))
+
+    def start_sampling(self, channel: int = 0, rate: float = 20.0, capacity: int = 4096):
+        """
+        Starts polling a channel in the background (see WavemeterSampler).
+
+        Args:
+            channel (int): Wavemeter channel to poll.
+            rate (float): Polling rate in Hz.
+            capacity (int): Samples kept in the ring buffer.
+
+        Returns:
+            WavemeterSampler: The running sampler, also available as self.sampler.
+        """
+        self.stop_sampling()
+        self.sampler = WavemeterSampler(self, channel=channel, rate=rate, capacity=capacity).start()
+        return self.sampler
+
+    def stop_sampling(self):
+        """
+        Stops the background sampler, if any.
+        """
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+
+    def read_frequency(self, channel: int = 0, window: float = 0.5, now: float = None):
+        """
+        Frequency for the control loops: the mean of the sampled readings of the last
+        window seconds when the channel is being sampled, otherwise one HTTP read.
+
+        Args:
+            channel (int): Wavemeter channel.
+            window (float): Averaging window in seconds (sampling mode only).
+            now (float): End of the window (time.time()), default now (sampling mode
+                only), so a point can still be read after the setpoint has moved on.
+                Without a valid reading in that window, None is returned: a live
+                read would not belong to it.
+
+        Returns:
+            float or None: Frequency in GHz, or None without a valid reading.
+        """
+        sampler = self.sampler
+        if sampler is not None and sampler.channel == channel and sampler.running:
+            stats = sampler.window_stats(window, now=now)
+            if stats["count"]:
+                return stats["mean"]
+            if now is not None:
                 return None
-            if data == -4000.0:
-                print('OVERexposed')
+        return self.get_frequency(channel)
+
+    def _read_channel(self, channel):
+        try:
+            data = self._fetch(channel)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching channel {channel} from Wavemeter: {e}")
+            data = None
+        valid = data is not None and reading_status(data) == STATUS_OK
+        return {"frequency": data if valid else None, "raw": data, "timestamp": time.time()}
+
+    def _fetch(self, channel):
+        """
+        One HTTP read of a channel.
+
+        Returns:
+            float: Value returned by the API (frequency in GHz or a status code).
+        """
+        start = time.perf_counter_ns()
+        with instrumentation.record_failures("wavemeter", "request", "GET /api/freq", start):
+            response = self.session.get(f"{self.base_url}/api/freq/{channel}", timeout=self.timeout)
+            response.raise_for_status()  # Raise an error for HTTP issues
+        instrumentation.record("wavemeter", "request", "GET /api/freq", start, received=len(response.content))
+        return response.json()
+
+
+class WavemeterSampler:
+    """
+    Background poller of one wavemeter channel.
+
+    Readings are stored in a fixed-size NumPy ring buffer of (timestamp, value,
+    status) entries, status codes included, so readers get the latest value or
+    windowed statistics without an HTTP round trip.
+    """
+
+    def __init__(self, wavemeter: Wavemeter, channel: int = 0, rate: float = 20.0, capacity: int = 4096):
+        """
+        Args:
+            wavemeter (Wavemeter): Driver whose session is used for the requests.
+            channel (int): Wavemeter channel to poll.
+            rate (float): Polling rate in Hz.
+            capacity (int): Samples kept; the oldest are overwritten.
+        """
+        if rate <= 0 or capacity < 1:
+            raise ValueError("Rate and capacity must be positive.")
+        self.wavemeter = wavemeter
+        self.channel = channel
+        self.period = 1.0 / rate
+        self.buffer = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self.total = 0  # Samples written since start, buffer index is total % capacity
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts the polling thread. Returns the sampler for chaining."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"wavemeter-sampler-{self.channel}",
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the polling thread. The buffer stays readable."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        next_time = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                data = float(self.wavemeter._fetch(self.channel))
+                status = reading_status(data)
+            except (requests.exceptions.RequestException, TypeError, ValueError):
+                data, status = np.nan, STATUS_ERROR
+            self._append(time.time(), data, status)
+            next_time += self.period
+            delay = next_time - time.perf_counter()
+            if delay < 0:
+                next_time = time.perf_counter()  # Polling slower than the rate, do not try to catch up
+            elif self._stop.wait(delay):
+                break
+
+    def _append(self, timestamp, value, status):
+        with self._condition:
+            self.buffer[self.total % len(self.buffer)] = (timestamp, value, status)
+            self.total += 1
+            self._condition.notify_all()
+
+    def _ordered(self):
+        """Stored samples, oldest first (a copy). Call with the condition held."""
+        capacity = len(self.buffer)
+        if self.total <= capacity:
+            return self.buffer[:self.total].copy()
+        index = self.total % capacity
+        return np.concatenate((self.buffer[index:], self.buffer[:index]))
+
+    def latest(self):
+        """
+        Returns:
+            numpy.void or None: Last sample (fields timestamp, value, status), None if
+                nothing has been sampled yet.
+        """
+        with self._condition:
+            if not self.total:
                 return None
-            if data!=0.0:
-                print(f"Wavemeter Channel {channel}: {data} GHz")
-                return data
-            else:
-                print("No signal or not the good channel:", data)
+            return self.buffer[(self.total - 1) % len(self.buffer)].copy()
+
+    def since(self, timestamp: float):
+        """
+        Returns:
+            numpy.ndarray: Samples taken after timestamp (time.time()), oldest first.
+        """
+        with self._condition:
+            samples = self._ordered()
+        return samples[samples["timestamp"] > timestamp]
+
+    def window_stats(self, window: float, now: float = None):
+        """
+        Statistics of the valid readings of the last window seconds.
+
+        Args:
+            window (float): Window length in seconds.
+            now (float): End of the window (time.time()), default now.
+
+        Returns:
+            dict: "mean", "std" (NaN without valid reading), "count" of valid readings,
+                "invalid" count (status codes and errors) and "last_status".
+        """
+        now = time.time() if now is None else now
+        with self._condition:
+            # Order does not matter here, mask the filled part of the ring in place
+            stored = self.buffer[:min(self.total, len(self.buffer))]
+            samples = stored[(stored["timestamp"] > now - window) & (stored["timestamp"] <= now)]
+        samples = np.sort(samples, order="timestamp")
+        valid = samples["value"][samples["status"] == STATUS_OK]
+        return {
+            "mean": float(valid.mean()) if len(valid) else np.nan,
+            "std": float(valid.std()) if len(valid) else np.nan,
+            "count": int(len(valid)),
+            "invalid": int(len(samples) - len(valid)),
+            "last_status": int(samples["status"][-1]) if len(samples) else None,
+        }
+
+    def wait_for_sample(self, after: float, timeout: float = None):
+        """
+        Blocks until a sample taken after the given time.time() is available.
+
+        Returns:
+            numpy.void or None: That sample, None on timeout.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self.total and self.buffer[(self.total - 1) % len(self.buffer)]["timestamp"] > after,
+                    timeout):
                 return None
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching frequency from Wavemeter: {e}")
-            return None
\ No newline at end of file
+            return self.buffer[(self.total - 1) % len(self.buffer)].copy()
@@ -0,0 +1,304 @@
+"""
+Driver I/O instrumentation shared by all the instrument drivers.
+
+Every I/O primitive of the drivers (Telnet command, SCPI write/read, VISA
+write/query, HTTP request, serial write/query) records its duration and the bytes
+it moved into a histogram keyed by (device, operation, command). Operations that
+raise (timeouts, I/O errors) are recorded too, with their duration, and counted
+as errors. Histograms use
+logarithmic buckets (4 per octave, from 1 us to ~100 s), so recording is a few
+integer operations under a lock and percentiles stay within ~10 %.
+
+Usage:
+    from devices import instrumentation
+    instrumentation.snapshot()        # nested dict per device and command
+    print(instrumentation.format_table())
+    dumper = instrumentation.PeriodicDump(60, path="io_stats.jsonl").start()
+"""
+
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS_PER_OCTAVE = 4
+MIN_NS = 1_000  # Durations below 1 us land in the first bucket
+NUM_BUCKETS = 27 * BUCKETS_PER_OCTAVE  # 1 us * 2**27 ~ 134 s
+
+enabled = True  # Set to False to make record() a no-op
+
+
+class Histogram:
+    """
+    Log-bucketed duration histogram with byte counters.
+    """
+
+    __slots__ = ("count", "errors", "total_ns", "max_ns", "bytes_sent", "bytes_received", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0  # Operations that raised, included in count and durations
+        self.total_ns = 0
+        self.max_ns = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.buckets = [0] * NUM_BUCKETS
+
+    def add(self, duration_ns, sent=0, received=0, error=False):
+        if duration_ns > MIN_NS:
+            index = min(int(math.log2(duration_ns / MIN_NS) * BUCKETS_PER_OCTAVE), NUM_BUCKETS - 1)
+        else:
+            index = 0
+        self.buckets[index] += 1
+        self.count += 1
+        self.errors += error
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.bytes_sent += sent
+        self.bytes_received += received
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                edge_ns = MIN_NS * 2 ** ((index + 1) / BUCKETS_PER_OCTAVE)
+                return min(edge_ns, self.max_ns) / 1e9
+        return self.max_ns / 1e9
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_s": self.total_ns / 1e9,
+            "mean_s": self.total_ns / self.count / 1e9 if self.count else 0.0,
+            "p50_s": self.percentile(50),
+            "p90_s": self.percentile(90),
+            "p99_s": self.percentile(99),
+            "max_s": self.max_ns / 1e9,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+class Registry:
+    """
+    Thread-safe set of histograms keyed by (device, operation, command).
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.since = time.time()
+
+    def record(self, device, operation, command, duration_ns, sent=0, received=0, error=False):
+        key = (device, operation, command)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.add(duration_ns, sent, received, error)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.since = time.time()
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {device: {"count", "errors", "total_s", "bytes_sent", "bytes_received",
+                "commands": {"<operation> <command>": summary}}}
+        """
+        with self._lock:
+            items = [(key, histogram.summary()) for key, histogram in self._histograms.items()]
+        devices = {}
+        for (device, operation, command), summary in sorted(items):
+            entry = devices.setdefault(device, {"count": 0, "errors": 0, "total_s": 0.0, "bytes_sent": 0,
+                                                "bytes_received": 0, "commands": {}})
+            entry["commands"][f"{operation} {command}"] = summary
+            for field in ("count", "errors", "total_s", "bytes_sent", "bytes_received"):
+                entry[field] += summary[field]
+        return devices
+
+
+REGISTRY = Registry()
+
+
+def record(device, operation, command, start_ns, sent=0, received=0, error=False):
+    """
+    Records one I/O operation that started at start_ns (time.perf_counter_ns()).
+
+    Args:
+        device (str): Instrument name (e.g. "rigol").
+        operation (str): "write", "read", "query" or "request".
+        command (str): Command name, without the variable arguments.
+        start_ns (int): perf_counter_ns() taken before the operation.
+        sent (int): Bytes written.
+        received (int): Bytes read.
+        error (bool): The operation raised (timeout, I/O error).
+    """
+    if enabled:
+        REGISTRY.record(device, operation, command, time.perf_counter_ns() - start_ns, sent, received, error)
+
+
+@contextmanager
+def record_failures(device, operation, command, start_ns):
+    """
+    Records the operation as failed if the block raises, then lets the exception
+    through. Successful operations are recorded by the caller with their byte counts.
+
+    Example:
+        start = time.perf_counter_ns()
+        with instrumentation.record_failures("rigol", "query", "*IDN?", start):
+            answer = resource.query("*IDN?")
+        instrumentation.record("rigol", "query", "*IDN?", start, received=len(answer))
+    """
+    try:
+        yield
+    except BaseException:
+        record(device, operation, command, start_ns, error=True)
+        raise
+
+
+def snapshot():
+    """Current statistics, see Registry.snapshot()."""
+    return REGISTRY.snapshot()
+
+
+def reset():
+    """Clears all statistics."""
+    REGISTRY.reset()
+
+
+def scpi_command(message):
+    """Command name of a SCPI message: its headers without arguments."""
+    return ";".join(part.strip().split(" ", 1)[0] for part in message.split(";"))
+
+
+def format_table(stats=None):
+    """
+    Formats statistics as a text table, devices sorted by total time.
+    """
+    stats = snapshot() if stats is None else stats
+    lines = [f"{'device / command':<48} {'count':>7} {'errors':>7} {'total s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+             f"{'sent B':>10} {'recv B':>10}"]
+    for device, entry in sorted(stats.items(), key=lambda item: -item[1]["total_s"]):
+        lines.append(f"{device:<48} {entry['count']:>7} {entry.get('errors', 0):>7} {entry['total_s']:>9.3f} "
+                     f"{'':>8} {'':>8} {entry['bytes_sent']:>10} {entry['bytes_received']:>10}")
+        commands = sorted(entry["commands"].items(), key=lambda item: -item[1]["total_s"])
+        for name, s in commands:
+            lines.append(f"  {name[:46]:<46} {s['count']:>7} {s.get('errors', 0):>7} {s['total_s']:>9.3f} "
+                         f"{s['p50_s'] * 1e3:>8.2f} {s['p99_s'] * 1e3:>8.2f} {s['bytes_sent']:>10} "
+                         f"{s['bytes_received']:>10}")
+    return "\n".join(lines)
+
+
+class InstrumentedResource:
+    """
+    Wraps a pyvisa resource so write/read/query calls are recorded, failed ones
+    included. Every other attribute (timeout, terminations, close, ...) is forwarded
+    to the resource.
+    """
+
+    def __init__(self, resource, device):
+        object.__setattr__(self, "_resource", resource)
+        object.__setattr__(self, "_device", device)
+
+    def __getattr__(self, name):
+        return getattr(self._resource, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resource, name, value)
+
+    def write(self, message, *args, **kwargs):
+        start = time.perf_counter_ns()
+        with record_failures(self._device, "write", scpi_command(message), start):
+            result = self._resource.write(message, *args, **kwargs)
+        record(self._device, "write", scpi_command(message), start, sent=result or len(message))
+        return result
+
+    def write_binary_values(self, message, values, *args, **kwargs):
+        start = time.perf_counter_ns()
+        with record_failures(self._device, "write", scpi_command(message), start):
+            result = self._resource.write_binary_values(message, values, *args, **kwargs)
+        record(self._device, "write", scpi_command(message), start, sent=result)
+        return result
+
+    def read(self, *args, **kwargs):
+        start = time.perf_counter_ns()
+        with record_failures(self._device, "read", "", start):
+            result = self._resource.read(*args, **kwargs)
+        record(self._device, "read", "", start, received=len(result))
+        return result
+
+    def query(self, message, *args, **kwargs):
+        start = time.perf_counter_ns()
+        with record_failures(self._device, "query", scpi_command(message), start):
+            result = self._resource.query(message, *args, **kwargs)
+        record(self._device, "query", scpi_command(message), start, sent=len(message), received=len(result))
+        return result
+
+    def query_binary_values(self, message, *args, **kwargs):
+        start = time.perf_counter_ns()
+        with record_failures(self._device, "query", scpi_command(message), start):
+            result = self._resource.query_binary_values(message, *args, **kwargs)
+        received = getattr(result, "nbytes", None)
+        if received is None:
+            received = 4 * len(result)
+        record(self._device, "query", scpi_command(message), start, sent=len(message), received=received)
+        return result
+
+
+class PeriodicDump:
+    """
+    Background thread writing the statistics every interval seconds, as one JSON
+    line per dump to a file, or as a table on stdout.
+    """
+
+    def __init__(self, interval=60.0, path=None, reset_after=False):
+        """
+        Args:
+            interval (float): Seconds between dumps.
+            path (str): JSON lines file to append to. None prints a table.
+            reset_after (bool): Clear the statistics after each dump (per-interval values).
+        """
+        self.interval = interval
+        self.path = path
+        self.reset_after = reset_after
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="io-stats-dump", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the thread after a last dump."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.dump()
+
+    def dump(self):
+        stats = snapshot()
+        if self.path is None:
+            print(format_table(stats))
+        else:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"time": time.time(), "since": REGISTRY.since, "devices": stats}) + "\n")
+        if self.reset_after:
+            reset()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
@@ -0,0 +1,12 @@
+"""
+In-process stand-ins for the lab instruments, with configurable per-command latency.
+
+Each instrument is served on localhost with its real protocol (Telnet, SCPI over TCP,
+HTTP, SynthHD serial API), so the unmodified drivers talk to them.
+"""
+
+from devices.sim.lab import SimLab, SimLabProcess
+from devices.sim.latency import LatencyModel, default_latency
+from devices.sim.world import SimWorld, UNDEREXPOSED, OVEREXPOSED
+
+__all__ = ["SimLab", "SimLabProcess", "SimWorld", "LatencyModel", "default_latency", "UNDEREXPOSED", "OVEREXPOSED"]
@@ -0,0 +1,115 @@
+"""
+Simulated Tektronix AFG3000C
+----------------------------
+SCPI socket server (port 4000 on the generator) for the commands used by
+TektronixAFG3000C. The channel 2 DC offset drives the laser control voltage of the
+SimWorld while the output is on. As on the instrument, the offset and amplitude are
+derived from the HIGH and LOW levels: writing the offset moves both levels.
+
+A triggered EMEMory burst on channel 2 (waveform uploaded with TRACe:DATA as a
+binary block) is played in real time into the control voltage on *TRG or
+TRIGger:IMMediate, once, then its last level is held. External trigger edges are
+not simulated.
+"""
+
+import numpy as np
+
+from devices.sim.scpi import ScpiServer
+
+DAC_MAX = 16382  # Data value of a waveform point at the HIGH level
+HIGH = "[SOURce#]:VOLTage[:LEVel][:IMMediate]:HIGH"
+LOW = "[SOURce#]:VOLTage[:LEVel][:IMMediate]:LOW"
+AMPLITUDE = "[SOURce#]:VOLTage[:LEVel][:IMMediate][:AMPLitude]"
+OFFSET = "[SOURce#]:VOLTage[:LEVel][:IMMediate]:OFFSet"
+
+
+class AFGServer(ScpiServer):
+    """
+    Tektronix AFG3000C arbitrary function generator.
+    """
+
+    idn = "TEKTRONIX,AFG3022C,C000000,SCPI:99.0 FV:1.0.0"
+
+    def setup(self):
+        for pattern, default in [
+            ("[SOURce#]:FUNCtion[:SHAPe]", "SINusoid"),
+            ("[SOURce#]:FREQuency[:CW]", "1000000"),
+            ("[SOURce#]:PULSe:PERiod", "1e-6"),
+            ("[SOURce#]:PULSe:DCYCle", "50"),
+            (HIGH, "0.5"),
+            (LOW, "-0.5"),
+            ("[SOURce#]:BURSt[:STATe]", "OFF"),
+            ("OUTPut#[:STATe]", "OFF"),
+        ]:
+            self.add_setting(pattern, default, on_change=self._output_changed)
+        for pattern, default in [
+            ("[SOURce#]:BURSt:MODE", "TRIGgered"),
+            ("[SOURce#]:BURSt:NCYCles", "1"),
+            ("TRIGger[:SEQuence]:SOURce", "EXTernal"),
+            ("TRIGger[:SEQuence]:SLOPe", "POSitive"),
+        ]:
+            self.add_setting(pattern, default)
+        # Amplitude and offset are another view of the HIGH/LOW levels, as on the instrument
+        self.add_command(AMPLITUDE, lambda args, sfx: self._set_levels(sfx[0], amplitude=float(args)))
+        self.add_command(AMPLITUDE + "?", lambda args, sfx: repr(self._levels(sfx[0])[0] - self._levels(sfx[0])[1]))
+        self.add_command(OFFSET, lambda args, sfx: self._set_levels(sfx[0], offset=float(args)))
+        self.add_command(OFFSET + "?", lambda args, sfx: repr(sum(self._levels(sfx[0])) / 2))
+        self.add_command("TRACe[:DATA]", self._trace_data)
+        self.add_command("DATA[:DATA]", self._trace_data)
+        self.add_command("TRIGger[:SEQuence][:IMMediate]", lambda args, sfx: self._trigger())
+        self.add_command("*TRG", lambda args, sfx: self._trigger())
+        self.ememory = np.zeros(0, dtype=np.uint16)
+
+    def reset(self):
+        super().reset()
+        self._output_changed(None)
+
+    def _levels(self, channel):
+        """(high, low) output levels of a channel in V."""
+        return self.get_float(HIGH, channel), self.get_float(LOW, channel)
+
+    def _set_levels(self, channel, amplitude=None, offset=None):
+        """Writes the amplitude or the offset by moving the HIGH and LOW levels."""
+        high, low = self._levels(channel)
+        amplitude = high - low if amplitude is None else amplitude
+        offset = (high + low) / 2 if offset is None else offset
+        self.settings[(HIGH, channel)] = repr(offset + amplitude / 2)
+        self.settings[(LOW, channel)] = repr(offset - amplitude / 2)
+        self._output_changed([channel])
+
+    def _trace_data(self, args, sfx):
+        """TRACe:DATA EMEMory,<block>: big-endian 14-bit points."""
+        _, _, block = args.partition(",")
+        digits = int(block[1])
+        length = int(block[2:2 + digits])
+        payload = block[2 + digits:2 + digits + length].encode(self.encoding)
+        self.ememory = np.frombuffer(payload, dtype=">u2").astype(np.uint16)
+
+    def _trigger(self):
+        """Plays the channel 2 EMEMory burst once."""
+        if self.world is None or not len(self.ememory):
+            return
+        on = self.get("OUTPut#[:STATe]", 2).upper() in ("ON", "1")
+        ememory = self.get("[SOURce#]:FUNCtion[:SHAPe]", 2).upper() in ("EMEM", "EMEMORY")
+        burst = self.get("[SOURce#]:BURSt[:STATe]", 2).upper() in ("ON", "1")
+        if not (on and ememory and burst):
+            return
+        high, low = self._levels(2)
+        levels = low + (high - low) * self.ememory / DAC_MAX
+        sample_time = 1.0 / (self.get_float("[SOURce#]:FREQuency[:CW]", 2) * len(levels))
+        # One segment per run of equal points
+        starts = np.flatnonzero(np.r_[True, np.diff(levels) != 0])
+        durations = np.diff(np.r_[starts, len(levels)]) * sample_time
+        self.world.play_control_waveform(levels[starts], durations)
+
+    def _output_changed(self, suffixes):
+        """Forwards the channel 2 DC level to the laser controller."""
+        if self.world is None:
+            return
+        on = self.get("OUTPut#[:STATe]", 2).upper() in ("ON", "1")
+        if on and self.get("[SOURce#]:FUNCtion[:SHAPe]", 2).upper() in ("EMEM", "EMEMORY"):
+            return  # Driven by the playback started on the trigger
+        self.world.stop_control_waveform()
+        dc = self.get("[SOURce#]:FUNCtion[:SHAPe]", 2).upper() == "DC"
+        voltage = sum(self._levels(2)) / 2 if on and dc else 0.0
+        self.world.set_control_voltage(voltage)
@@ -0,0 +1,167 @@
+"""
+Simulated Lab
+-------------
+Starts every simulated instrument on localhost around a shared SimWorld and gives
+the driver arguments pointing at them.
+
+Example:
+    with SimLab(latency_scale=1.0) as lab:
+        sa = RigolSA(**lab.device_config()["sa"])
+"""
+
+import multiprocessing
+
+from devices.sim.afg import AFGServer
+from devices.sim.laser import LaserServer
+from devices.sim.latency import default_latency
+from devices.sim.redpitaya import RedPitayaServer
+from devices.sim.rigol import RigolServer
+from devices.sim.synthhd import SynthHDServer
+from devices.sim.wavemeter import WavemeterServer
+from devices.sim.world import SimWorld
+
+
+class SimLab:
+    """
+    The set of simulated instruments of the experiment.
+    """
+
+    def __init__(self, world=None, latency=None, latency_scale=1.0, seed=None):
+        """
+        Args:
+            world (SimWorld): Shared physical state. A default one is created if None.
+            latency (dict): LatencyModel per instrument ("laser", "red_pitaya",
+                "wavemeter", "rigol", "afg", "synthhd"), overriding the defaults.
+            latency_scale (float): Factor applied to the default latencies
+                (0 for an instantaneous lab).
+            seed (int): Seed of the noise and jitter generators.
+        """
+        self.world = world or SimWorld(seed=seed)
+        models = {**default_latency(scale=latency_scale, seed=seed), **(latency or {})}
+        self.servers = {
+            "laser": LaserServer(world=self.world, latency=models["laser"]),
+            "red_pitaya": RedPitayaServer(world=self.world, latency=models["red_pitaya"]),
+            "wavemeter": WavemeterServer(world=self.world, latency=models["wavemeter"]),
+            "rigol": RigolServer(world=self.world, latency=models["rigol"]),
+            "afg": AFGServer(world=self.world, latency=models["afg"]),
+            "synthhd": SynthHDServer(latency=models["synthhd"]),
+        }
+
+    def __getattr__(self, name):
+        servers = self.__dict__.get("servers", {})
+        if name in servers:
+            return servers[name]
+        raise AttributeError(name)
+
+    def start(self):
+        """Starts all servers. Returns the lab for chaining."""
+        for server in self.servers.values():
+            server.start()
+        return self
+
+    def stop(self):
+        """Stops all servers and the waveform playback."""
+        for server in self.servers.values():
+            server.stop()
+        self.world.stop_control_waveform()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self):
+        """
+        Traffic counters of every instrument.
+
+        Returns:
+            dict: Per instrument, "commands" served, "bytes_received" and "bytes_sent".
+        """
+        return {name: server.stats() for name, server in self.servers.items()}
+
+    def device_config(self):
+        """
+        Driver arguments pointing at the simulated instruments, in the same layout as
+        bragg.LAB_DEVICE_CONFIG.
+
+        Returns:
+            dict: Keyword arguments per driver.
+        """
+        host = "127.0.0.1"
+        return {
+            "laser": {"host": host, "port": self.laser.port, "prompt": self.laser.prompt},
+            "rf_gen": {"port": self.synthhd.url},
+            "wavemeter": {"base_url": self.wavemeter.base_url},
+            "sa": {"ip": host, "resource": f"TCPIP0::{host}::{self.rigol.port}::SOCKET"},
+            "rp": {"ip": host, "port": self.red_pitaya.port},
+            "afg": {"ip": host, "resource": f"TCPIP0::{host}::{self.afg.port}::SOCKET",
+                    "visa_library": "@py"},
+        }
+
+
+def _serve_lab(conn, options):
+    """Child process of SimLabProcess: runs a SimLab and answers requests on conn."""
+    with SimLab(**options) as lab:
+        conn.send(lab.device_config())
+        while True:
+            request = conn.recv()
+            if request == "stats":
+                conn.send(lab.stats())
+            else:
+                break
+    conn.close()
+
+
+class SimLabProcess:
+    """
+    A SimLab running in a child process.
+
+    The simulated instruments then do not share the GIL nor the CPU time accounting
+    of the process under test, which matters when measuring driver throughput.
+    """
+
+    def __init__(self, **options):
+        """
+        Args:
+            **options: Keyword arguments of SimLab (picklable: latency, latency_scale, seed).
+        """
+        self.options = options
+        self._conn = None
+        self._process = None
+        self._config = None
+
+    def start(self):
+        """Starts the child process and waits for its servers. Returns self."""
+        if self._process is not None:
+            return self
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve_lab, args=(child, self.options),
+                                                name="SimLabProcess", daemon=True)
+        self._process.start()
+        self._config = self._conn.recv()
+        return self
+
+    def device_config(self):
+        """Driver arguments pointing at the simulated instruments (see SimLab.device_config)."""
+        return self._config
+
+    def stats(self):
+        """Traffic counters of every instrument (see SimLab.stats)."""
+        self._conn.send("stats")
+        return self._conn.recv()
+
+    def stop(self):
+        """Stops the servers and the child process."""
+        if self._process is None:
+            return
+        self._conn.send("stop")
+        self._process.join(timeout=5)
+        self._conn.close()
+        self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
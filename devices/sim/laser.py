@@ -0,0 +1,111 @@
+"""
+Simulated Muquans Laser
+-----------------------
+Telnet server answering the sml780_tool commands used by MuquansLaser:
+
+    sml780_tool Enable_Current_Laser_Diode on|off
+    sml780_tool edfa_set <power>
+    sml780_tool edfa_shutdown
+
+Telnet option negotiation (IAC sequences) is stripped from the input. Each
+command is answered with one line followed by the shell prompt ("# " as on the
+controller, None for none). A prompt is also sent when a client connects.
+"""
+
+from devices.sim.server import LineServer
+
+IAC = 255
+SB, SE = 250, 240
+WILL, WONT, DO, DONT = 251, 252, 253, 254
+
+
+def strip_telnet(data: bytes) -> bytes:
+    """Removes Telnet IAC command sequences, keeping escaped 0xFF bytes."""
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        byte = data[i]
+        if byte != IAC:
+            out.append(byte)
+            i += 1
+            continue
+        if i + 1 >= len(data):
+            break
+        command = data[i + 1]
+        if command == IAC:
+            out.append(IAC)
+            i += 2
+        elif command in (WILL, WONT, DO, DONT):
+            i += 3
+        elif command == SB:
+            end = data.find(bytes([IAC, SE]), i + 2)
+            i = len(data) if end < 0 else end + 2
+        else:
+            i += 2
+    return bytes(out)
+
+
+class LaserServer(LineServer):
+    """
+    Muquans laser controller shell.
+    """
+
+    def __init__(self, world=None, latency=None, host="127.0.0.1", port=0, prompt="# "):
+        """
+        Args:
+            world (SimWorld): Shared physical state (seed and EDFA power).
+            latency (LatencyModel): Response time of each command.
+            prompt (str): Shell prompt sent after each response, None for no prompt.
+        """
+        super().__init__(latency=latency, host=host, port=port)
+        self.world = world
+        self.prompt = prompt
+        self.seed_on = False
+        self.edfa_power = 0.0
+
+    def greeting(self):
+        return self.prompt.encode() if self.prompt else b""
+
+    def filter_input(self, chunk):
+        return strip_telnet(chunk)
+
+    def handle_line(self, line):
+        line = line.strip()
+        if not line:
+            return None
+        self.latency.wait(line)
+        self.commands_served += 1
+        return self.execute(line.split())
+
+    def frame(self, response):
+        # The prompt follows the response line, without a terminator
+        return response + b"\r\n" + (self.prompt.encode() if self.prompt else b"")
+
+    def execute(self, words):
+        if len(words) < 2 or words[0] != "sml780_tool":
+            return f"sh: {words[0]}: not found"
+        command, args = words[1], words[2:]
+        if command == "Enable_Current_Laser_Diode" and args in (["on"], ["off"]):
+            self.seed_on = args[0] == "on"
+            self._update_world()
+            return f"Laser diode current {'enabled' if self.seed_on else 'disabled'}"
+        if command == "edfa_set" and len(args) == 1:
+            try:
+                power = float(args[0])
+            except ValueError:
+                return f"Error: invalid power '{args[0]}'"
+            if not 0.0 <= power <= 2.5:
+                return f"Error: power {power} out of range [0, 2.5]"
+            self.edfa_power = power
+            self._update_world()
+            return f"EDFA set to {power}"
+        if command == "edfa_shutdown" and not args:
+            self.edfa_power = 0.0
+            self._update_world()
+            return "EDFA shutdown"
+        return f"Error: unknown command '{' '.join(words[1:])}'"
+
+    def _update_world(self):
+        if self.world is not None:
+            self.world.seed_on = self.seed_on
+            self.world.edfa_power = self.edfa_power
@@ -0,0 +1,114 @@
+"""
+Latency Model
+-------------
+Per-command response times of the simulated instruments.
+
+Each command is matched against a table of prefixes (longest match wins) giving a
+mean and a jitter (standard deviation) in seconds. The delay is drawn from a normal
+distribution clipped at zero, so the simulators reproduce both the typical cost of
+a command and its spread.
+
+Example:
+    latency = LatencyModel(default=(2e-3, 0.5e-3), commands={"TRAC:DATA?": (25e-3, 5e-3)})
+    latency.wait("TRAC:DATA? TRACE1")  # sleeps ~25 ms
+"""
+
+import random
+import threading
+import time
+
+
+class LatencyModel:
+    """
+    Mean and jitter of the response time of each command of an instrument.
+    """
+
+    def __init__(self, default=(0.0, 0.0), commands=None, scale=1.0, seed=None):
+        """
+        Args:
+            default (tuple): (mean, jitter) in seconds for commands without a specific entry.
+            commands (dict): Command prefix -> (mean, jitter) in seconds. Prefixes are
+                compared case-insensitively with the command text, leading ':' removed.
+            scale (float): Factor applied to every delay (0 disables the latency).
+            seed (int): Seed of the jitter generator, for reproducible runs.
+        """
+        self.default = default
+        self.commands = {prefix.upper().lstrip(":"): value for prefix, value in (commands or {}).items()}
+        self.scale = scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Longest prefixes first so the most specific entry wins
+        self._prefixes = sorted(self.commands, key=len, reverse=True)
+
+    def lookup(self, command: str):
+        """
+        Returns the (mean, jitter) entry used for a command.
+        """
+        command = command.upper().lstrip(":")
+        for prefix in self._prefixes:
+            if command.startswith(prefix):
+                return self.commands[prefix]
+        return self.default
+
+    def sample(self, command: str) -> float:
+        """
+        Draws the delay of one execution of a command.
+
+        Returns:
+            float: Delay in seconds (>= 0).
+        """
+        mean, jitter = self.lookup(command)
+        if self.scale == 0 or (mean == 0 and jitter == 0):
+            return 0.0
+        with self._lock:
+            delay = self._random.gauss(mean, jitter) if jitter else mean
+        return max(0.0, delay * self.scale)
+
+    def wait(self, command: str) -> float:
+        """
+        Sleeps for one execution of a command.
+
+        Returns:
+            float: The delay applied in seconds.
+        """
+        delay = self.sample(command)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+def default_latency(scale=1.0, seed=None):
+    """
+    Typical response times of the lab instruments.
+
+    Args:
+        scale (float): Factor applied to every delay (0 disables the latency).
+        seed (int): Seed of the jitter generators.
+
+    Returns:
+        dict: LatencyModel per simulated instrument.
+    """
+    return {
+        # Embedded Linux shell tool behind Telnet
+        "laser": LatencyModel(default=(30e-3, 10e-3), scale=scale, seed=seed),
+        # Red Pitaya SCPI server: fast register writes, acquisition reads cost the transfer
+        "red_pitaya": LatencyModel(
+            default=(0.5e-3, 0.2e-3),
+            commands={"ACQ:SOUR": (5e-3, 1e-3), "*RST": (20e-3, 5e-3)},
+            scale=scale, seed=seed,
+        ),
+        # One HTTP request per reading, dominated by the wavemeter exposure
+        "wavemeter": LatencyModel(default=(15e-3, 5e-3), scale=scale, seed=seed),
+        "rigol": LatencyModel(
+            default=(3e-3, 1e-3),
+            commands={"TRAC:DATA?": (25e-3, 5e-3), "TRACE:DATA?": (25e-3, 5e-3), "*RST": (500e-3, 50e-3)},
+            scale=scale, seed=seed,
+        ),
+        "afg": LatencyModel(
+            default=(5e-3, 2e-3),
+            commands={"*RST": (200e-3, 20e-3), "TRAC": (50e-3, 10e-3)},
+            scale=scale, seed=seed,
+        ),
+        # USB serial link, per register
+        "synthhd": LatencyModel(default=(1e-3, 0.3e-3), scale=scale, seed=seed),
+    }
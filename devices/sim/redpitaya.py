@@ -0,0 +1,203 @@
+"""
+Simulated Red Pitaya
+--------------------
+SCPI server (port 5000 on the board) covering the generator and acquisition
+commands used by RedPitayaSignalGenerator and the vendor scpi client.
+
+Channel 2 drives the laser control voltage of the SimWorld through the x5 output
+amplifier, as in the lab. ACQ:SOURx:DATA? returns 16384 samples either as ASCII
+"{v,v,...}" or, with ACQ:DATA:FORMAT BIN, as an IEEE 488.2 block of big-endian
+float32 (VOLTS) or int16 (RAW) followed by the "\\r\\n" delimiter.
+
+Triggers fire as soon as they are armed (the trigger pulse runs continuously in the
+lab), and ACQ:TRIG:FILL? reports a full buffer once the post-trigger samples have been
+acquired at the configured decimation. The AWG_PE/AWG_NE sources are the exception:
+they wait for the next software trigger of the generator (SOURx:TRig:INT).
+
+An ARBITRARY burst on channel 2 is played in real time into the laser control
+voltage when triggered by SOUR2:TRig:INT, once, then its last level is held.
+External generator triggers are not simulated.
+"""
+
+import time
+
+import numpy as np
+
+from devices.sim.scpi import ScpiServer, block
+
+BUFFER_SIZE = 16384
+SAMPLE_RATE = 125e6
+AMPLIFIER_GAIN = 5.0  # Output amplifier between OUT2 and the laser controller
+RAW_FULL_SCALE = 8192  # 14-bit ADC counts per volt at LV gain
+
+
+class RedPitayaServer(ScpiServer):
+    """
+    Red Pitaya STEMlab SCPI server.
+    """
+
+    idn = "REDPITAYA,INSTR2020,0,2.00-SIM"
+    terminator = b"\r\n"
+
+    def setup(self):
+        for pattern, default in [
+            ("SOURce#:FUNCtion", "SINE"),
+            ("SOURce#:FREQuency:FIXed", "1000"),
+            ("SOURce#:VOLTage", "1"),
+            ("SOURce#:VOLTage:OFFSet", "0"),
+            ("SOURce#:PHASe", "0"),
+            ("SOURce#:DCYCle", "0.5"),
+            ("SOURce#:TRIGger:SOURce", "INT"),
+            ("SOURce#:BURSt:STATe", "CONTINUOUS"),
+            ("OUTPut#:STATe", "OFF"),
+        ]:
+            self.add_setting(pattern, default, on_change=self._output_changed)
+        for pattern, default in [
+            ("SOURce#:BURSt:NCYCles", "1"),
+            ("SOURce#:BURSt:NOR", "1"),
+            ("SOURce#:BURSt:INTerval:PERiod", "1"),
+        ]:
+            self.add_setting(pattern, default)
+        self.add_command("SOURce#:TRIGger:INTernal", lambda args, sfx: self._generator_trigger(sfx[0]))
+        self.add_command("SOURce#:TRACe:DATA:DATA", self._trace_data)
+
+        for pattern, default in [
+            ("ACQ:DEC", "1"),
+            ("ACQ:AVG", "ON"),
+            ("ACQ:TRIGger:LEVel", "0"),
+            ("ACQ:TRIGger:DLY", "0"),
+            ("ACQ:TRIGger:DLY:NS", "0"),
+            ("ACQ:TRIGger:EXT:LEVel", "1"),
+            ("ACQ:DATA:UNITS", "VOLTS"),
+            ("ACQ:DATA:FORMAT", "ASCII"),
+            ("ACQ:SOURce#:GAIN", "LV"),
+            ("ACQ:SOURce#:COUP", "DC"),
+        ]:
+            self.add_setting(pattern, default)
+        self.add_command("ACQ:START", lambda args, sfx: self._start())
+        self.add_command("ACQ:STOP", lambda args, sfx: self._stop())
+        self.add_command("ACQ:RST", lambda args, sfx: self._acq_reset())
+        self.add_command("ACQ:TRIGger", lambda args, sfx: self._trigger(args))
+        self.add_command("ACQ:TRIGger:STATe?", lambda args, sfx: "TD" if self.triggered else "WAIT")
+        self.add_command("ACQ:TRIGger:FILL?", lambda args, sfx: "1" if self._filled() else "0")
+        self.add_command("ACQ:BUF:SIZE?", lambda args, sfx: str(BUFFER_SIZE))
+        self.add_command("ACQ:SOURce#:DATA?", lambda args, sfx: self._data(sfx[0], 0, BUFFER_SIZE))
+        self.add_command("ACQ:SOURce#:DATA:STArt:END?", self._data_start_end)
+        self.add_command("ACQ:SOURce#:DATA:STArt:N?", self._data_start_n)
+        self.add_command("ACQ:SOURce#:DATA:OLD:N?", lambda args, sfx: self._data(sfx[0], 0, int(args)))
+        self.add_command("ACQ:SOURce#:DATA:LAT:N?", lambda args, sfx: self._data(sfx[0], BUFFER_SIZE - int(args), int(args)))
+        self.running = False
+        self.triggered = False
+        self.awg_armed = False  # Acquisition waiting for a generator trigger
+        self.fill_time = 0.0  # time.monotonic() at which the triggered buffer is full
+        self.buffers = {}
+        self.waveforms = {}  # Arbitrary waveform of each output, in units of the amplitude
+
+    def reset(self):
+        super().reset()
+        self._acq_reset()
+        self._output_changed(None)
+
+    def _output_changed(self, suffixes):
+        """Forwards the channel 2 DC level (after the amplifier) to the laser controller."""
+        if self.world is None:
+            return
+        func = self.get("SOURce#:FUNCtion", 2).upper()
+        on = self.get("OUTPut#:STATe", 2).upper() == "ON"
+        if on and func == "ARBITRARY":
+            return  # Driven by the playback started on the generator trigger
+        self.world.stop_control_waveform()
+        if not on or func not in ("DC", "DC_NEG"):
+            voltage = 0.0
+        else:
+            voltage = float(self.get("SOURce#:VOLTage", 2)) * AMPLIFIER_GAIN
+            if func == "DC_NEG":
+                voltage = -voltage
+        self.world.set_control_voltage(voltage)
+
+    def _trace_data(self, args, sfx):
+        self.waveforms[sfx[0]] = np.array([float(v) for v in args.split(",")])
+
+    def _generator_trigger(self, channel):
+        """SOURx:TRig:INT: starts an ARBITRARY burst and fires AWG acquisition triggers."""
+        burst = (self.get("SOURce#:FUNCtion", channel).upper() == "ARBITRARY"
+                 and self.get("SOURce#:BURSt:STATe", channel).upper() == "BURST"
+                 and self.get("OUTPut#:STATe", channel).upper() == "ON"
+                 and channel in self.waveforms)
+        if burst and channel == 2 and self.world is not None:
+            data = self.waveforms[channel]
+            levels = (data * self.get_float("SOURce#:VOLTage", 2) + self.get_float("SOURce#:VOLTage:OFFSet", 2)) \
+                * AMPLIFIER_GAIN
+            sample_time = 1.0 / (self.get_float("SOURce#:FREQuency:FIXed", 2) * len(data))
+            # One segment per run of equal samples
+            starts = np.flatnonzero(np.r_[True, np.diff(levels) != 0])
+            durations = np.diff(np.r_[starts, len(data)]) * sample_time
+            self.world.play_control_waveform(levels[starts], durations)
+        if self.awg_armed:
+            self.awg_armed = False
+            self._fire()
+
+    def _acq_reset(self):
+        self.running = False
+        self.triggered = False
+        self.awg_armed = False
+        self.buffers = {}
+
+    def _start(self):
+        self.running = True
+        self.triggered = False
+        self.awg_armed = False
+
+    def _stop(self):
+        self.running = False
+
+    def _trigger(self, args):
+        # Other trigger sources fire immediately: the trigger pulse runs continuously in the lab
+        if args.strip().upper().startswith("AWG"):
+            self.awg_armed = self.running
+            self.triggered = False
+        else:
+            self._fire()
+
+    def _fire(self):
+        if self.running:
+            self.triggered = True
+            # Samples after the trigger: half a buffer plus the trigger delay
+            decimation = int(float(self.get("ACQ:DEC")))
+            post = min(BUFFER_SIZE, BUFFER_SIZE // 2 + int(float(self.get("ACQ:TRIGger:DLY"))))
+            self.fill_time = time.monotonic() + post * decimation / SAMPLE_RATE
+            self._capture()
+
+    def _filled(self):
+        return self.triggered and time.monotonic() >= self.fill_time
+
+    def _capture(self):
+        for channel in (1, 2):
+            if self.world is not None and channel == 1:
+                data = self.world.absorption_signal(BUFFER_SIZE)
+            else:
+                data = np.zeros(BUFFER_SIZE, dtype=np.float32)
+            self.buffers[channel] = data
+
+    def _data_start_end(self, args, sfx):
+        start, end = (int(x) for x in args.split(","))
+        return self._data(sfx[0], start, end - start + 1)
+
+    def _data_start_n(self, args, sfx):
+        start, n = (int(x) for x in args.split(","))
+        return self._data(sfx[0], start, n)
+
+    def _data(self, channel, start, n):
+        if channel not in self.buffers:
+            self._capture()
+        data = np.roll(self.buffers[channel], -start)[:n]
+        units = self.get("ACQ:DATA:UNITS").upper()
+        if self.get("ACQ:DATA:FORMAT").upper() == "BIN":
+            if units == "RAW":
+                payload = np.round(data * RAW_FULL_SCALE).astype(">i2").tobytes()
+            else:
+                payload = data.astype(">f4").tobytes()
+            return block(payload)
+        if units == "RAW":
+            return "{" + ",".join(str(int(round(v * RAW_FULL_SCALE))) for v in data) + "}"
+        return "{" + ",".join(f"{v:.6f}" for v in data) + "}"
@@ -0,0 +1,70 @@
+"""
+Simulated Rigol DSA800
+----------------------
+SCPI socket server (port 5555 on the analyzer) for the commands used by RigolSA.
+
+:INITiate:IMMediate starts a sweep lasting the sweep time; :TRACe:DATA? waits for
+the running sweep, *OPC sets the ESR Operation Complete bit when it ends. Traces
+have 601 points, sent as "#9<length>v1, v2, ..." in ASCii format or as a
+REAL,32 block (byte order set by :FORMat:BORDer) followed by a newline.
+"""
+
+import time
+
+import numpy as np
+
+from devices.sim.scpi import ScpiServer, block
+
+TRACE_POINTS = 601
+
+
+class RigolServer(ScpiServer):
+    """
+    Rigol DSA815 spectrum analyzer.
+    """
+
+    idn = "Rigol Technologies,DSA815,DSA8A000000001,00.01.19.00.02"
+
+    def setup(self):
+        for pattern, default in [
+            ("[:SENSe]:FREQuency:CENTer", "750000000"),
+            ("[:SENSe]:FREQuency:SPAN", "1500000000"),
+            ("[:SENSe]:BANDwidth[:RESolution]", "1000000"),
+            ("[:SENSe]:BANDwidth:VIDeo", "1000000"),
+            ("[:SENSe]:SWEep:TIME", "0.1"),
+            ("TRIGger[:SEQuence]:SOURce", "IMMediate"),
+            ("TRIGger[:SEQuence]:EXTernal:SLOPe", "POSitive"),
+            ("INITiate:CONTinuous", "ON"),
+            ("FORMat[:TRACe][:DATA]", "ASCii"),
+            ("FORMat:BORDer", "NORMal"),
+        ]:
+            self.add_setting(pattern, default)
+        self.add_command("INITiate[:IMMediate]", lambda args, sfx: self._start_sweep())
+        self.add_command("[:SENSe]:FREQuency:STARt?", lambda args, sfx: repr(self._start_stop()[0]))
+        self.add_command("[:SENSe]:FREQuency:STOP?", lambda args, sfx: repr(self._start_stop()[1]))
+        self.add_command("TRACe[:DATA]?", lambda args, sfx: self._trace())
+        self.sweeps = 0
+
+    def _start_stop(self):
+        center = self.get_float("[:SENSe]:FREQuency:CENTer")
+        span = self.get_float("[:SENSe]:FREQuency:SPAN")
+        return center - span / 2, center + span / 2
+
+    def _start_sweep(self):
+        self.wait_complete()  # A new sweep starts after the running one
+        self.busy_until = time.perf_counter() + self.get_float("[:SENSe]:SWEep:TIME")
+        self.sweeps += 1
+
+    def _trace(self):
+        self.wait_complete()
+        zero_span = self.get_float("[:SENSe]:FREQuency:SPAN") == 0
+        if self.world is not None:
+            trace = self.world.sa_trace(TRACE_POINTS, zero_span=zero_span)
+        else:
+            trace = np.full(TRACE_POINTS, -90.0, dtype=np.float32)
+        if self.get("FORMat[:TRACe][:DATA]").upper().startswith("REAL"):
+            dtype = ">f4" if self.get("FORMat:BORDer").upper().startswith("NORM") else "<f4"
+            return block(trace.astype(dtype).tobytes())
+        text = ", ".join(f"{v:.6e}" for v in trace)
+        # ASCii traces also carry the "#9<length>" header, followed by a space
+        return f"#9{len(text) + 1:09d} {text}"
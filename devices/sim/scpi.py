@@ -0,0 +1,307 @@
+"""
+Simulated SCPI Instrument
+-------------------------
+Minimal SCPI parser and server used by the simulated Red Pitaya, Rigol SA and
+Tektronix AFG.
+
+Commands are declared with their mixed-case long form, e.g.
+"[:SENSe]:FREQuency:CENTer" or "SOURce#:VOLTage:OFFSet": upper-case letters give
+the short form, brackets mark optional nodes and '#' a numeric suffix (1 if
+omitted). A message may hold several ';'-separated commands; a command without a
+leading ':' continues the header path of the previous one, as in IEEE 488.2.
+Query responses of one message are joined with ';' on a single line.
+
+Unknown headers push '-113,"Undefined header"' on the error queue and set the
+error bits of *ESR? and *STB?, so drivers checking errors behave as on the real
+instruments.
+
+Arguments may hold IEEE 488.2 definite length blocks ("#<n><length><data>", e.g. a
+waveform upload): their bytes are passed through untouched (decoded as latin-1) and
+never taken for separators or terminators.
+"""
+
+import re
+import threading
+import time
+
+from devices.sim.server import LineServer
+
+_NODE = re.compile(r"^([A-Za-z_*]+?)(\d*)$")
+
+
+def _separators(text, separator):
+    """
+    Positions of separator outside definite length blocks.
+
+    Returns:
+        tuple or None: (positions, end of the last block or 0), None if text ends
+            inside a block.
+    """
+    positions = []
+    block_end = 0
+    index = 0
+    while True:
+        mark = text.find("#", index)
+        stop = len(text) if mark < 0 else mark
+        position = text.find(separator, index, stop)
+        while position >= 0:
+            positions.append(position)
+            position = text.find(separator, position + 1, stop)
+        if mark < 0:
+            return positions, block_end
+        if mark + 1 >= len(text):
+            return None  # Cannot tell yet whether a block starts here
+        digits = text[mark + 1]
+        if not digits.isdigit() or digits == "0":
+            index = mark + 1
+            continue
+        header_end = mark + 2 + int(digits)
+        if header_end > len(text):
+            return None
+        length = text[mark + 2:header_end]
+        if not length.isdigit():
+            index = mark + 1
+            continue
+        index = block_end = header_end + int(length)
+        if index > len(text):
+            return None
+
+
+def _strip(command):
+    """Strips the surrounding whitespace of a command, not the bytes of a trailing block."""
+    command = command.lstrip()
+    found = _separators(command, ";")
+    block_end = found[1] if found is not None else len(command)
+    return command[:block_end] + command[block_end:].rstrip()
+
+
+class _Node:
+    def __init__(self, text):
+        self.optional = text.startswith("[")
+        text = text.strip("[]")
+        self.numeric = text.endswith("#")
+        text = text.rstrip("#")
+        self.long = text.upper()
+        self.short = "".join(c for c in text if not c.islower())
+
+    def match(self, name, suffix):
+        """Returns (matched, numeric suffix or None)."""
+        if name not in (self.short, self.long):
+            return False, None
+        if not self.numeric:
+            return not suffix, None
+        return True, int(suffix) if suffix else 1
+
+
+class ScpiCommand:
+    """A declared header with its handler."""
+
+    def __init__(self, pattern, handler):
+        self.pattern = pattern
+        self.query = pattern.endswith("?")
+        # Optional nodes are written "[:NODE]", split them keeping the brackets
+        nodes = re.findall(r"\[:?[^\]]+\]|[^:\[\]?]+", pattern.rstrip("?"))
+        self.nodes = [_Node(node.replace(":", "")) for node in nodes]
+        self.handler = handler
+
+    def match(self, parts, index=0, node=0, suffixes=()):
+        """Returns the numeric suffixes if the header parts match, None otherwise."""
+        if node == len(self.nodes):
+            return list(suffixes) if index == len(parts) else None
+        current = self.nodes[node]
+        if index < len(parts):
+            matched, value = current.match(*parts[index])
+            if matched:
+                found = self.match(parts, index + 1, node + 1, suffixes + ((value,) if current.numeric else ()))
+                if found is not None:
+                    return found
+        if current.optional:
+            return self.match(parts, index, node + 1, suffixes + ((1,) if current.numeric else ()))
+        return None
+
+
+class ScpiServer(LineServer):
+    """
+    SCPI instrument over a raw TCP socket. Subclasses declare their commands with
+    add_command() / add_setting() in setup().
+    """
+
+    idn = "SIM,INSTRUMENT,0,1.0"
+    encoding = "latin-1"  # One character per byte, so block data goes through unchanged
+
+    def __init__(self, world=None, latency=None, host="127.0.0.1", port=0):
+        """
+        Args:
+            world (SimWorld): Shared physical state.
+            latency (LatencyModel): Response time of each command.
+        """
+        super().__init__(latency=latency, host=host, port=port)
+        self.world = world
+        self._commands = []
+        self.settings = {}
+        self._defaults = {}
+        self.errors = []
+        self.esr = 0
+        self.busy_until = 0.0  # perf_counter() time at which pending operations end
+        self._opc_armed = False
+        self.lock = threading.RLock()  # One command at a time, like the instrument
+        self.add_command("*IDN?", lambda args, sfx: self.idn)
+        self.add_command("*RST", lambda args, sfx: self.reset())
+        self.add_command("*CLS", lambda args, sfx: self._clear_status())
+        self.add_command("*OPC", lambda args, sfx: self.operation_complete())
+        self.add_command("*OPC?", lambda args, sfx: self.wait_complete() or "1")
+        self.add_command("*ESR?", lambda args, sfx: str(self._read_esr()))
+        self.add_command("*STB?", lambda args, sfx: str(self.status_byte()))
+        self.add_command("*WAI", lambda args, sfx: self.wait_complete())
+        self.add_command("SYSTem:ERRor[:NEXT]?", lambda args, sfx: self._next_error())
+        self.add_command("SYSTem:ERRor:COUNt?", lambda args, sfx: str(len(self.errors)))
+        self.setup()
+
+    def setup(self):
+        """Declares the instrument commands."""
+
+    def add_command(self, pattern, handler):
+        """
+        Declares a command.
+
+        Args:
+            pattern (str): Mixed-case header, ending with '?' for a query.
+            handler (callable): handler(args, suffixes) returning the response string
+                (queries) or None.
+        """
+        self._commands.append(ScpiCommand(pattern, handler))
+
+    def add_setting(self, pattern, default, on_change=None):
+        """
+        Declares a setting with its set command and '?' query.
+
+        The value is stored per numeric suffix under settings[(pattern, *suffixes)].
+
+        Args:
+            pattern (str): Mixed-case header of the setting.
+            default (str): Value after *RST.
+            on_change (callable): Called as on_change(suffixes) after each write.
+        """
+        def write(args, suffixes):
+            self.settings[(pattern,) + tuple(suffixes)] = args.strip()
+            if on_change is not None:
+                on_change(suffixes)
+
+        def read(args, suffixes):
+            return self.get(pattern, *suffixes)
+
+        self._defaults[pattern] = default
+        self.add_command(pattern, write)
+        self.add_command(pattern + "?", read)
+
+    def get(self, pattern, *suffixes):
+        """Current value of a setting declared with add_setting()."""
+        return self.settings.get((pattern,) + tuple(suffixes), self._defaults[pattern])
+
+    def get_float(self, pattern, *suffixes):
+        return float(self.get(pattern, *suffixes))
+
+    def reset(self):
+        """*RST: restores every setting to its default."""
+        self.settings.clear()
+        self.busy_until = 0.0
+        self._opc_armed = False
+
+    def operation_complete(self):
+        """*OPC: arms the Operation Complete bit, set in *ESR? once pending operations end."""
+        self._opc_armed = True
+
+    def wait_complete(self):
+        """Blocks until pending operations (e.g. a sweep) are finished."""
+        remaining = self.busy_until - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def push_error(self, code, message):
+        self.errors.append(f'{code},"{message}"')
+        self.esr |= 0x20 if -199 <= code <= -100 else 0x10
+
+    def status_byte(self):
+        return (0x04 if self.errors else 0) | (0x20 if self.esr else 0)
+
+    def _read_esr(self):
+        if self._opc_armed and time.perf_counter() >= self.busy_until:
+            self._opc_armed = False
+            self.esr |= 0x01
+        esr, self.esr = self.esr, 0
+        return esr
+
+    def _clear_status(self):
+        self.errors.clear()
+        self.esr = 0
+
+    def _next_error(self):
+        return self.errors.pop(0) if self.errors else '0,"No error"'
+
+    def split_message(self, buffer):
+        """First complete message, whose blocks may contain newline bytes."""
+        text = bytes(buffer).decode(self.encoding)
+        found = _separators(text, "\n")
+        if found is None or not found[0]:
+            return None
+        end = found[0][0]
+        line = text[:end]
+        if line.endswith("\r") and len(line) > _separators(line, "\r")[1]:
+            line = line[:-1]
+        return line, end + 1
+
+    def handle_line(self, line):
+        responses = []
+        path = []
+        found = _separators(line, ";")
+        bounds = [-1] + (found[0] if found is not None else []) + [len(line)]
+        for start, end in zip(bounds, bounds[1:]):
+            command = _strip(line[start + 1:end])
+            if not command:
+                continue
+            header, _, args = command.partition(" ")
+            self.latency.wait(header)
+            if header.startswith(":"):
+                parts = header[1:].split(":")
+            elif header.startswith("*"):
+                parts = [header]
+            else:
+                # Relative header: continues the path of the previous command
+                parts = path + header.split(":")
+            if not header.startswith("*"):
+                path = parts[:-1]
+            with self.lock:
+                response = self.execute(parts, args)
+            self.commands_served += 1
+            if response is not None:
+                responses.append(response)
+        if not responses:
+            return None
+        if len(responses) == 1:
+            return responses[0]
+        return b";".join(r if isinstance(r, bytes) else r.encode() for r in responses)
+
+    def execute(self, parts, args):
+        """Runs one command given its header nodes and argument string."""
+        query = parts[-1].endswith("?")
+        split = []
+        for part in parts:
+            match = _NODE.match(part.rstrip("?"))
+            if match is None:
+                self.push_error(-113, "Undefined header")
+                return None
+            split.append((match.group(1).upper(), match.group(2)))
+        for command in self._commands:
+            if command.query != query:
+                continue
+            suffixes = command.match(split)
+            if suffixes is not None:
+                return command.handler(args, suffixes)
+        self.push_error(-113, "Undefined header")
+        return None
+
+
+def block(payload: bytes) -> bytes:
+    """Wraps a payload in an IEEE 488.2 definite length block "#<n><length><data>"."""
+    length = str(len(payload)).encode()
+    return b"#" + str(len(length)).encode() + length + payload
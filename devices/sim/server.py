@@ -0,0 +1,175 @@
+"""
+Simulated Servers
+-----------------
+TCP server plumbing shared by the simulated instruments.
+
+SimServer listens on localhost (an ephemeral port by default) and serves each client
+connection on its own thread, like the instruments which accept a connection and
+answer commands in order. LineServer adds the line framing used by the Telnet and
+SCPI protocols.
+"""
+
+import socket
+import threading
+
+from devices.sim.latency import LatencyModel
+
+
+class SimServer:
+    """
+    Threaded TCP server on localhost. Subclasses implement handle(conn).
+    """
+
+    def __init__(self, latency: LatencyModel = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            latency (LatencyModel): Response time of each command (no latency if None).
+            host (str): Listening address.
+            port (int): Listening port, 0 for an ephemeral port.
+        """
+        self.latency = latency or LatencyModel()
+        self.host = host
+        self.port = port
+        self._socket = None
+        self._thread = None
+        self._connections = set()
+        self._lock = threading.Lock()
+        self.commands_served = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def count(self, received=0, sent=0):
+        """Adds to the traffic counters (called from the connection threads)."""
+        with self._lock:
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def stats(self):
+        """Commands served and bytes moved since the server started."""
+        return {"commands": self.commands_served, "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent}
+
+    @property
+    def address(self):
+        """(host, port) the server listens on."""
+        return self.host, self.port
+
+    def start(self):
+        """Starts listening. Returns the server for chaining."""
+        if self._socket is not None:
+            return self
+        self._socket = socket.create_server((self.host, self.port))
+        self.port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, name=f"sim-{type(self).__name__}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops listening and closes the client connections."""
+        if self._socket is None:
+            return
+        self._socket.close()
+        self._socket = None
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+        self._thread.join(timeout=2)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _accept_loop(self):
+        listener = self._socket
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return  # Listener closed by stop()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._connections.add(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            self.handle(conn)
+        except OSError:
+            pass  # Client went away
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def handle(self, conn):
+        raise NotImplementedError
+
+
+class LineServer(SimServer):
+    """
+    Server for line-based protocols. Subclasses implement handle_line(line) and
+    return the response line (without terminator) or None.
+    """
+
+    terminator = b"\n"  # Appended to every response
+
+    def handle(self, conn):
+        greeting = self.greeting()
+        if greeting:
+            conn.sendall(greeting)
+            self.count(sent=len(greeting))
+        buffer = bytearray()
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                return
+            self.count(received=len(chunk))
+            buffer += self.filter_input(chunk)
+            while True:
+                message = self.split_message(buffer)
+                if message is None:
+                    break
+                line, consumed = message
+                del buffer[:consumed]
+                response = self.handle_line(line)
+                if response is not None:
+                    if isinstance(response, str):
+                        response = response.encode("utf-8")
+                    data = self.frame(response)
+                    conn.sendall(data)
+                    self.count(sent=len(data))
+
+    def split_message(self, buffer):
+        """
+        First complete line of the receive buffer.
+
+        Returns:
+            tuple or None: (line without terminator, bytes consumed), None while the
+                line is incomplete.
+        """
+        end = buffer.find(b"\n")
+        if end < 0:
+            return None
+        return bytes(buffer[:end]).rstrip(b"\r").decode("utf-8", errors="replace"), end + 1
+
+    def greeting(self) -> bytes:
+        """Bytes sent when a client connects (e.g. a shell prompt), none by default."""
+        return b""
+
+    def frame(self, response: bytes) -> bytes:
+        """Bytes sent for a response, by default the response and the terminator."""
+        return response + self.terminator
+
+    def filter_input(self, chunk: bytes) -> bytes:
+        """Hook to strip protocol bytes (e.g. Telnet negotiation) before framing."""
+        return chunk
+
+    def handle_line(self, line: str):
+        raise NotImplementedError
@@ -0,0 +1,193 @@
+"""
+Simulated Windfreak SynthHD
+---------------------------
+Fake serial port implementing the SynthHD `API` table of temp.synth_hd.
+
+The server listens on TCP and is opened by SerialDevice through a pyserial
+"socket://127.0.0.1:<port>" URL. As on the device, commands have no terminator and
+may be concatenated in one write ("C0f1000.0W5.0h1"): each command is a register
+letter followed by a value (write) or '?' (query). Per-channel registers are
+stored for the channel selected with 'C'. Queries are answered with the value
+followed by "\\n".
+"""
+
+import re
+import select
+
+from devices.sim.server import SimServer
+from temp.synth_hd import SynthHD
+
+# Identification answers of a SynthHD v2
+FIXED_ANSWERS = {
+    "v0": "Firmware Version 3.22",
+    "v1": "Hardware Version 2.06",
+    "v2": "HD",
+    "+": "WFT SynthHD 2.06",
+    "-": "1234",
+    "V": "1",
+    "p": "1",
+    "z": "32.5",
+}
+
+# Registers that take no argument: identification queries and actions
+NO_ARGUMENT = {"+", "-", "V", "p", "z", "e", "G"}
+
+_NUMBER = re.compile(rb"[-+]?[0-9]*\.?[0-9]*")
+
+
+def _letter(template):
+    return None if template is None else template[0]
+
+
+# Register letter -> API attribute, and which registers are held per channel
+REGISTERS = {}
+CHANNEL_REGISTERS = set()
+for _name, (_dtype, _write, _read) in SynthHD.API.items():
+    _key = _letter(_write) or (_read[0] if _read else None)
+    if _key is None or _key in ("v", "@", "L"):
+        continue
+    REGISTERS.setdefault(_key, _name)
+    if _name in SynthHD.CHANNEL_ATTRIBUTES:
+        CHANNEL_REGISTERS.add(_key)
+CHANNEL_REGISTERS.add("@")  # AM lookup table rows
+TABLE_REGISTERS = ("@", "L")  # AM lookup and sweep tables, the row index follows the letter
+
+DEFAULTS = {
+    "f": "1000.00000000", "W": "0.000", "Z": "3", "a": "0", "~": "0.000",
+    "h": "0", "r": "1", "E": "1", "x": "1", "w": "0", "*": "27.00000000",
+    "i": "100000.0", "l": "1000.00000000", "u": "5000.00000000", "s": "1.00000000",
+    "t": "1.000", "[": "0.000", "]": "0.000", "^": "1", "k": "0.00000000", "n": "0",
+    "X": "0", "g": "0", "c": "0", "F": "1", "q": "100", "A": "0", "P": "1", "O": "10",
+    "R": "1", ":": "0", "j": "0", "D": "0", "<": "1000", ">": "100", ",": "100",
+    ";": "0", "/": "0",
+}
+
+
+def parse_commands(data: bytes, final: bool = False):
+    """
+    Splits a SynthHD command stream into (register, argument) pairs.
+
+    The argument is '?' for a query, the value string for a write, or '' for
+    registers without argument. The row index and column of the '@' and 'L' tables
+    are folded into the register (e.g. "L3f").
+
+    Args:
+        data (bytes): Received bytes.
+        final (bool): Treat a trailing value as complete. Otherwise the trailing
+            command is kept, since more digits may still arrive.
+
+    Returns:
+        tuple: (list of (register, argument), unparsed remaining bytes)
+    """
+    commands = []
+    i = 0
+    while i < len(data):
+        start = i
+        key = chr(data[i])
+        i += 1
+        if key.isspace():
+            continue
+        if key in NO_ARGUMENT:
+            commands.append((key, ""))
+            continue
+        if key == "v":
+            if i >= len(data):
+                return commands, data[start:]
+            commands.append((key + chr(data[i]), "?"))
+            i += 1
+            continue
+        if key in TABLE_REGISTERS:
+            row = _NUMBER.match(data, i).group()
+            i += len(row)
+            if i >= len(data):
+                return commands, data[start:]
+            column = chr(data[i])  # 'a' amplitude, 'f' frequency (sweep table only)
+            i += 1
+            key = f"{key}{int(row or 0)}" if key == "@" else f"{key}{int(row or 0)}{column}"
+        if i < len(data) and data[i:i + 1] == b"?":
+            commands.append((key, "?"))
+            i += 1
+            continue
+        value = _NUMBER.match(data, i).group()
+        i += len(value)
+        if i >= len(data) and not final:
+            return commands, data[start:]
+        commands.append((key, value.decode()))
+    return commands, b""
+
+
+class SynthHDServer(SimServer):
+    """
+    Windfreak SynthHD on a fake serial port.
+    """
+
+    def __init__(self, latency=None, host="127.0.0.1", port=0, settle=0.005):
+        """
+        Args:
+            latency (LatencyModel): Response time of each register access.
+            settle (float): Time to wait for the rest of a value split across writes (s).
+        """
+        super().__init__(latency=latency, host=host, port=port)
+        self.settle = settle
+        self.channel = 0
+        self.registers = {}
+
+    @property
+    def url(self):
+        """pyserial URL to pass as the SynthHD device path."""
+        return f"socket://{self.host}:{self.port}"
+
+    def value(self, key, channel=None):
+        """Current value of a register (per-channel registers use channel, default selected)."""
+        if key.startswith(TABLE_REGISTERS) or key in CHANNEL_REGISTERS:
+            key = (self.channel if channel is None else channel, key)
+        return self.registers.get(key, DEFAULTS.get(key[1] if isinstance(key, tuple) else key, "0"))
+
+    def sweep_table(self, channel=None):
+        """Programmed sweep table rows as (MHz, dBm), up to the first zero frequency."""
+        rows = []
+        for row in range(100):
+            frequency = float(self.value(f"L{row}f", channel))
+            if frequency == 0:
+                break
+            rows.append((frequency, float(self.value(f"L{row}a", channel))))
+        return rows
+
+    def handle(self, conn):
+        buffer = b""
+        while True:
+            # A value at the end of a packet may continue in the next one
+            if buffer and not select.select([conn], [], [], self.settle)[0]:
+                commands, buffer = parse_commands(buffer, final=True)
+            else:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    return
+                self.count(received=len(chunk))
+                commands, buffer = parse_commands(buffer + chunk)
+            responses = [self.execute(key, arg) for key, arg in commands]
+            out = b"".join(r.encode() + b"\n" for r in responses if r is not None)
+            if out:
+                conn.sendall(out)
+                self.count(sent=len(out))
+
+    def execute(self, key, arg):
+        """Runs one register access. Returns the answer of a query, None otherwise."""
+        self.latency.wait(key)
+        self.commands_served += 1
+        if key in FIXED_ANSWERS:
+            return FIXED_ANSWERS[key]
+        if key in ("e", "G"):
+            return None
+        if key == "C":
+            if arg == "?":
+                return str(self.channel)
+            self.channel = int(float(arg)) if arg else 0
+            return None
+        store = (self.channel, key) if key.startswith(TABLE_REGISTERS) or key in CHANNEL_REGISTERS else key
+        if arg == "?":
+            return self.value(key)
+        if key not in REGISTERS and not key.startswith(TABLE_REGISTERS):
+            return None  # The device ignores unknown registers
+        self.registers[store] = arg
+        return None
@@ -0,0 +1,128 @@
+"""
+Simulated Wavemeter
+-------------------
+HTTP/1.1 server (keep-alive) exposing the wavemeter API used by Wavemeter:
+
+    GET /api/freq/<channel>  ->  JSON number, frequency in GHz
+
+As on the real API, -3000 means underexposed, -4000 overexposed and 0 no signal on
+the channel. A code can be forced with force_code() to exercise the error paths.
+"""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from devices.sim.latency import LatencyModel
+from devices.sim.world import OVEREXPOSED, UNDEREXPOSED
+
+_FREQ_PATH = re.compile(r"^/api/freq/(\d+)$")
+
+
+class WavemeterServer:
+    """
+    Wavemeter HTTP API.
+    """
+
+    def __init__(self, world=None, latency=None, host="127.0.0.1", port=0):
+        """
+        Args:
+            world (SimWorld): Shared physical state (laser frequency).
+            latency (LatencyModel): Response time of each request.
+        """
+        self.world = world
+        self.latency = latency or LatencyModel()
+        self.host = host
+        self.port = port
+        self.commands_served = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.host, self.port
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def count(self, received=0, sent=0):
+        """Adds to the traffic counters (called from the request threads)."""
+        with self._lock:
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def stats(self):
+        """Requests served and bytes moved since the server started."""
+        return {"commands": self.commands_served, "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent}
+
+    def force_code(self, code=None):
+        """
+        Forces the answer of every channel, e.g. UNDEREXPOSED or OVEREXPOSED.
+        None restores normal readings.
+        """
+        if code not in (None, UNDEREXPOSED, OVEREXPOSED, 0.0):
+            raise ValueError("Code must be None, -3000, -4000 or 0.")
+        self.world.wavemeter_code = code
+
+    def start(self):
+        """Starts serving. Returns the server for chaining."""
+        if self._httpd is not None:
+            return self
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep the connection open between readings
+            disable_nagle_algorithm = True  # Headers and body are separate writes
+
+            def do_GET(self):
+                server.count(received=len(self.raw_requestline) + len(bytes(self.headers)))
+                server.latency.wait(self.path)
+                server.commands_served += 1
+                match = _FREQ_PATH.match(self.path)
+                if match is None:
+                    self._reply(404, {"error": "not found"})
+                    return
+                channel = int(match.group(1))
+                value = server.world.read_wavemeter(channel) if server.world is not None else 0.0
+                self._reply(200, float(value))
+
+            def _reply(self, status, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                sent = sum(len(line) for line in self._headers_buffer)
+                self.end_headers()
+                self.wfile.write(body)
+                server.count(sent=sent + len(body))
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="sim-WavemeterServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving."""
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._httpd = None
+        self._thread.join(timeout=2)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,164 @@
+"""
+Simulated World
+---------------
+Physical state shared by the simulated instruments.
+
+The signal generator (Red Pitaya or AFG) drives the laser frequency control voltage,
+the laser follows it with a first-order settling, the wavemeter reads the laser
+frequency and the spectrum analyzer sees a beat note whose position depends on the
+laser detuning. Keeping this in one object lets an offline run exercise the same
+causal chain as the lab: change the voltage, wait for the laser, then measure.
+"""
+
+import math
+import threading
+import time
+
+import numpy as np
+
+UNDEREXPOSED = -3000.0
+OVEREXPOSED = -4000.0
+
+
+class SimWorld:
+    """
+    Laser frequency model and measurement signals of the simulated lab.
+    """
+
+    def __init__(self, f0=384228.0, tuning=-1.2, curvature=0.05, settle_time=0.2,
+                 wavemeter_noise=5e-4, seed=None):
+        """
+        Args:
+            f0 (float): Laser frequency at 0 V control voltage (GHz).
+            tuning (float): Linear tuning coefficient (GHz/V).
+            curvature (float): Quadratic tuning coefficient (GHz/V^2).
+            settle_time (float): Time constant of the laser frequency after a voltage step (s).
+            wavemeter_noise (float): Standard deviation of the wavemeter readings (GHz).
+            seed (int): Seed of the noise generator.
+        """
+        self.f0 = f0
+        self.tuning = tuning
+        self.curvature = curvature
+        self.settle_time = settle_time
+        self.wavemeter_noise = wavemeter_noise
+        self.rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+        self.seed_on = False
+        self.edfa_power = 0.0
+        self.wavemeter_code = None  # Forced wavemeter answer (e.g. UNDEREXPOSED), None for normal
+        self._voltage = 0.0
+        self._start_frequency = self.static_frequency(0.0)
+        self._step_time = time.perf_counter()
+        self._playback = None  # (stop event, thread) of the waveform being played
+
+    def static_frequency(self, voltage: float) -> float:
+        """
+        Settled laser frequency for a control voltage (GHz).
+        """
+        return self.f0 + self.tuning * voltage + self.curvature * voltage ** 2
+
+    @property
+    def control_voltage(self) -> float:
+        return self._voltage
+
+    def set_control_voltage(self, voltage: float):
+        """
+        Applies a new control voltage. The laser starts relaxing from where it is now.
+        """
+        with self._lock:
+            if voltage == self._voltage:
+                return
+            now = time.perf_counter()
+            self._start_frequency = self._frequency_at(now)
+            self._voltage = voltage
+            self._step_time = now
+
+    def play_control_waveform(self, voltages, durations):
+        """
+        Plays a piecewise constant control voltage in the background, like an
+        arbitrary waveform burst of the signal generator: voltages[i] is applied for
+        durations[i] seconds, then the last voltage is held. Replaces a running playback.
+        """
+        self.stop_control_waveform()
+        ends = time.perf_counter() + np.cumsum(durations)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._play, args=(np.asarray(voltages, dtype=float), ends, stop),
+                                  name="sim-waveform", daemon=True)
+        self._playback = (stop, thread)
+        thread.start()
+
+    def stop_control_waveform(self):
+        """Stops the waveform playback, if any. The current voltage is kept."""
+        if self._playback is not None:
+            stop, thread = self._playback
+            self._playback = None
+            stop.set()
+            thread.join()
+
+    def _play(self, voltages, ends, stop):
+        while True:
+            now = time.perf_counter()
+            # Segment containing now: late wake-ups skip the segments already over
+            index = int(np.searchsorted(ends, now, side="right"))
+            if index >= len(voltages):
+                self.set_control_voltage(float(voltages[-1]))
+                return
+            self.set_control_voltage(float(voltages[index]))
+            if stop.wait(ends[index] - now):
+                return
+
+    def _frequency_at(self, now: float) -> float:
+        target = self.static_frequency(self._voltage)
+        if self.settle_time <= 0:
+            return target
+        decay = math.exp(-(now - self._step_time) / self.settle_time)
+        return target + (self._start_frequency - target) * decay
+
+    def laser_frequency(self) -> float:
+        """
+        Current laser frequency (GHz), including the settling transient.
+        """
+        with self._lock:
+            return self._frequency_at(time.perf_counter())
+
+    def read_wavemeter(self, channel: int = 0) -> float:
+        """
+        Value returned by the wavemeter API for a channel.
+
+        Returns:
+            float: Frequency in GHz, UNDEREXPOSED/OVEREXPOSED codes, or 0.0 on a channel
+                without light.
+        """
+        if self.wavemeter_code is not None:
+            return self.wavemeter_code
+        if channel != 0:
+            return 0.0
+        if not self.seed_on:
+            return UNDEREXPOSED
+        return self.laser_frequency() + self.rng.normal(0.0, self.wavemeter_noise)
+
+    def sa_trace(self, n_points: int = 601, zero_span: bool = True) -> np.ndarray:
+        """
+        Spectrum analyzer trace in dBm.
+
+        The beat signal appears as a peak whose position along the trace follows the
+        laser detuning from f0, on top of a noise floor.
+        """
+        floor = -90.0 + self.rng.normal(0.0, 1.0, n_points)
+        if not self.seed_on:
+            return floor.astype(np.float32)
+        detuning = self.laser_frequency() - self.f0
+        center = (0.5 + detuning / 20.0) % 1.0 * (n_points - 1)
+        width = n_points / 40.0 if zero_span else n_points / 100.0
+        x = np.arange(n_points)
+        peak = 50.0 / (1.0 + ((x - center) / width) ** 2)
+        return (floor + peak).astype(np.float32)
+
+    def absorption_signal(self, n_samples: int = 16384) -> np.ndarray:
+        """
+        Saturated absorption photodiode voltage over one acquisition buffer (V).
+        """
+        t = np.linspace(0.0, 1.0, n_samples, endpoint=False)
+        signal = 0.5 - 0.2 * np.exp(-((t - 0.3) / 0.02) ** 2) - 0.1 * np.exp(-((t - 0.6) / 0.01) ** 2)
+        return (signal + self.rng.normal(0.0, 2e-3, n_samples)).astype(np.float32)
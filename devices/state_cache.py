@@ -0,0 +1,77 @@
+"""
+Write-through shadow state shared by the instrument drivers.
+
+Each driver keeps a StateCache holding the last value it wrote (or read back) for
+every instrument setting. A setter goes through apply(), which only sends the
+command when the requested value differs from the cached one, so reconfiguring
+between scan points costs as many writes as parameters actually changed.
+
+The cache only knows what went through the driver. Drivers invalidate it on
+connect/disconnect and reset, and invalidate_state() on a driver forgets everything
+(e.g. after the instrument was touched from its front panel).
+"""
+
+
+class StateCache:
+    """
+    Last known value of each instrument setting, keyed by any hashable key
+    (typically the SCPI header or the register name).
+    """
+
+    def __init__(self):
+        self._values = {}
+        self.sent = 0  # Writes actually sent through apply()
+        self.elided = 0  # Writes skipped because the value was already set
+
+    def apply(self, key, value, send):
+        """
+        Calls send() unless the setting already holds value.
+
+        If send() raises, the setting is forgotten since the instrument state is unknown.
+
+        Args:
+            key (hashable): Setting identifier.
+            value: Requested value (compared with ==).
+            send (callable): Performs the actual write.
+
+        Returns:
+            bool: True if the command was sent.
+        """
+        if self.matches(key, value):
+            self.elided += 1
+            return False
+        try:
+            send()
+        except BaseException:
+            self._values.pop(key, None)
+            raise
+        self._values[key] = value
+        self.sent += 1
+        return True
+
+    def matches(self, key, value):
+        """Returns True if the setting is known to hold value."""
+        return key in self._values and self._values[key] == value
+
+    def get(self, key, default=None):
+        """Returns the cached value of a setting, or default if unknown."""
+        return self._values.get(key, default)
+
+    def update(self, key, value):
+        """Records a value without sending anything (e.g. after a read back)."""
+        self._values[key] = value
+
+    def invalidate(self, *keys):
+        """
+        Forgets cached settings so the next write is always sent.
+
+        Args:
+            *keys: Settings to forget. With no argument, forgets everything.
+        """
+        if not keys:
+            self._values.clear()
+        for key in keys:
+            self._values.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._values
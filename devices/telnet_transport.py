@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import telnetlib3
+
+# Methods:
+# connect() - Opens the Telnet connection (starts the background event loop).
+# close() - Closes the connection and stops the event loop.
+# submit(command) - Queues a command, returns a Future of its response.
+# query(command) - Sends a command and waits for its response.
+# query_many(commands) - Queues several commands and returns their responses in order.
+
+
+class TelnetTransport:
+    """
+    Telnet client for line-oriented shells, built on telnetlib3.
+
+    The asyncio client runs on a background event loop thread; the blocking methods
+    are thin wrappers around it. A response is complete as soon as the shell prompt
+    is received (prompt mode) or, without a prompt, on the first line that is not
+    the echo of the command (terminator mode), so no fixed delay is needed.
+    Commands are executed one at a time in submission order, several can be queued.
+    """
+
+    def __init__(self, host: str, port: int = 23, timeout: float = 5, prompt: str = None,
+                 terminator: str = "\n"):
+        """
+        Args:
+            host (str): IP address of the Telnet server.
+            port (int): Telnet port (default: 23).
+            timeout (float): Connection and default response timeout in seconds.
+            prompt (str): Shell prompt ending each response (e.g. "# "). None to
+                complete responses on the terminator instead.
+            terminator (str): Line terminator appended to commands and ending response lines.
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.prompt = prompt
+        self.terminator = terminator
+        self._loop = None
+        self._thread = None
+        self._reader = None
+        self._writer = None
+        self._lock = None
+        self._buffer = ""
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    def connect(self):
+        """
+        Opens the connection. In prompt mode, also waits for the first prompt.
+
+        Raises:
+            OSError, TimeoutError: If the server cannot be reached.
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="telnet-transport",
+                                            daemon=True)
+            self._thread.start()
+        try:
+            self._run(self._open(), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """Closes the connection and stops the event loop thread."""
+        if self._loop is None:
+            return
+        if self._writer is not None:
+            self._loop.call_soon_threadsafe(self._writer.close)
+            self._writer = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=self.timeout)
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    def submit(self, command: str, timeout: float = None):
+        """
+        Queues a command without waiting for it.
+
+        Args:
+            command (str): Command line, without terminator.
+            timeout (float): Response timeout in seconds (default: the connection timeout).
+
+        Returns:
+            concurrent.futures.Future: Resolves to the response text (stripped).
+        """
+        if self._writer is None:
+            raise ConnectionError("Telnet transport is not connected.")
+        timeout = self.timeout if timeout is None else timeout
+        return asyncio.run_coroutine_threadsafe(self._query(command, timeout), self._loop)
+
+    def query(self, command: str, timeout: float = None):
+        """
+        Sends a command and waits for its response.
+
+        Returns:
+            str: Response text (stripped).
+        """
+        return self.submit(command, timeout).result()
+
+    def query_many(self, commands, timeout: float = None):
+        """
+        Queues all commands at once and waits for their responses.
+
+        Returns:
+            list: Response of each command, in order.
+        """
+        futures = [self.submit(command, timeout) for command in commands]
+        return [future.result() for future in futures]
+
+    def _run(self, coroutine, timeout):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    async def _open(self):
+        self._lock = asyncio.Lock()
+        self._buffer = ""
+        self._reader, self._writer = await asyncio.wait_for(
+            telnetlib3.open_connection(self.host, self.port, encoding="ascii", connect_minwait=0,
+                                       connect_maxwait=0.5),
+            self.timeout)
+        if self.prompt is not None:
+            await asyncio.wait_for(self._read_until_prompt(), self.timeout)
+
+    async def _query(self, command, timeout):
+        async with self._lock:
+            # Leftovers of an earlier response (e.g. a prompt in terminator mode) are stale
+            self._buffer = ""
+            self._writer.write(command + self.terminator)
+            if self.prompt is None:
+                return await asyncio.wait_for(self._read_response_line(command), timeout)
+            text = await asyncio.wait_for(self._read_until_prompt(), timeout)
+            lines = [line.strip() for line in text.splitlines()]
+            return "\n".join(line for line in lines if line and not line.endswith(command))
+
+    async def _fill(self):
+        chunk = await self._reader.read(4096)
+        if not chunk:
+            raise ConnectionError("Telnet connection closed by peer.")
+        self._buffer += chunk
+
+    async def _read_until_prompt(self):
+        while not self._buffer.endswith(self.prompt):
+            await self._fill()
+        text = self._buffer[:-len(self.prompt)]
+        self._buffer = ""
+        return text
+
+    async def _read_response_line(self, command):
+        while True:
+            index = self._buffer.find(self.terminator)
+            if index < 0:
+                await self._fill()
+                continue
+            line = self._buffer[:index].strip()
+            self._buffer = self._buffer[index + len(self.terminator):]
+            # Skip blank lines and the echo of the command
+            if line and not line.endswith(command):
+                return line
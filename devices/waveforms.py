@@ -0,0 +1,55 @@
+"""
+Arbitrary Waveforms
+-------------------
+Waveforms synthesized on the host and uploaded once to the arbitrary generator of
+the Red Pitaya or the AFG3000C, so a whole control voltage scan is played by the
+instrument clock instead of one SCPI exchange per point.
+
+A staircase holds each level for the same number of samples. The waveform length
+is rounded down to a multiple of the number of levels, so every step edge falls on
+a sample and the step timing is exact.
+"""
+
+import numpy as np
+
+
+def staircase_points(n_steps: int, max_points: int) -> int:
+    """
+    Waveform length giving every step the same number of samples.
+
+    Args:
+        n_steps (int): Number of levels.
+        max_points (int): Longest waveform accepted by the generator.
+
+    Returns:
+        int: Largest multiple of n_steps not above max_points.
+
+    Raises:
+        ValueError: If there are no levels or more levels than points.
+    """
+    if n_steps < 1 or n_steps > max_points:
+        raise ValueError(f"A staircase needs 1 to {max_points} levels, got {n_steps}.")
+    return (max_points // n_steps) * n_steps
+
+
+def staircase_waveform(levels, max_points: int, ramp: bool = False) -> np.ndarray:
+    """
+    Samples of a staircase (or ramp) through the given levels.
+
+    Args:
+        levels (array): Level of each step, in playback order.
+        max_points (int): Longest waveform accepted by the generator.
+        ramp (bool): Interpolate linearly from each level to the next instead of
+            holding it; the last level is reached at the start of the last step
+            and held.
+
+    Returns:
+        numpy.ndarray: staircase_points(len(levels), max_points) float samples.
+    """
+    levels = np.atleast_1d(np.asarray(levels, dtype=float))
+    n_points = staircase_points(len(levels), max_points)
+    per_step = n_points // len(levels)
+    if not ramp:
+        return np.repeat(levels, per_step)
+    position = np.arange(n_points) / per_step  # Sample position in steps
+    return np.interp(position, np.arange(len(levels)), levels)
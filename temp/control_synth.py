@@ -1,4 +1,74 @@
-from windfreak import SynthHD
+import json
+import numpy as np
+from temp.synth_hd import SynthHD
+
+
+class FrequencyPlan:
+    """
+    Ordered list of (frequency, power) points for a tabular SynthHD sweep.
+
+    Built from regions with their own step, so the table can be dense around the
+    expected resonances and sparse elsewhere. Points shared by overlapping regions
+    are kept once; the sweep runs in increasing frequency.
+    """
+
+    MAX_POINTS = 100  # Rows of the SynthHD sweep table
+
+    def __init__(self, frequencies, powers):
+        """
+        Args:
+            frequencies (array): Frequencies in Hz, in sweep order.
+            powers (array or float): Power of each point in dBm, or one for all points.
+        """
+        self.frequencies = np.asarray(frequencies, dtype=float).ravel()
+        self.powers = np.broadcast_to(np.asarray(powers, dtype=float), self.frequencies.shape).copy()
+        if not 0 < len(self.frequencies) <= self.MAX_POINTS:
+            raise ValueError(f"A frequency plan needs 1 to {self.MAX_POINTS} points, got {len(self.frequencies)}.")
+
+    @classmethod
+    def from_regions(cls, regions, power=0.0, resolution=1.0):
+        """
+        Builds a plan from frequency regions.
+
+        Args:
+            regions (list): (start, stop, step) or (start, stop, step, power) tuples in
+                Hz (and dBm). The stop frequency is included when it falls on a step.
+            power (float): Power in dBm of regions given without one.
+            resolution (float): Points closer than this (Hz) are merged, keeping the first region's power.
+
+        Returns:
+            FrequencyPlan: Points of all regions, sorted by frequency.
+        """
+        frequencies, powers = [], []
+        for region in regions:
+            start, stop, step = region[:3]
+            if step <= 0 or stop < start:
+                raise ValueError(f"Invalid region {region}: expected start <= stop and a positive step.")
+            points = start + step * np.arange(int(np.floor((stop - start) / step + 1e-9)) + 1)
+            frequencies.append(points)
+            powers.append(np.full(len(points), region[3] if len(region) > 3 else power, dtype=float))
+        frequencies = np.concatenate(frequencies)
+        powers = np.concatenate(powers)
+        order = np.argsort(frequencies, kind="stable")
+        frequencies, powers = frequencies[order], powers[order]
+        keep = np.concatenate(([True], np.diff(frequencies) >= resolution))
+        return cls(frequencies[keep], powers[keep])
+
+    def __len__(self):
+        return len(self.frequencies)
+
+    def duration(self, step_time):
+        """
+        Sweep time of the plan.
+
+        Args:
+            step_time (float): Time spent per point (s).
+
+        Returns:
+            float: Duration in seconds.
+        """
+        return len(self) * step_time
+
 
 class SynthHDController:
     """
@@ -6,14 +76,36 @@ class SynthHDController:
     following the structure of RFGenerator to be fully compatible with ExperimentController.
     """
 
-    def __init__(self, port="COM4"):
-        """Initialize the SynthHD and establish a connection."""
+    def __init__(self, port="COM4", auto_connect=True):
+        """
+        Initialize the SynthHD controller.
+
+        Args:
+            port (str): Serial port of the SynthHD.
+            auto_connect (bool): Open the serial connection immediately. Set to False to
+                defer it to connect(), e.g. for a concurrent bring-up.
+        """
+        self.port = port
+        self.synth = None
+        self.profiles = {}  # Named snapshots of the SynthHD settings
+        if auto_connect:
+            self.connect()
+
+    def connect(self):
+        """
+        Open the serial connection to the SynthHD.
+
+        Returns:
+            bool: True if the connection was established.
+        """
         try:
-            self.synth = SynthHD(port)
-            print(f"✅ SynthHD connected on {port}")
+            self.synth = SynthHD(self.port)
+            print(f"✅ SynthHD connected on {self.port}")
+            return True
         except Exception as e:
-            print(f"❌ Connection error with SynthHD on {port}: {e}")
+            print(f"❌ Connection error with SynthHD on {self.port}: {e}")
             self.synth = None
+            return False
 
     def configure_differential_sweep(self, f_low=750e6, f_high=3000e6, f_step=2e6, diff_freq=5e6, 
                                      power_ch0=8, power_ch1=5, step_time=1e-3, trigger_mode="full frequency sweep"):
@@ -41,41 +133,150 @@ class SynthHDController:
             f_step_mhz = f_step / 1e6
             diff_freq_mhz = diff_freq / 1e6
 
-            # 🔹 Configure Channel 0
-            self.synth.write("channel", 0)
-            self.synth.write("rf_enable", True)  # Enable RF Output
-            
-            try:
-                status = self.synth.read("rf_enable")  # Lire le statut RF
-                print(f"🔍 RF Output Status: {'ON' if status else 'OFF'}")
-            except Exception as e:
-                print(f"❌ Error reading RF output status: {e}")
-            self.synth.write("sweep_freq_low", f_low_mhz)
-            self.synth.write("sweep_freq_high", f_high_mhz)
-            self.synth.write("sweep_freq_step", f_step_mhz)
-            self.synth.write("sweep_power_low", power_ch0)
-            self.synth.write("sweep_power_high", power_ch0)
-            self.synth.write("sweep_time_step", step_time)  # ✅ Ensure step time is configured
-
-            # 🔹 Configure Channel 1
-            self.synth.write("channel", 1)
-            self.synth.write("sweep_freq_low", f_low_mhz)
-            self.synth.write("sweep_freq_high", f_high_mhz)
-            self.synth.write("sweep_freq_step", f_step_mhz)
-            self.synth.write("sweep_power_low", power_ch1)
-            self.synth.write("sweep_power_high", power_ch1)
-            self.synth.write("sweep_time_step", step_time)  # ✅ Apply step time to channel 1
-            # 🔹 Configure differential sweep
-            self.synth.write("sweep_diff_meth", 1)
-            self.synth.write("sweep_diff_freq", diff_freq_mhz)            
-            # 🔹 Activate the sweep
-            self.synth.write("trig_function", 1)            
-            self.synth.sweep_enable = False
+            # One serial write for the whole configuration, checked by a single query
+            with self.synth.batch():
+                # 🔹 Configure Channel 0
+                self.synth.write("channel", 0)
+                self.synth.write("rf_enable", True)  # Enable RF Output
+                self.synth.write("sweep_freq_low", f_low_mhz)
+                self.synth.write("sweep_freq_high", f_high_mhz)
+                self.synth.write("sweep_freq_step", f_step_mhz)
+                self.synth.write("sweep_power_low", power_ch0)
+                self.synth.write("sweep_power_high", power_ch0)
+                self.synth.write("sweep_type", 0)  # Linear, a table sweep may have been configured
+                self.synth.write("sweep_time_step", step_time * 1e3)  # ✅ Register in ms
+
+                # 🔹 Configure Channel 1
+                self.synth.write("channel", 1)
+                self.synth.write("sweep_freq_low", f_low_mhz)
+                self.synth.write("sweep_freq_high", f_high_mhz)
+                self.synth.write("sweep_freq_step", f_step_mhz)
+                self.synth.write("sweep_power_low", power_ch1)
+                self.synth.write("sweep_power_high", power_ch1)
+                self.synth.write("sweep_type", 0)  # Linear
+                self.synth.write("sweep_time_step", step_time * 1e3)  # ✅ Apply step time to channel 1 (ms)
+                # 🔹 Configure differential sweep
+                self.synth.write("sweep_diff_meth", 1)
+                self.synth.write("sweep_diff_freq", diff_freq_mhz)            
+                # 🔹 Activate the sweep
+                self.synth.write("trig_function", 1)            
+                self.synth.sweep_enable = False
             print(f"✅ SynthHD sweep activated: {f_low_mhz}-{f_high_mhz} MHz, Δf={diff_freq_mhz} MHz, Step time={step_time}s, P0={power_ch0} dBm, P1={power_ch1} dBm.")
 
         except Exception as e:
             print(f"❌ Error configuring SynthHD: {e}")
 
+    def configure_table_sweep(self, plan, diff_freq=5e6, power_ch1=None, step_time=1e-3):
+        """
+        Configure a tabular sweep through an arbitrary frequency plan, as an alternative
+        to the linear sweep of configure_differential_sweep.
+
+        Channel 0 sweeps the plan, channel 1 the same points shifted by diff_freq. The
+        whole configuration goes out in one serial write, and only the table rows that
+        changed since the last upload are sent.
+
+        Args:
+            plan (FrequencyPlan): Points of channel 0.
+            diff_freq (float): Frequency offset of channel 1 (Hz).
+            power_ch1 (float): Power level for channel 1 (dBm), default the plan powers.
+            step_time (float): Time spent per point (s).
+
+        Returns:
+            float: Sweep duration in seconds, None if not configured.
+        """
+        if not self.synth:
+            print("⚠️ SynthHD not connected, cannot configure.")
+            return None
+
+        try:
+            powers_ch1 = plan.powers if power_ch1 is None else power_ch1
+            channels = ((self.synth[0], plan.frequencies, plan.powers),
+                        (self.synth[1], plan.frequencies + diff_freq, powers_ch1))
+            with self.synth.batch():
+                for channel, frequencies, powers in channels:
+                    channel.write_sweep_table(frequencies, powers)
+                    channel.write("sweep_type", 1)  # Tabular
+                    channel.write("sweep_time_step", step_time * 1e3)  # Register in ms
+                    channel.write("rf_enable", True)
+                # Channel 1 has its own table, do not derive it from channel 0
+                self.synth.write("sweep_diff_meth", 0)
+                self.synth.write("trig_function", 1)
+                self.synth.sweep_enable = False
+            duration = plan.duration(step_time)
+            print(f"✅ SynthHD table sweep configured: {len(plan)} points, "
+                  f"{plan.frequencies[0] / 1e6}-{plan.frequencies[-1] / 1e6} MHz, Δf={diff_freq / 1e6} MHz, "
+                  f"Step time={step_time}s, Duration={duration:.2f}s.")
+            return duration
+
+        except Exception as e:
+            print(f"❌ Error configuring SynthHD table sweep: {e}")
+            return None
+
+    def save_profile(self, name, tables=True):
+        """
+        Capture the current SynthHD settings (both channels) as a named profile.
+
+        Args:
+            name (str): Profile name.
+            tables (bool): Include the sweep tables (needed for tabular sweeps).
+
+        Returns:
+            dict: The snapshot, None if not connected.
+        """
+        if not self.synth:
+            print("⚠️ SynthHD not connected, cannot take a snapshot.")
+            return None
+
+        try:
+            self.profiles[name] = self.synth.snapshot(tables=tables)
+            print(f"✅ SynthHD profile '{name}' saved.")
+            return self.profiles[name]
+        except Exception as e:
+            print(f"❌ Error reading SynthHD settings: {e}")
+            return None
+
+    def restore_profile(self, name, refresh=True):
+        """
+        Bring the SynthHD back to a named profile, writing only the settings that differ.
+
+        Args:
+            name (str): Profile name.
+            refresh (bool): Compare with a fresh read of the device rather than the
+                settings last written through this controller.
+
+        Returns:
+            int: Number of settings written, None on error.
+        """
+        if not self.synth:
+            print("⚠️ SynthHD not connected, cannot restore.")
+            return None
+        if name not in self.profiles:
+            print(f"⚠️ Unknown SynthHD profile '{name}'.")
+            return None
+
+        try:
+            changed = self.synth.restore(self.profiles[name], refresh=refresh)
+            print(f"✅ SynthHD profile '{name}' restored ({len(changed)} setting(s) changed).")
+            return len(changed)
+        except Exception as e:
+            print(f"❌ Error restoring SynthHD profile '{name}': {e}")
+            return None
+
+    def save_profiles(self, path):
+        """Write the profiles to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.profiles, f, indent=2)
+
+    def load_profiles(self, path):
+        """Add the profiles of a JSON file written by save_profiles()."""
+        with open(path) as f:
+            self.profiles.update(json.load(f))
+
+    def invalidate_state(self):
+        """Forget the cached SynthHD settings so the next configuration rewrites every register."""
+        if self.synth:
+            self.synth.invalidate_state()
+
     def shutdown(self):
         """Disable the sweep and properly close the connection."""
         if not self.synth:
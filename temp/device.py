@@ -1,11 +1,27 @@
-from serial import Serial
+import re
+import time
+from contextlib import contextmanager
+from serial import serial_for_url
+from devices import instrumentation
+from devices.state_cache import StateCache
+
+_VALUE = re.compile(r'[-+]?[0-9]*\.?[0-9]+')
 
 
 class SerialDevice:
 
+    # Write-only actions, or settings the device may change on its own, never elided
+    UNCACHED_ATTRIBUTES = frozenset()
+
+    # Device name in the I/O statistics (devices.instrumentation)
+    INSTRUMENT_NAME = 'serial'
+
     def __init__(self, devpath):
         self._devpath = devpath
         self._dev = None
+        self._batch = None  # Writes buffered by batch(), None outside a batch
+        self._batched = 0  # Writes issued in the current batch
+        self.state = StateCache()  # Last command sent for each setting
         self.open()
 
     def __del__(self):
@@ -14,42 +30,200 @@ class SerialDevice:
     def open(self):
         if self._dev is not None:
             raise RuntimeError('Device has already been opened.')
-        self._dev = Serial(port=self._devpath, timeout=10)
+        # Accepts a port name or a pyserial URL (e.g. 'socket://host:port')
+        self._dev = serial_for_url(self._devpath, timeout=10)
+        self.invalidate_state()
 
     def close(self):
         if self._dev is not None:
             self._dev.close()
             self._dev = None
+        self.invalidate_state()
+
+    def invalidate_state(self):
+        """Forget the cached settings so the next writes are always sent."""
+        self.state.invalidate()
+
+    def _state_key(self, attribute, args):
+        """Cache key of a setting write, or None if the write must always be sent.
+
+        Args:
+            attribute (str): API attribute
+            args (tuple): converted write arguments, the last one being the value
+
+        Returns:
+            tuple: key or None
+        """
+        if not args or attribute in self.UNCACHED_ATTRIBUTES:
+            return None
+        return (attribute,) + args[:-1]
 
     def write(self, attribute, *args):
+        data, key = self._format_write(attribute, args)
+        if key is None:
+            self._write(data)
+        else:
+            # Compare the formatted command so values equal at the device resolution are elided
+            self.state.apply(key, data, lambda: self._write(data))
+
+    def write_many(self, commands):
+        """Write several settings in a single serial write.
+
+        Settings already holding the requested value are left out, as with write().
+
+        Args:
+            commands (iterable): (attribute, *args) tuples, written in order
+
+        Returns:
+            int: number of commands sent
+        """
+        sent = self.state.sent
+        with self.batch(verify=False):
+            for attribute, *args in commands:
+                self.write(attribute, *args)
+        return self.state.sent - sent
+
+    @contextmanager
+    def batch(self, verify=True):
+        """Buffer the writes of the block and send them as one serial write.
+
+        The cache is updated as the writes are buffered, so settings repeated within
+        the block are sent once. A query inside the block first sends the writes
+        buffered so far. Nested blocks join the outer one.
+
+        Args:
+            verify (bool): follow the write, if anything was sent, with one query
+                checking that the device processed it (see _verify_batch)
+
+        Raises:
+            RuntimeError: if the verification fails
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = []
+        self._batched = 0
+        try:
+            yield
+            self._flush_batch()
+        except BaseException:
+            # Buffered writes were recorded in the cache but never sent
+            if self._batch:
+                self.invalidate_state()
+            raise
+        finally:
+            self._batch = None
+        if verify and self._batched:
+            self._verify_batch()
+
+    def _flush_batch(self):
+        """Send the writes buffered by batch() in a single serial write."""
+        pending, self._batch = self._batch, []
+        if not pending:
+            return
+        # Distinct command names, so a whole configuration is one statistics entry
+        command = ';'.join(dict.fromkeys(command for _, command in pending))
+        try:
+            self._send(''.join(data for data, _ in pending), command)
+        except BaseException:
+            # Unknown which part got through
+            self.invalidate_state()
+            raise
+
+    def _verify_batch(self):
+        """Check that the device processed a batch. The base device has no check."""
+
+    def _format_write(self, attribute, args):
+        """Command string and cache key of a setting write.
+
+        Returns:
+            tuple: (str, tuple or None)
+        """
         dtype, request, _ = self.API[attribute]
         dtype = dtype if isinstance(dtype, tuple) else (dtype,)
         if len(args) != len(dtype):
             raise ValueError('Number of arguments and data-types are not equal.')
-        args = ((int(ar) if dt is bool else dt(ar)) for dt, ar in zip(dtype, args))
-        self._write(request.format(*args))
+        args = tuple((int(ar) if dt is bool else dt(ar)) for dt, ar in zip(dtype, args))
+        return request.format(*args), self._state_key(attribute, args)
 
     def read(self, attribute, *args):
+        data, args = self._format_read(attribute, args)
+        value = self._convert(attribute, self._query(data))
+        self._record_read(attribute, args, value, self._state_key(attribute, args + (value,)))
+        return value
+
+    def read_many(self, requests):
+        """Read several settings with a single write and one pass over the answers.
+
+        Args:
+            requests (iterable): (attribute, *args) tuples
+
+        Returns:
+            list: values, in request order
+        """
+        requests = [(attribute, self._format_read(attribute, tuple(args))) for attribute, *args in requests]
+        answers = self._query_many([data for _, (data, _) in requests], len(requests))
+        values = []
+        for (attribute, (_, args)), answer in zip(requests, answers):
+            value = self._convert(attribute, answer)
+            self._record_read(attribute, args, value, self._state_key(attribute, args + (value,)))
+            values.append(value)
+        return values
+
+    def _format_read(self, attribute, args):
+        """Query string of a setting read and the converted arguments.
+
+        Returns:
+            tuple: (str, tuple)
+        """
         dtype, _, request = self.API[attribute]
         dtype = dtype if isinstance(dtype, tuple) else (dtype,)
         if len(args) + 1 != len(dtype):
             raise ValueError('Must have +1 more data-type than argument.')
-        args = ((int(ar) if dt is bool else dt(ar)) for dt, ar in zip(dtype, args))
-        ret = self._query(request.format(*args))
-        dtype = dtype[-1]
+        args = tuple((int(ar) if dt is bool else dt(ar)) for dt, ar in zip(dtype, args))
+        return request.format(*args), args
+
+    def _convert(self, attribute, ret):
+        """Value of an answer to a read of attribute."""
+        dtype = self.API[attribute][0]
+        dtype = dtype[-1] if isinstance(dtype, tuple) else dtype
         if dtype is bool:
             ret = int(ret)
             if ret not in (0, 1):
                 raise ValueError('Invalid return value \'{}\' for type bool.'.format(ret))
         return dtype(ret)
 
+    def _record_read(self, attribute, args, value, key):
+        """Record a value reported by the device in the cache, as if it had been written."""
+        write_request = self.API[attribute][1]
+        if write_request is not None and key is not None:
+            dtype = self.API[attribute][0]
+            dtype = dtype[-1] if isinstance(dtype, tuple) else dtype
+            self.state.update(key, write_request.format(*args, int(value) if dtype is bool else value))
+
     def _write(self, data):
-        """Write to device.
+        """Write to device, or buffer the write inside batch().
+
+        Args:
+            data (str): write data
+        """
+        if self._batch is not None:
+            self._batch.append((data, _VALUE.sub('', data)))
+            self._batched += 1
+        else:
+            self._send(data, _VALUE.sub('', data))
+
+    def _send(self, data, command):
+        """Write to the serial port.
 
         Args:
             data (str): write data
+            command (str): name in the I/O statistics
         """
-        self._dev.write(data.encode('utf-8'))
+        start = time.perf_counter_ns()
+        with instrumentation.record_failures(self.INSTRUMENT_NAME, 'write', command, start):
+            sent = self._dev.write(data.encode('utf-8'))
+        instrumentation.record(self.INSTRUMENT_NAME, 'write', command, start, sent=sent or len(data))
 
     def _read(self):
         """Read from device.
@@ -71,5 +245,36 @@ class SerialDevice:
         Returns:
             str: data
         """
-        self._write(data)
-        return self._read()
+        if self._batch:
+            self._flush_batch()
+        start = time.perf_counter_ns()
+        with instrumentation.record_failures(self.INSTRUMENT_NAME, 'query', _VALUE.sub('', data), start):
+            sent = self._dev.write(data.encode('utf-8'))
+            rdata = self._read()
+        instrumentation.record(self.INSTRUMENT_NAME, 'query', _VALUE.sub('', data), start,
+                               sent=sent or len(data), received=len(rdata) + 1)
+        return rdata
+
+    def _query_many(self, data, count, command=None):
+        """Write several commands at once and read the responses.
+
+        Args:
+            data (list): commands, queries and writes mixed, sent as one write
+            count (int): number of response lines expected
+            command (str): name in the I/O statistics, default the distinct commands
+
+        Returns:
+            list: response lines
+        """
+        if self._batch:
+            self._flush_batch()
+        if command is None:
+            command = ';'.join(dict.fromkeys(_VALUE.sub('', item) for item in data))
+        data = ''.join(data)
+        start = time.perf_counter_ns()
+        with instrumentation.record_failures(self.INSTRUMENT_NAME, 'query', command, start):
+            sent = self._dev.write(data.encode('utf-8'))
+            rdata = [self._read() for _ in range(count)]
+        instrumentation.record(self.INSTRUMENT_NAME, 'query', command, start,
+                               sent=sent or len(data), received=sum(len(line) + 1 for line in rdata))
+        return rdata
@@ -41,6 +41,54 @@ class SynthHDChannel:
         """Select channel."""
         self._parent.write('channel', self._index)
 
+    @property
+    def sweep_table_size(self):
+        """Number of rows in the tabular sweep table.
+
+        Returns:
+            int: rows
+        """
+        return 100
+
+    def write_sweep_table(self, frequencies, powers):
+        """Program the tabular sweep table in a single serial write.
+
+        Rows already holding the requested point are not sent again. A row with zero
+        frequency is written after the last point, where the device ends the sweep.
+
+        Args:
+            frequencies (iterable): frequencies in Hz, in sweep order
+            powers (iterable / float): power in dBm of each row, or one for all rows
+
+        Returns:
+            int: number of commands sent
+        """
+        frequencies = [float(f) for f in frequencies]
+        if isinstance(powers, (float, int)):
+            powers = [float(powers)] * len(frequencies)
+        powers = [float(p) for p in powers]
+        if len(powers) != len(frequencies):
+            raise ValueError('Expected one power per frequency.')
+        size = self.sweep_table_size
+        if not 0 < len(frequencies) <= size:
+            raise ValueError('Expected between 1 and {} rows.'.format(size))
+        f_range = self.frequency_range
+        if f_range is not None and not all(f_range['start'] <= f <= f_range['stop'] for f in frequencies):
+            raise ValueError('Expected frequencies in range [{}, {}] Hz.'.format(
+                             f_range['start'], f_range['stop']))
+        p_range = self.power_range
+        if p_range is not None and not all(p_range['start'] <= p <= p_range['stop'] for p in powers):
+            raise ValueError('Expected powers in range [{}, {}] dBm.'.format(
+                             p_range['start'], p_range['stop']))
+        commands = []
+        for row, (frequency, power) in enumerate(zip(frequencies, powers)):
+            commands.append(('sweep_table_freq', row, frequency / 1e6))
+            commands.append(('sweep_table_power', row, power))
+        if len(frequencies) < size:
+            commands.append(('sweep_table_freq', len(frequencies), 0.))
+        self.select()
+        return self._parent.write_many(commands)
+
     @property
     def frequency_range(self):
         """Frequency range in Hz.
@@ -369,6 +417,8 @@ class SynthHD(SerialDevice, Sequence):
         'sweep_diff_freq':  (float, 'k{:.8f}', 'k?'),  # Sweep differential frequency in MHz
         'sweep_diff_meth':  (int,   'n{}',     'n?'),  # Sweep differential method
         'sweep_type':       (int,   'X{}',     'X?'),  # Sweep type {0: linear, 1: tabular}
+        'sweep_table_freq': ((int, float), 'L{}f{:.8f}', 'L{}f?'),  # Program row in sweep table in MHz
+        'sweep_table_power': ((int, float), 'L{}a{:.3f}', 'L{}a?'),  # Program row in sweep table in dBm
         'sweep_single':     (bool,  'g{}',     'g?'),
         'sweep_cont':       (bool,  'c{}',     'c?'),
 
@@ -392,7 +442,44 @@ class SynthHD(SerialDevice, Sequence):
         'fm_cont':          (bool,  '/{}',     '/?'),
     }
 
+    INSTRUMENT_NAME = 'synthhd'
+
+    # Selecting a channel is tracked separately; phase and single sweep writes are actions;
+    # the continuous sweep/modulation registers are run state the triggers change on the device
+    UNCACHED_ATTRIBUTES = frozenset({'channel', 'phase_step', 'sweep_single',
+                                     'sweep_cont', 'am_cont', 'pulse_cont', 'fm_cont'})
+
+    # Registers held per channel, cached under the channel selected when written
+    CHANNEL_ATTRIBUTES = frozenset({
+        'frequency', 'power', 'temp_comp_mode', 'vga_dac', 'phase_step',
+        'rf_enable', 'pa_power_on', 'pll_power_on',
+        'sweep_freq_low', 'sweep_freq_high', 'sweep_freq_step', 'sweep_time_step',
+        'sweep_power_low', 'sweep_power_high', 'sweep_direction', 'sweep_type',
+        'sweep_table_freq', 'sweep_table_power',
+        'pulse_on_time', 'pulse_off_time', 'pulse_num_rep', 'pulse_invert',
+        'fm_frequency', 'fm_deviation', 'fm_num_samples', 'fm_mod_type',
+    })
+
+    # Left out of snapshots: derived from another setting, run state, or unknown table size
+    SNAPSHOT_EXCLUDED = frozenset({
+        'vga_dac', 'sweep_cont', 'am_cont', 'pulse_cont', 'fm_cont', 'am_lookup_table',
+    })
+
+    # Per-channel tables, one value per row
+    TABLE_ATTRIBUTES = ('sweep_table_freq', 'sweep_table_power')
+
+    # Writing the key changes these per-channel registers on the device as well
+    COUPLED_ATTRIBUTES = {
+        'power': ('vga_dac',),
+        'vga_dac': ('power',),
+        'sweep_cont': ('frequency', 'power', 'vga_dac'),
+        'sweep_single': ('frequency', 'power', 'vga_dac'),
+    }
+
     def __init__(self, devpath):
+        self._channel = None  # Channel selected through the driver, None if unknown
+        self._device_channel = None  # Channel selected on the device, None if unknown
+        self._per_channel = False  # The command being sent addresses the selected channel
         super().__init__(devpath)
         self._model = None
         self._model = self.model
@@ -408,6 +495,185 @@ class SynthHD(SerialDevice, Sequence):
     def __len__(self):
         return self._channels.__len__()
 
+    def write(self, attribute, *args):
+        if attribute == 'channel':
+            # The select command is only sent ahead of the next per-channel command
+            # that reaches the device, so selects around elided writes cost nothing
+            self._channel = int(args[0])
+            return
+        self._per_channel = attribute in self.CHANNEL_ATTRIBUTES
+        super().write(attribute, *args)
+        coupled = self.COUPLED_ATTRIBUTES.get(attribute, ())
+        if coupled:
+            # A per-channel write only affects the selected channel, a sweep affects both
+            channels = (self._channel,) if attribute in self.CHANNEL_ATTRIBUTES else range(2)
+            self.state.invalidate(*((ch, name) for ch in channels for name in coupled))
+
+    def read(self, attribute, *args):
+        self._per_channel = attribute in self.CHANNEL_ATTRIBUTES or attribute == 'channel'
+        value = super().read(attribute, *args)
+        if attribute == 'channel':
+            self._channel = self._device_channel = value
+        return value
+
+    def _write(self, data):
+        self._select_channel()
+        super()._write(data)
+
+    def _query(self, data):
+        self._select_channel()
+        return super()._query(data)
+
+    def _select_channel(self):
+        """Send the pending channel select before a per-channel command."""
+        if not self._per_channel or self._channel is None or self._channel == self._device_channel:
+            return
+        self._per_channel = False
+        self._device_channel = None  # Unknown until the select command has gone through
+        super()._write(self.API['channel'][1].format(self._channel))
+        self._device_channel = self._channel
+
+    def _verify_batch(self):
+        """Read the selected channel back: the answer comes once the whole batch has
+        been processed, and must match the channel the batch left selected."""
+        expected = self._channel
+        channel = self.read('channel')
+        if expected is not None and channel != expected:
+            self.invalidate_state()
+            raise RuntimeError('SynthHD batch verification failed: channel {} selected, '
+                               'expected {}.'.format(channel, expected))
+
+    def invalidate_state(self):
+        """Forget the cached settings and the channel selected on the device."""
+        self._device_channel = None
+        super().invalidate_state()
+
+    def _state_key(self, attribute, args):
+        if attribute in self.CHANNEL_ATTRIBUTES and self._channel is None:
+            return None
+        return self._setting_key(self._channel, attribute, args)
+
+    def _setting_key(self, channel, attribute, args):
+        """Cache key of a setting write on the given channel."""
+        key = super()._state_key(attribute, args)
+        if key is not None and attribute in self.CHANNEL_ATTRIBUTES:
+            key = (channel,) + key
+        return key
+
+    def read_many(self, requests):
+        requests = list(requests)
+        self._per_channel = any(request[0] in self.CHANNEL_ATTRIBUTES for request in requests)
+        return super().read_many(requests)
+
+    def _query_many(self, data, count, command=None):
+        self._select_channel()
+        return super()._query_many(data, count, command)
+
+    def snapshot_attributes(self):
+        """Settings captured by snapshot(): readable and writable registers, except
+        actions, derived settings and run state.
+
+        Returns:
+            tuple: (global attributes, per-channel attributes), lists of str
+        """
+        names = [name for name, (dtype, write, read) in self.API.items()
+                 if write is not None and read is not None and dtype != ()
+                 and name != 'channel' and name not in self.UNCACHED_ATTRIBUTES
+                 and name not in self.SNAPSHOT_EXCLUDED and name not in self.TABLE_ATTRIBUTES]
+        if 'v2' not in self.model:
+            names.remove('channelspacing')
+        return ([name for name in names if name not in self.CHANNEL_ATTRIBUTES],
+                [name for name in names if name in self.CHANNEL_ATTRIBUTES])
+
+    def snapshot(self, tables=True):
+        """Read all settings of the device and both channels in one pass.
+
+        Every query is sent in a single write, with the channel selects in between,
+        and the answers are read back in order. The values also refresh the cache.
+
+        Args:
+            tables (bool): include the sweep table rows
+
+        Returns:
+            dict: {'global': {attribute: value}, 'channels': [{attribute: value}, ...]},
+                table attributes hold a list with one value per row
+        """
+        global_names, channel_names = self.snapshot_attributes()
+        data, requests = [], []
+        for name in global_names:
+            data.append(self._format_read(name, ())[0])
+            requests.append((None, name, ()))
+        for channel in range(len(self)):
+            data.append(self.API['channel'][1].format(channel))
+            rows = [(name, ()) for name in channel_names]
+            if tables:
+                rows += [(name, (row,)) for row in range(self[channel].sweep_table_size)
+                         for name in self.TABLE_ATTRIBUTES]
+            for name, args in rows:
+                data.append(self._format_read(name, args)[0])
+                requests.append((channel, name, args))
+        self._device_channel = None  # Unknown until the answers are in
+        answers = super()._query_many(data, len(requests), 'snapshot')
+        self._device_channel = len(self) - 1
+
+        profile = {'global': {}, 'channels': [{} for _ in range(len(self))]}
+        for (channel, name, args), answer in zip(requests, answers):
+            value = self._convert(name, answer)
+            self._record_read(name, args, value, self._setting_key(channel, name, args + (value,)))
+            settings = profile['global'] if channel is None else profile['channels'][channel]
+            if args:
+                settings.setdefault(name, []).append(value)
+            else:
+                settings[name] = value
+        return profile
+
+    def diff(self, profile):
+        """Settings of a snapshot not known to be set on the device (see snapshot()).
+
+        Args:
+            profile (dict): snapshot
+
+        Returns:
+            list: (channel or None, attribute, args) tuples, args ending with the value
+        """
+        commands = [(None, name, (value,)) for name, value in profile['global'].items()]
+        for channel, settings in enumerate(profile['channels']):
+            for name, value in settings.items():
+                if name in self.TABLE_ATTRIBUTES:
+                    commands += [(channel, name, (row, item)) for row, item in enumerate(value)]
+                else:
+                    commands.append((channel, name, (value,)))
+        changed = []
+        for channel, name, args in commands:
+            data, _ = self._format_write(name, args)
+            _, converted = self._format_read(name, args[:-1])
+            if not self.state.matches(self._setting_key(channel, name, converted + (args[-1],)), data):
+                changed.append((channel, name, args))
+        return changed
+
+    def restore(self, profile, refresh=True):
+        """Apply a snapshot, sending only the settings that differ.
+
+        Args:
+            profile (dict): snapshot
+            refresh (bool): take a snapshot of the device first, so the difference is
+                computed against its live state rather than the cache
+
+        Returns:
+            list: settings sent, as returned by diff()
+        """
+        if refresh:
+            tables = any(name in settings for settings in profile['channels'] for name in self.TABLE_ATTRIBUTES)
+            self.snapshot(tables=tables)
+        changed = self.diff(profile)
+        with self.batch():
+            for channel, name, args in changed:
+                if channel is None:
+                    self.write(name, *args)
+                else:
+                    self[channel].write(name, *args)
+        return changed
+
     def init(self):
         """Initialize device: put into a known, safe state."""
         self.reference_mode = 'internal 27mhz'
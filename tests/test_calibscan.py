@@ -0,0 +1,111 @@
+"""Adaptive calibration scan (utils/calibScan.py) on a synthetic laser response."""
+
+import numpy as np
+
+import pytest
+
+from utils.calibScan import (adaptive_calibrate_voltage_to_frequency, calibrate_voltage_to_frequency,
+                             estimate_model_error)
+from utils.calibration import Calibration
+
+
+def response(voltage):
+    """Smooth tuning curve of the simulated laser (devices/sim/world.py), in GHz."""
+    return 384228.0 - 1.2 * voltage + 0.05 * voltage ** 2
+
+
+def steep_response(voltage):
+    """Smooth tuning curve with a steeper region around -1 V, in GHz."""
+    return 384228.0 - 1.2 * voltage - 0.8 * np.tanh((voltage + 1) / 0.5)
+
+
+class FakeGenerator:
+    def __init__(self):
+        self.voltage = 0.0
+
+    def set_dc_voltage(self, voltage):
+        self.voltage = voltage
+
+
+class FakeWavemeter:
+    """Reads the response at the generator voltage, without sampling thread."""
+
+    def __init__(self, generator, curve=response, noise=0.0, seed=0, failing=()):
+        self.generator = generator
+        self.curve = curve
+        self.failing = failing  # Voltages without a valid reading
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.sampler = None
+
+    def start_sampling(self, channel=0, rate=20.0):
+        return None
+
+    def stop_sampling(self):
+        pass
+
+    def read_frequency(self, channel=0, window=0.5):
+        if any(np.isclose(self.generator.voltage, v) for v in self.failing):
+            return None
+        return self.curve(self.generator.voltage) + self.rng.normal(0.0, self.noise)
+
+
+def scan(curve=response, noise=0.0, **kwargs):
+    rp = FakeGenerator()
+    wm = FakeWavemeter(rp, curve=curve, noise=noise)
+    return adaptive_calibrate_voltage_to_frequency(rp, wm, voltage_min=-5, voltage_max=2.5, wait_time=0.0,
+                                                   settle_tolerance=None, **kwargs)
+
+
+def test_adaptive_scan_stops_early_on_smooth_curve():
+    lut = scan(target_error=0.01, max_points=31, poly_order=3, noise=5e-4)
+    assert len(lut["voltages"]) < 31
+    assert lut["model_error"] <= 0.01
+    # The estimate holds: the stored model is within the target everywhere
+    calibration = Calibration.from_lut(lut)
+    grid = np.linspace(-5, 2.5, 301)
+    assert np.abs(calibration.frequency_for(grid) - response(grid)).max() <= 0.01
+
+
+def test_adaptive_scan_refines_steep_region_then_stops():
+    lut = scan(steep_response, target_error=0.01, max_points=31, noise=5e-4)
+    voltages = np.array(lut["voltages"])
+    assert 7 < len(voltages) < 31
+    assert lut["model_error"] <= 0.01
+    # Extra points went to the steep region
+    assert np.sum(np.abs(voltages + 1) < 1.5) > np.sum(np.abs(voltages + 1) >= 1.5)
+    grid = np.linspace(-5, 2.5, 601)
+    calibration = Calibration.from_lut(lut)
+    assert np.abs(calibration.frequency_for(grid) - steep_response(grid)).max() <= 0.01
+
+
+def test_pchip_error_shrinks_with_spacing():
+    coarse = np.linspace(-5, 2.5, 7)
+    fine = np.linspace(-5, 2.5, 13)
+    _, _, coarse_error = estimate_model_error(coarse, response(coarse), fit="pchip")
+    _, _, fine_error = estimate_model_error(fine, response(fine), fit="pchip")
+    assert fine_error < coarse_error / 2
+
+
+def test_poly_scan_stops_when_misfit_does_not_shrink():
+    lut = scan(target_error=1e-6, max_points=31, fit="poly", poly_order=1)
+    assert len(lut["voltages"]) < 31
+
+
+def test_uniform_scan_skips_failed_readings():
+    rp = FakeGenerator()
+    wm = FakeWavemeter(rp, failing=(-2.0, 1.0))
+    lut = calibrate_voltage_to_frequency(rp, wm, voltage_min=-5, voltage_max=2.5, num_steps=16, wait_time=0.0,
+                                         settle_tolerance=None, poly_order=2)
+    assert len(lut["voltages"]) == 14
+    assert 0 not in lut["frequencies"]
+    grid = np.linspace(-5, 2.5, 301)
+    assert np.abs(Calibration.from_lut(lut).frequency_for(grid) - response(grid)).max() <= 0.01
+
+
+def test_uniform_scan_needs_two_valid_readings():
+    rp = FakeGenerator()
+    wm = FakeWavemeter(rp, failing=(-5.0, 2.5))
+    with pytest.raises(RuntimeError):
+        calibrate_voltage_to_frequency(rp, wm, voltage_min=-5, voltage_max=2.5, num_steps=2, wait_time=0.0,
+                                       settle_tolerance=None)
@@ -0,0 +1,66 @@
+"""Driver I/O statistics (devices/instrumentation.py), failed operations included."""
+
+import socket
+
+import pytest
+
+from devices import instrumentation
+from devices.WaveMeter import Wavemeter
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    instrumentation.reset()
+    yield
+    instrumentation.reset()
+
+
+class FakeResource:
+    timeout = 2000
+
+    def write(self, message):
+        return len(message) + 1
+
+    def query(self, message):
+        if message == "TRAC:DATA?":
+            raise TimeoutError("VI_ERROR_TMO")
+        return "1.0"
+
+
+def test_failed_operations_are_recorded():
+    resource = instrumentation.InstrumentedResource(FakeResource(), "rigol")
+    resource.write(":FREQ:CENT 5000000")
+    assert resource.query("*OPC?") == "1.0"
+    with pytest.raises(TimeoutError):
+        resource.query("TRAC:DATA?")
+    assert resource.timeout == 2000  # Forwarded attribute
+
+    stats = instrumentation.snapshot()["rigol"]
+    assert (stats["count"], stats["errors"]) == (3, 1)
+    failed = stats["commands"]["query TRAC:DATA?"]
+    assert (failed["count"], failed["errors"], failed["bytes_received"]) == (1, 1, 0)
+    assert stats["commands"]["query *OPC?"]["errors"] == 0
+    assert stats["commands"]["write :FREQ:CENT"]["bytes_sent"] == 19
+    assert "errors" in instrumentation.format_table().splitlines()[0]
+
+
+def test_record_failures_only_records_on_exception():
+    start = 0
+    with instrumentation.record_failures("laser", "query", "sml780_tool edfa_set", start):
+        pass
+    assert instrumentation.snapshot() == {}
+    with pytest.raises(ConnectionError):
+        with instrumentation.record_failures("laser", "query", "sml780_tool edfa_set", start):
+            raise ConnectionError
+    assert instrumentation.snapshot()["laser"]["errors"] == 1
+
+
+def test_unreachable_wavemeter_is_counted():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        port = listener.getsockname()[1]  # Closed again before the request
+    wavemeter = Wavemeter(base_url=f"http://127.0.0.1:{port}", timeout=1)
+    assert wavemeter.get_frequency(0) is None
+    wavemeter.close()
+    stats = instrumentation.snapshot()["wavemeter"]["commands"]["request GET /api/freq"]
+    assert (stats["count"], stats["errors"]) == (1, 1)
@@ -0,0 +1,133 @@
+"""Acquisition pipeline (utils/pipeline.py) with stub stages."""
+
+import threading
+import time
+
+import pytest
+
+from utils.pipeline import AcquisitionPipeline
+
+
+class Recorder:
+    """Stage functions logging their start and end, in a global order."""
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def log(self, kind, name, step):
+        with self._lock:
+            self.events.append((kind, name, step, threading.current_thread().name))
+
+    def stage(self, name, duration=0.0, fail_at=None):
+        def func(step, values):
+            self.log("start", name, step)
+            time.sleep(duration)
+            if step == fail_at:
+                self.log("end", name, step)
+                raise RuntimeError(f"{name} failed at step {step}")
+            self.log("end", name, step)
+            return (name, step, dict(values))
+        return func
+
+    def index(self, kind, name, step):
+        return next(i for i, event in enumerate(self.events) if event[:3] == (kind, name, step))
+
+    def ran(self, name, step):
+        return any(event[:3] == ("start", name, step) for event in self.events)
+
+
+def acquisition(recorder, depth, fail_at=None):
+    """Same shape as run_experiment: voltage -> settle -> sweep -> sweep_done -> fetch."""
+    pipe = AcquisitionPipeline(depth=depth)
+    pipe.add_stage("voltage", recorder.stage("voltage", 0.002), lane="signal_gen", after=[("sweep_done", -1)])
+    pipe.add_stage("settle", recorder.stage("settle", 0.01), after=["voltage"])
+    pipe.add_stage("wavemeter", recorder.stage("wavemeter", 0.005), after=["settle"])
+    pipe.add_stage("sweep", recorder.stage("sweep", 0.002), lane="sa", after=["settle"])
+    pipe.add_stage("sweep_done", recorder.stage("sweep_done", 0.005, fail_at), lane="sa", after=["sweep"])
+    pipe.add_stage("fetch", recorder.stage("fetch", 0.02), lane="sa", after=["sweep_done"])
+    return pipe
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_dependencies_are_ordered_across_lanes(depth):
+    recorder = Recorder()
+    num_steps = 6
+    results = acquisition(recorder, depth).run(num_steps)
+
+    assert [values["voltage"][1] for values in results] == list(range(num_steps))
+    for step in range(num_steps):
+        # Same-step dependencies finish first and pass their values
+        assert recorder.index("end", "voltage", step) < recorder.index("start", "settle", step)
+        assert recorder.index("end", "settle", step) < recorder.index("start", "sweep", step)
+        assert recorder.index("end", "settle", step) < recorder.index("start", "wavemeter", step)
+        assert recorder.index("end", "sweep_done", step) < recorder.index("start", "fetch", step)
+        fetch_values = results[step]["fetch"][2]
+        assert list(fetch_values) == ["sweep_done"] and fetch_values["sweep_done"][1] == step
+        assert results[step]["voltage"][2] == {}  # Earlier steps are ordering only
+        if step:
+            # Dependency on the previous step
+            assert recorder.index("end", "sweep_done", step - 1) < recorder.index("start", "voltage", step)
+            # Same lane: the next arm only runs once the previous trace is fetched
+            assert recorder.index("end", "fetch", step - 1) < recorder.index("start", "sweep", step)
+        if step > depth:
+            # At most depth earlier steps in flight when a step starts
+            first = recorder.index("start", "voltage", step)
+            assert all(recorder.index("end", name, step - depth - 1) < first
+                       for name in ("voltage", "settle", "wavemeter", "sweep", "sweep_done", "fetch"))
+
+    # Stages of one lane run on one thread
+    threads = {(event[1], event[3]) for event in recorder.events}
+    assert len({thread for name, thread in threads if name in ("sweep", "sweep_done", "fetch")}) == 1
+    # The fetch of a step overlaps with the voltage and settling of the next one
+    assert any(recorder.index("start", "settle", step + 1) < recorder.index("end", "fetch", step)
+               for step in range(num_steps - 1))
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_stage_exception_surfaces_in_run(depth):
+    recorder = Recorder()
+    collected = []
+    pipe = acquisition(recorder, depth, fail_at=2)
+    with pytest.raises(RuntimeError, match="sweep_done failed at step 2"):
+        pipe.run(10, on_step=lambda step, values, timings: collected.append(step))
+
+    assert collected == [0, 1]
+    # The failure propagates to the dependents instead of running them
+    assert not recorder.ran("fetch", 2)
+    assert not recorder.ran("voltage", 3)
+    # Nothing of the later steps runs
+    assert not any(recorder.ran("settle", step) for step in range(3 + depth, 10))
+
+
+def test_shutdown_waits_for_work_in_flight():
+    recorder = Recorder()
+    pipe = AcquisitionPipeline(depth=2)
+    pipe.add_stage("slow", recorder.stage("slow", 0.1), lane="a")
+    pipe.add_stage("fail", recorder.stage("fail", 0.0, fail_at=0), lane="b")
+    pipe.add_stage("after", recorder.stage("after"), lane="a", after=["slow"])
+
+    with pytest.raises(RuntimeError, match="fail failed at step 0"):
+        pipe.run(20)
+
+    # Stages running when the failure surfaced were finished before run() returned
+    started = [event[1:3] for event in recorder.events if event[0] == "start"]
+    ended = [event[1:3] for event in recorder.events if event[0] == "end"]
+    assert sorted(started) == sorted(ended)
+    # Queued work was cancelled
+    assert len([name for name, step in started if name == "slow"]) < 20
+    count = len(recorder.events)
+    time.sleep(0.15)
+    assert len(recorder.events) == count
+
+
+def test_invalid_dependencies():
+    pipe = AcquisitionPipeline(depth=1)
+    pipe.add_stage("a", lambda step, values: None)
+    with pytest.raises(ValueError):
+        pipe.add_stage("b", lambda step, values: None, after=["missing"])
+    with pytest.raises(ValueError):
+        pipe.add_stage("c", lambda step, values: None, after=[("a", 1)])
+    pipe.add_stage("d", lambda step, values: None, after=[("a", -2)])
+    with pytest.raises(ValueError, match="looks back 2 steps"):
+        pipe.run(3)
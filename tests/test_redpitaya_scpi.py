@@ -0,0 +1,99 @@
+"""Receive path of the Red Pitaya SCPI client (devices/vendor/redpitaya_scpi.py) over a socketpair."""
+
+import socket
+import threading
+import time
+
+import numpy as np
+
+import pytest
+
+from devices.vendor.redpitaya_scpi import scpi
+
+
+@pytest.fixture
+def link():
+    """(client, server socket): a client whose socket is one end of a socketpair."""
+    client_socket, server = socket.socketpair()
+    client_socket.settimeout(5)
+    client = scpi.__new__(scpi)
+    client.host, client.port, client.timeout = "socketpair", 0, 5
+    client._last_command = ""
+    client._socket = client_socket
+    yield client, server
+    client.close()
+    server.close()
+
+
+def send_chunks(server, *chunks, gap=0.02):
+    """Sends each chunk in its own segment, from a thread, so the reads see them split."""
+    def run():
+        for chunk in chunks:
+            server.sendall(chunk)
+            time.sleep(gap)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def block(payload):
+    length = str(len(payload)).encode()
+    return b"#" + str(len(length)).encode() + length + payload + b"\r\n"
+
+
+def test_rx_txt_split_reads(link):
+    client, server = link
+    send_chunks(server, b"REDPITAYA,", b"INSTR2020", b",0,2.00\r\n")
+    assert client.rx_txt() == "REDPITAYA,INSTR2020,0,2.00"
+
+
+@pytest.mark.parametrize("chunks", [[b"TD", b"\r\n"], [b"TD\r", b"\n"]])
+def test_rx_txt_delimiter_in_its_own_chunk(link, chunks):
+    client, server = link
+    send_chunks(server, *chunks)
+    assert client.rx_txt() == "TD"
+
+
+def test_rx_arb_split_reads_consume_the_delimiter(link):
+    client, server = link
+    payload = bytes(range(256)) * 3
+    data = block(payload)
+    # Split inside the header, the length digits, the payload and the delimiter
+    send_chunks(server, data[:1], data[1:3], data[3:5], data[5:300], data[300:-1], data[-1:], b"1\r\n")
+    assert bytes(client.rx_arb()) == payload
+    # The delimiter was consumed: the next answer reads cleanly
+    assert client.rx_txt() == "1"
+
+
+def test_rx_arb_reuses_the_output_buffer(link):
+    client, server = link
+    out = bytearray(64)
+    send_chunks(server, block(b"abcdefgh"))
+    data = client.rx_arb(out)
+    assert bytes(data) == b"abcdefgh"
+    assert out[:8] == b"abcdefgh"
+
+    send_chunks(server, block(bytes(65)))
+    with pytest.raises(ValueError):
+        client.rx_arb(out)
+
+
+def test_rx_arb_invalid_header(link):
+    client, server = link
+    send_chunks(server, b"ERR\r\n")
+    assert client.rx_arb() is False
+
+
+@pytest.mark.parametrize("units, dtype", [("VOLTS", ">f4"), ("RAW", ">i2")])
+def test_acq_data_binary(link, units, dtype):
+    client, server = link
+    values = np.linspace(-1, 1, 1000) if units == "VOLTS" else np.arange(-500, 500)
+    payload = values.astype(dtype).tobytes()
+    data = block(payload)
+    send_chunks(server, data[:7], data[7:1001], data[1001:])
+
+    result = client.acq_data(2, binary=True, convert=True, units=units)
+    assert result.dtype == np.dtype(dtype)
+    np.testing.assert_array_equal(result, values.astype(dtype))
+    assert server.recv(64) == b"ACQ:SOUR2:DATA?\r\n"
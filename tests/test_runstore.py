@@ -0,0 +1,103 @@
+"""Run store (utils/runstore.py): round trip and crash consistency."""
+
+import os
+
+import numpy as np
+
+import pytest
+
+from utils.runstore import STEP_DTYPE, STEPS_FILE, TRACE_DTYPE, TRACES_FILE, RunReader, RunWriter
+
+POINTS = 11
+
+
+def trace(step):
+    return np.arange(POINTS, dtype=float) + 100 * step
+
+
+def write_run(path, num_steps, chunk_size=4, close=True):
+    writer = RunWriter(str(path), metadata={"delay": 0.05}, chunk_size=chunk_size)
+    for step in range(num_steps):
+        writer.append(step, 0.1 * step, None if step == 2 else 384228.0 + step, trace(step))
+    if close:
+        writer.close()
+    return writer
+
+
+def test_round_trip(tmp_path):
+    write_run(tmp_path / "run", 10)
+    run = RunReader(str(tmp_path / "run"))
+
+    assert len(run) == 10
+    assert run.parameters == {"delay": 0.05}
+    assert run.meta["trace_points"] == POINTS
+    np.testing.assert_array_equal(run.steps, np.arange(10))
+    np.testing.assert_allclose(run.voltage, 0.1 * np.arange(10))
+    assert np.isnan(run.laser_frequency[2])  # None is stored as NaN
+    for step, record in enumerate(run):
+        assert record["step"] == step
+        np.testing.assert_array_equal(record["spectrum"], trace(step).astype(TRACE_DTYPE))
+
+
+def test_steps_are_visible_chunk_by_chunk(tmp_path):
+    writer = write_run(tmp_path / "run", 6, chunk_size=4, close=False)
+    assert len(RunReader(str(tmp_path / "run"))) == 4  # The last 2 are still buffered
+    writer.close()
+    assert len(RunReader(str(tmp_path / "run"))) == 6
+
+
+def test_empty_run(tmp_path):
+    RunWriter(str(tmp_path / "run")).close()
+    run = RunReader(str(tmp_path / "run"))
+    assert len(run) == 0
+    assert list(run) == []
+
+
+def test_truncated_trace_file(tmp_path):
+    write_run(tmp_path / "run", 8)
+    # Crash while appending traces: the last rows are incomplete
+    traces = tmp_path / "run" / TRACES_FILE
+    os.truncate(traces, 5 * POINTS * TRACE_DTYPE.itemsize + 3)
+
+    run = RunReader(str(tmp_path / "run"))
+    assert len(run) == 5
+    np.testing.assert_array_equal(run.traces[4], trace(4).astype(TRACE_DTYPE))
+
+
+def test_truncated_step_file(tmp_path):
+    write_run(tmp_path / "run", 8)
+    # Crash after the traces of a chunk were synced, in the middle of its step records
+    steps = tmp_path / "run" / STEPS_FILE
+    os.truncate(steps, 6 * STEP_DTYPE.itemsize + 5)
+
+    run = RunReader(str(tmp_path / "run"))
+    assert len(run) == 6
+    assert run.traces.shape == (6, POINTS)
+    assert run[5]["step"] == 5
+
+
+def test_traces_are_written_before_steps(tmp_path, monkeypatch):
+    writer = write_run(tmp_path / "run", 4, chunk_size=8, close=False)
+    sizes = []
+    fsync = os.fsync
+
+    def record_sizes(fd):
+        fsync(fd)
+        sizes.append((os.path.getsize(tmp_path / "run" / TRACES_FILE),
+                      os.path.getsize(tmp_path / "run" / STEPS_FILE)))
+
+    monkeypatch.setattr(os, "fsync", record_sizes)
+    writer.close()
+    # The traces are on disk while no step record refers to them yet
+    assert sizes[0] == (4 * POINTS * TRACE_DTYPE.itemsize, 0)
+    assert sizes[1] == (4 * POINTS * TRACE_DTYPE.itemsize, 4 * STEP_DTYPE.itemsize)
+
+
+def test_invalid_writes(tmp_path):
+    write_run(tmp_path / "run", 1)
+    with pytest.raises(FileExistsError):
+        RunWriter(str(tmp_path / "run"))
+    with RunWriter(str(tmp_path / "other")) as writer:
+        writer.append(0, 0.0, 384228.0, trace(0))
+        with pytest.raises(ValueError):
+            writer.append(1, 0.1, 384228.0, np.zeros(POINTS + 1))
@@ -0,0 +1,149 @@
+"""Write elision of the instrument drivers (devices/state_cache.py and the cached setters)."""
+
+import pytest
+
+from devices.RPSignalGenerator import RedPitayaSignalGenerator
+from devices.RigolSA import RigolSA
+from devices.TektroAFG import TektronixAFG3000C
+from devices.state_cache import StateCache
+
+
+class FakeResource:
+    """pyvisa resource recording the writes."""
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, message):
+        self.writes.append(message)
+
+    def write_binary_values(self, message, values, **kwargs):
+        self.writes.append(message)
+
+
+class FakeRedPitaya:
+    """SCPI client of the Red Pitaya recording the messages; *STB? reports no error."""
+
+    def __init__(self):
+        self.writes = []
+
+    def tx_txt(self, message):
+        self.writes.append(message)
+
+    def txrx_txt(self, message):
+        self.writes.append(message)
+        return "0"
+
+    def sour_set(self, channel, func, **kwargs):
+        self.writes.append(f"sour_set {channel} {func}")
+
+
+def headers(writes):
+    """SCPI headers of the commands in a list of (possibly ';'-joined) writes."""
+    return [part.strip(":").split(" ")[0] for message in writes for part in message.split(";")]
+
+
+def test_apply_elides_repeated_values():
+    state = StateCache()
+    sent = []
+    assert state.apply("FREQ", "1", lambda: sent.append("FREQ 1"))
+    assert not state.apply("FREQ", "1", lambda: sent.append("FREQ 1"))
+    assert state.apply("FREQ", "2", lambda: sent.append("FREQ 2"))
+    assert sent == ["FREQ 1", "FREQ 2"]
+    assert (state.sent, state.elided) == (2, 1)
+    assert state.matches("FREQ", "2") and not state.matches("FREQ", "1")
+    assert not state.matches("POW", "1")
+
+
+def test_failed_send_forgets_the_setting():
+    state = StateCache()
+    state.apply("FREQ", "1", lambda: None)
+
+    def fail():
+        raise OSError("timeout")
+
+    with pytest.raises(OSError):
+        state.apply("FREQ", "2", fail)
+    assert "FREQ" not in state
+    assert state.apply("FREQ", "1", lambda: None)
+
+
+def test_update_and_invalidate():
+    state = StateCache()
+    state.update("FREQ", "1")
+    state.update("POW", "0")
+    assert state.get("FREQ") == "1" and state.get("SPAN", "?") == "?"
+    assert not state.apply("FREQ", "1", lambda: None)  # A read back counts as set
+
+    state.invalidate("FREQ", "UNKNOWN")
+    assert "FREQ" not in state and "POW" in state
+    state.invalidate()
+    assert "POW" not in state
+
+
+@pytest.fixture
+def afg():
+    afg = TektronixAFG3000C("0.0.0.0", visa_library="@py")
+    afg.instrument = FakeResource()
+    return afg
+
+
+def test_afg_dc_voltage_only_sends_changes(afg):
+    afg.set_dc_voltage(1.0)
+    assert headers(afg.instrument.writes) == ["SOURce2:FUNCtion", "SOURce2:BURSt:STATe", "SOURce2:VOLTage:OFFSet"]
+    afg.instrument.writes.clear()
+    afg.set_dc_voltage(1.0)
+    assert afg.instrument.writes == []
+    afg.set_dc_voltage(1.5)
+    assert afg.instrument.writes == ["SOURce2:VOLTage:OFFSet 1.5"]
+
+
+def test_afg_linked_levels_are_resent(afg):
+    voltages = [0.0, 0.5, 1.0]
+    afg.set_dc_voltage(1.0)
+    afg.load_voltage_staircase(voltages, 1e-3)
+    afg.instrument.writes.clear()
+
+    # The staircase levels moved the offset, which must be written again
+    afg.set_dc_voltage(1.0)
+    assert "SOURce2:VOLTage:OFFSet 1.0" in afg.instrument.writes
+    afg.instrument.writes.clear()
+
+    # The offset moved the levels; the waveform itself is unchanged
+    afg.load_voltage_staircase(voltages, 1e-3)
+    sent = headers(afg.instrument.writes)
+    assert "SOURce2:VOLTage:HIGH" in sent and "SOURce2:VOLTage:LOW" in sent
+    assert "TRACe:DATA" not in sent
+
+
+def test_rigol_setters_elide_and_invalidate():
+    sa = RigolSA("0.0.0.0")
+    sa.sa = FakeResource()
+    sa.set_center_frequency(5e6)
+    count = len(sa.sa.writes)
+    assert count
+    sa.set_center_frequency(5e6)
+    assert len(sa.sa.writes) == count
+    sa.invalidate_state()
+    sa.set_center_frequency(5e6)
+    assert len(sa.sa.writes) == 2 * count
+
+
+def test_red_pitaya_dc_voltage_and_staircase():
+    rp = RedPitayaSignalGenerator("0.0.0.0")
+    rp.rp = FakeRedPitaya()
+    rp.set_dc_voltage(1.0)
+    assert "SOUR2:VOLT" in headers(rp.rp.writes)
+    rp.rp.writes.clear()
+    rp.set_dc_voltage(1.0)
+    assert rp.rp.writes == []  # Nothing changed, not even the trigger is sent
+
+    rp.load_voltage_staircase([0.0, 0.5, 1.0], 1e-3)
+    rp.rp.writes.clear()
+    # The upload wrote the function and amplitude behind the cache
+    rp.set_dc_voltage(1.0)
+    assert {"SOUR2:FUNC", "SOUR2:VOLT", "SOUR2:BURS:STAT"} <= set(headers(rp.rp.writes))
+    rp.rp.writes.clear()
+    # The DC setting replaced the waveform, which must be uploaded again
+    rp.load_voltage_staircase([0.0, 0.5, 1.0], 1e-3)
+    assert "sour_set 2 ARBITRARY" in rp.rp.writes
@@ -0,0 +1,118 @@
+"""SynthHD driver and controller (temp/) against the simulated SynthHD (devices/sim)."""
+
+import pytest
+
+from devices.sim.synthhd import SynthHDServer
+from temp.control_synth import SynthHDController
+from temp.synth_hd import SynthHD
+
+
+@pytest.fixture(scope="module")
+def server():
+    with SynthHDServer() as server:
+        yield server
+
+
+@pytest.fixture
+def controller(server):
+    controller = SynthHDController(port=server.url)
+    yield controller
+    controller.synth.close()
+
+
+def test_shutdown_disables_sweep_after_configure(server, controller):
+    controller.configure_differential_sweep(f_low=750e6, f_high=760e6, f_step=1e6, step_time=0.01)
+    assert server.value("c") == "0"
+    # The trigger-driven run changes the register behind the driver's back
+    server.registers["c"] = "1"
+    controller.shutdown()
+    # Queries are answered in order, after the writes sent before them
+    assert controller.synth.read("sweep_cont") is False
+
+
+@pytest.mark.parametrize("attribute", ["sweep_cont", "am_cont", "pulse_cont", "fm_cont"])
+def test_run_state_is_never_elided(server, controller, attribute):
+    synth = controller.synth
+    synth.write(attribute, False)
+    synth.read(attribute)
+    served = server.commands_served
+    synth.write(attribute, False)
+    synth.read(attribute)
+    assert server.commands_served == served + 2
+
+
+@pytest.fixture
+def synth(server):
+    """SynthHD driver recording the bytes of each serial write."""
+    synth = SynthHD(server.url)
+    synth.writes = []
+    write = synth._dev.write
+
+    def record(data):
+        synth.writes.append(bytes(data))
+        return write(data)
+
+    synth._dev.write = record
+    yield synth
+    synth.close()
+
+
+def test_channel_select_only_when_the_channel_changes(synth):
+    synth.write("channel", 1)
+    synth.write("frequency", 1000.0)
+    synth.write("frequency", 1000.0)  # Elided, and so is its select
+    synth.write("channel", 1)
+    synth.write("power", 5.0)
+    synth.write("channel", 0)
+    synth.write("channel", 1)
+    synth.write("channel", 0)
+    synth.write("frequency", 1000.0)  # Channel 0 was never written
+    assert synth.writes == [b"C1", b"f1000.00000000", b"W5.000", b"C0", b"f1000.00000000"]
+
+
+def test_batch_is_one_write_and_one_check(synth):
+    synth.write("channel", 0)
+    synth.write("power", 0.0)
+    synth.writes.clear()
+    with synth.batch():
+        synth.write("channel", 0)
+        synth.write("power", 3.0)
+        synth.write("channel", 1)
+        synth.write("power", 3.0)
+        synth.write("trig_function", 1)
+    # Channel 0 is already selected; the channel read back checks the whole batch
+    assert synth.writes == [b"W3.000C1W3.000w1", b"C?"]
+
+    synth.writes.clear()
+    with synth.batch():
+        synth.write("channel", 0)
+        synth.write("power", 3.0)
+        synth.write("trig_function", 1)
+    assert synth.writes == []  # Nothing changed, nothing to check
+
+
+def test_batch_failure_discards_the_writes(synth):
+    synth.write("trig_function", 1)
+    synth.writes.clear()
+    with pytest.raises(RuntimeError):
+        with synth.batch():
+            synth.write("trig_function", 0)
+            raise RuntimeError("configuration error")
+    assert synth.writes == []
+    # The cache no longer trusts the buffered value
+    synth.write("trig_function", 1)
+    assert synth.writes == [b"w1"]
+
+
+def test_write_many_and_read_many(synth):
+    synth.write("trig_function", 1)
+    synth.writes.clear()
+    assert synth.write_many([("trig_function", 1), ("sweep_diff_freq", 5.0), ("sweep_diff_meth", 1)]) == 2
+    assert synth.writes == [b"k5.00000000n1"]
+
+    synth.write("channel", 1)
+    synth.write("frequency", 1200.0)
+    synth.write("power", 2.0)
+    synth.writes.clear()
+    assert synth.read_many([("frequency",), ("power",)]) == [1200.0, 2.0]
+    assert synth.writes == [b"f?W?"]
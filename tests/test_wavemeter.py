@@ -0,0 +1,42 @@
+"""Wavemeter driver (devices/WaveMeter.py) against the simulated wavemeter API (devices/sim)."""
+
+import time
+
+import pytest
+
+from devices.WaveMeter import Wavemeter
+from devices.sim.wavemeter import WavemeterServer
+from devices.sim.world import SimWorld
+
+
+@pytest.fixture
+def wavemeter():
+    world = SimWorld()
+    world.seed_on = True  # No signal on the wavemeter with the seed laser off
+    with WavemeterServer(world=world) as server:
+        wm = Wavemeter(base_url=server.base_url, timeout=1)
+        yield wm
+        wm.close()
+
+
+def test_read_frequency_without_sampler_reads_live(wavemeter):
+    assert wavemeter.read_frequency(channel=0) == pytest.approx(384228.0, abs=0.1)
+
+
+def test_read_frequency_averages_the_sampled_window(wavemeter):
+    sampler = wavemeter.start_sampling(channel=0, rate=200)
+    assert sampler.wait_for_sample(time.time(), timeout=1.0) is not None
+    assert wavemeter.read_frequency(channel=0, window=0.5) == pytest.approx(384228.0, abs=0.1)
+
+
+def test_read_frequency_empty_window_is_missing(wavemeter, monkeypatch):
+    sampler = wavemeter.start_sampling(channel=0, rate=200)
+    start = time.time()
+    assert sampler.wait_for_sample(start, timeout=1.0) is not None
+
+    def live_read(channel=0):
+        raise AssertionError("The reading of a past window must not be taken live.")
+
+    monkeypatch.setattr(wavemeter, "get_frequency", live_read)
+    # Window that ended before sampling started
+    assert wavemeter.read_frequency(channel=0, window=0.1, now=start - 10) is None
@@ -16,6 +16,7 @@ File structure:
 import numpy as np
 import matplotlib.pyplot as plt
 import time
+import datetime
 import json
 import sys
 import os
@@ -23,11 +24,51 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from devices.WaveMeter import Wavemeter
 from devices.RPSignalGenerator import RedPitayaSignalGenerator
+from utils.calibration import Calibration, PchipModel, PolynomialModel, build_lut
+from utils.settle import DEFAULT_TOLERANCE, DEFAULT_WINDOW, sampling, wait_until_settled
 
-def calibrate_voltage_to_frequency(rp, wm, voltage_min=-5, voltage_max=5, num_steps=21, wait_time=1.0, poly_order=1):
+def measure_point(rp, wm, voltage, wait_time=1.0, settle_tolerance=DEFAULT_TOLERANCE,
+                  settle_window=DEFAULT_WINDOW):
+    """
+    Sets one voltage and measures the frequency once settled. The wavemeter must be
+    sampling channel 0 (see utils.settle.sampling).
+
+    Args:
+        rp (RedPitayaSignalGenerator): Instance to control the RP.
+        wm (Wavemeter): Instance to fetch frequency from the wavemeter.
+        voltage (float): Channel 2 voltage (V).
+        wait_time (float): Longest settling time (seconds).
+        settle_tolerance (float): Peak-to-peak spread (GHz) of a settled point, None
+            to always wait wait_time.
+        settle_window (float): Time (seconds) the frequency must stay within the tolerance.
+
+    Returns:
+        tuple: (frequency in GHz or None, settle time in seconds)
+    """
+    t0 = time.time()
+    rp.set_dc_voltage(voltage)
+    if settle_tolerance is None:
+        time.sleep(wait_time)
+        freq = wm.read_frequency(channel=0, window=wait_time / 2)
+        settled = True
+    else:
+        result = wait_until_settled(wm, since=t0, channel=0, tolerance=settle_tolerance,
+                                    window=min(settle_window, wait_time), timeout=wait_time)
+        freq, settled = result["frequency"], result["settled"]
+    settle_time = time.time() - t0
+    note = "" if settled else " (not settled)"
+    shown = "no reading" if freq is None else f"{freq:.3f} Hz"
+    print(f"Voltage: {voltage:.2f} V -> Measured Frequency: {shown} after {settle_time:.2f} s{note}")
+    return freq, settle_time
+
+def calibrate_voltage_to_frequency(rp, wm, voltage_min=-5, voltage_max=5, num_steps=21, wait_time=1.0, poly_order=1,
+                                   settle_tolerance=DEFAULT_TOLERANCE, settle_window=DEFAULT_WINDOW, fit="pchip"):
     """
     Sweeps Channel 2 on the Red Pitaya from voltage_min to voltage_max, reads the corresponding
-    frequency from the wavemeter, and fits a polynomial to create a LUT.
+    frequency from the wavemeter, and fits a calibration model to create a LUT.
+
+    After each voltage change the wavemeter is watched until the frequency is stable
+    (utils/settle.py), so most points take much less than wait_time.
 
     Args:
         rp (RedPitayaSignalGenerator): Instance to control the RP.
@@ -35,32 +76,153 @@ def calibrate_voltage_to_frequency(rp, wm, voltage_min=-5, voltage_max=5, num_st
         voltage_min (float): Starting voltage (default -5 V).
         voltage_max (float): Ending voltage (default 5 V).
         num_steps (int): Number of measurement steps (default 21).
-        wait_time (float): Settling time (seconds) after each voltage change.
+        wait_time (float): Longest settling time (seconds) after each voltage change.
         poly_order (int): Order of the polynomial fit (default 1 for linear).
+        settle_tolerance (float): Peak-to-peak frequency spread (GHz) of a settled point.
+            None to always wait wait_time, as a fixed delay.
+        settle_window (float): Time (seconds) the frequency must stay within the tolerance.
+        fit (str): Calibration model, "pchip" (monotonic piecewise cubic) or "poly".
 
     Returns:
-        dict: LUT containing 'voltages', 'frequencies', and 'poly_coeffs'.
+        dict: Version 2 LUT (utils/calibration.py build_lut): 'voltages', 'frequencies',
+            'model', 'residuals', 'valid_range', 'poly_coeffs', the 'settle_times'
+            (seconds) of each point, ... Points without a valid wavemeter reading
+            are left out.
+
+    Raises:
+        RuntimeError: If fewer than two points have a valid reading.
     """
-    voltages = np.linspace(voltage_min, voltage_max, num_steps)
-    frequencies = []
+    measured = []  # (voltage, frequency, settle time) of the valid points
+    measured_at = datetime.datetime.now().isoformat(timespec="seconds")
     
-    for voltage in voltages:
-        rp.set_dc_voltage(voltage)
-        time.sleep(wait_time)  
-        freq = wm.get_frequency(channel=0)
-        if freq is None:
-            freq = 0
-        frequencies.append(freq)
-        print(f"Voltage: {voltage:.2f} V -> Measured Frequency: {freq:.3f} Hz")
+    with sampling(wm, channel=0):
+        for voltage in np.linspace(voltage_min, voltage_max, num_steps):
+            freq, settle_time = measure_point(rp, wm, voltage, wait_time, settle_tolerance, settle_window)
+            # A failed reading is left out, the models would fit it as a frequency
+            if freq is not None:
+                measured.append((voltage, freq, settle_time))
+    if len(measured) < 2:
+        raise RuntimeError("Not enough valid wavemeter readings to calibrate.")
+    voltages, frequencies, settle_times = (list(column) for column in zip(*measured))
     
-    # Fit a polynomial: frequency = a * voltage + b
-    coeffs = np.polyfit(voltages, frequencies, poly_order)
-    lut = {
-        'voltages': voltages.tolist(),
-        'frequencies': frequencies,
-        'poly_coeffs': coeffs.tolist()
-    }
-    return lut
+    # Fit the model and a polynomial: frequency = a * voltage + b for order 1
+    return build_lut(voltages, frequencies, settle_times, kind=fit, poly_order=poly_order, measured_at=measured_at)
+
+def estimate_model_error(voltages, frequencies, fit="pchip", poly_order=1):
+    """
+    Error estimates of a calibration, used to place the next adaptive scan points.
+
+    The error is the one of the model actually fitted:
+      - "pchip": leave-one-out error of the interpolant. Each interior point is
+        predicted from the others, i.e. at twice the local spacing, and the error is
+        scaled back to the current spacing as h**2, so it shrinks as points are added.
+      - "poly": residual of the polynomial fit at the ends of each interval. A
+        systematic misfit does not shrink with more points.
+
+    Args:
+        voltages (array): Measured voltages, sorted and distinct (at least 3).
+        frequencies (array): Measured frequencies (GHz).
+        fit (str): Calibration model, "pchip" or "poly".
+        poly_order (int): Order of the "poly" fit.
+
+    Returns:
+        tuple: (model through the points, error per interval between consecutive
+            points in GHz, overall model error in GHz)
+    """
+    voltages = np.asarray(voltages, dtype=float)
+    frequencies = np.asarray(frequencies, dtype=float)
+    widths = np.diff(voltages)
+    if fit == PolynomialModel.kind:
+        model = PolynomialModel(np.polyfit(voltages, frequencies, min(poly_order, len(voltages) - 1)))
+        residuals = np.abs(frequencies - model(voltages))
+        interval_error = np.maximum(residuals[:-1], residuals[1:])
+    elif fit == PchipModel.kind:
+        model = PchipModel(voltages, frequencies)
+        # Error of each interval from the leave-one-out errors of its interior end points
+        interval_error = np.zeros(len(widths))
+        for i in range(1, len(voltages) - 1):
+            others = PchipModel(np.delete(voltages, i), np.delete(frequencies, i))
+            loo = abs(frequencies[i] - float(others(voltages[i])))
+            span = voltages[i + 1] - voltages[i - 1]
+            for j in (i - 1, i):
+                interval_error[j] = max(interval_error[j], loo * (widths[j] / span) ** 2)
+    else:
+        raise ValueError(f"Unknown calibration model '{fit}', use 'pchip' or 'poly'.")
+    return model, interval_error, float(interval_error.max())
+
+
+def adaptive_calibrate_voltage_to_frequency(rp, wm, voltage_min=-5, voltage_max=5, initial_steps=7, target_error=0.01,
+                                            max_points=31, min_spacing=0.05, points_per_round=2, wait_time=1.0,
+                                            poly_order=1, settle_tolerance=DEFAULT_TOLERANCE,
+                                            settle_window=DEFAULT_WINDOW, fit="pchip"):
+    """
+    Calibration scan that spends its points where the response is hard to model.
+
+    Starts from a coarse uniform grid, then repeatedly measures the midpoints of the
+    intervals with the largest estimated error of the fitted model (see
+    estimate_model_error) until that error is below target_error. With fit="poly" the
+    scan also stops once more points no longer reduce the error.
+
+    Args:
+        rp (RedPitayaSignalGenerator): Instance to control the RP.
+        wm (Wavemeter): Instance to fetch frequency from the wavemeter.
+        voltage_min (float): Lowest voltage (V).
+        voltage_max (float): Highest voltage (V).
+        initial_steps (int): Points of the coarse grid (at least 3).
+        target_error (float): Model error (GHz) at which the scan stops.
+        max_points (int): Largest number of measured points.
+        min_spacing (float): Intervals narrower than twice this (V) are not split.
+        points_per_round (int): Intervals split between two error estimates.
+        wait_time (float): Longest settling time (seconds) after each voltage change.
+        poly_order (int): Order of the polynomial fit.
+        settle_tolerance (float): Peak-to-peak spread (GHz) of a settled point.
+        settle_window (float): Time (seconds) the frequency must stay within the tolerance.
+        fit (str): Calibration model, "pchip" (monotonic piecewise cubic) or "poly".
+
+    Returns:
+        dict: LUT with the same keys as calibrate_voltage_to_frequency (points sorted by
+            voltage) plus 'model_error' (GHz) and 'mode' ("adaptive").
+    """
+    if initial_steps < 3:
+        raise ValueError("The coarse grid needs at least 3 points.")
+    measured = {}  # voltage -> (frequency, settle time)
+    measured_at = datetime.datetime.now().isoformat(timespec="seconds")
+    pending = list(np.linspace(voltage_min, voltage_max, initial_steps))
+    model_error = np.inf
+
+    with sampling(wm, channel=0):
+        while True:
+            for voltage in pending:
+                freq, settle_time = measure_point(rp, wm, voltage, wait_time, settle_tolerance, settle_window)
+                measured[float(voltage)] = (freq, settle_time)
+            valid = sorted((v, f) for v, (f, _) in measured.items() if f is not None)
+            if len(valid) < 3:
+                raise RuntimeError("Not enough valid wavemeter readings to calibrate.")
+            voltages, frequencies = (np.array(column) for column in zip(*valid))
+            previous_error = model_error
+            _, interval_error, model_error = estimate_model_error(voltages, frequencies, fit, poly_order)
+            print(f"{len(measured)} points, estimated model error: {model_error * 1e3:.1f} MHz")
+
+            if model_error <= target_error:
+                break
+            if fit == PolynomialModel.kind and model_error > 0.9 * previous_error:
+                # More points do not reduce a systematic misfit of the polynomial
+                print(f"Stopping above the target error ({target_error * 1e3:.1f} MHz): the order "
+                      f"{poly_order} polynomial does not fit better with more points.")
+                break
+            budget = max_points - len(measured)
+            splittable = np.flatnonzero(np.diff(voltages) >= 2 * min_spacing)
+            if budget <= 0 or len(splittable) == 0:
+                print(f"Stopping above the target error ({target_error * 1e3:.1f} MHz): "
+                      f"{'point budget used' if budget <= 0 else 'intervals at minimum spacing'}.")
+                break
+            worst = splittable[np.argsort(interval_error[splittable])[::-1]]
+            worst = worst[:min(points_per_round, budget)]
+            pending = [(voltages[i] + voltages[i + 1]) / 2 for i in worst]
+
+    settle_times = [measured[v][1] for v in voltages.tolist()]
+    return build_lut(voltages, frequencies, settle_times, kind=fit, poly_order=poly_order, measured_at=measured_at,
+                     model_error=model_error, mode='adaptive')
 
 def save_lut(lut, filename):
     """
@@ -77,17 +239,16 @@ def plot_lut(lut):
     The LUT contains:
       - "voltages": list of voltage setpoints (V)
       - "frequencies": measured frequencies (GHz)
-      - "poly_coeffs": polynomial coefficients for the fit
+      - "model": fitted calibration model ("poly_coeffs" in version 1 files)
 
     This function plots the measured data points and the fitted calibration curve.
     """
     voltages = np.array(lut['voltages'])
     frequencies = np.array(lut['frequencies'])
-    coeffs = np.array(lut['poly_coeffs'])
     
     # Create a fine voltage axis for the fitted curve.
     voltage_fit = np.linspace(voltages.min(), voltages.max(), 100)
-    frequency_fit = np.polyval(coeffs, voltage_fit)
+    frequency_fit = Calibration.from_lut(lut).frequency_for(voltage_fit)
     
     plt.figure(figsize=(8, 6))
     plt.plot(voltages, frequencies, 'o', label='Measured Data')
@@ -105,21 +266,30 @@ def main():
     wm = Wavemeter(base_url="http://localhost:5000")
     
     rp.connect()
+    wm.start_sampling(channel=0, rate=20)
     
     # Calibration scan settings
     voltage_min = -5   # Start voltage in Volts
     voltage_max = 2.5     # End voltage in Volts
     num_steps = 31      # Sweep in 0.5 V increments
-    wait_time = 1.0     # Wait time for stabilization
+    wait_time = 1.0     # Longest wait for stabilization
+    
+    adaptive = True     # Adaptive point placement, num_steps is then the point budget
+    target_error = 0.01 # Model error (GHz) at which the adaptive scan stops
     
     print("Starting calibration scan...")
-    lut = calibrate_voltage_to_frequency(rp, wm, voltage_min, voltage_max, num_steps, wait_time, poly_order=3)
+    if adaptive:
+        lut = adaptive_calibrate_voltage_to_frequency(rp, wm, voltage_min, voltage_max, target_error=target_error,
+                                                      max_points=num_steps, wait_time=wait_time, poly_order=3)
+    else:
+        lut = calibrate_voltage_to_frequency(rp, wm, voltage_min, voltage_max, num_steps, wait_time, poly_order=3)
     
     lut_filename = "frequency_lut.json"
     save_lut(lut, lut_filename)
     
     plot_lut(lut)
 
+    wm.close()
     rp.disconnect()
 
 if __name__ == "__main__":
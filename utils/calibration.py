@@ -0,0 +1,405 @@
+"""
+Voltage/Frequency Calibration
+-----------------------------
+Calibration models, LUT files and the inverse of the voltage -> frequency
+calibration, built once from a LUT and evaluated on arrays.
+
+Models (fit_model):
+  - "pchip": isotonic (monotonic) regression of the measured points, interpolated
+    by a shape-preserving piecewise cubic (PCHIP). Follows plateaus and keeps the
+    model monotonic, so it can be inverted everywhere.
+  - "poly": global polynomial fit, as in the version 1 LUT files.
+
+LUT files (version 2) store the measurements, the fitted model, its residuals, the
+valid voltage range and the measurement time. Version 1 files (voltages,
+frequencies, poly_coeffs) are still read. load_calibration() caches the parsed
+file and its Calibration until the file changes (modification time and size).
+
+The forward model is tabulated on a dense voltage grid over
+the calibrated range. The monotonic branch of the table is kept, so every
+frequency has a single voltage, and is inverted by linear interpolation in the
+table, falling back to vectorised bisection on the model itself where the
+interpolant misses the voltage tolerance. Frequencies outside the branch give NaN.
+
+Example:
+    calibration = Calibration.from_lut(load_lut("frequency_lut.json"))
+    voltages = calibration.voltage_for_detuning(np.linspace(-2, 2, 401), ref_frequency=384229.0)
+"""
+
+import datetime
+import json
+import os
+import threading
+
+import numpy as np
+
+LUT_VERSION = 2
+DEFAULT_GRID_POINTS = 4097
+DEFAULT_VOLTAGE_TOLERANCE = 1e-6  # V, bisection stops below this bracket width
+
+
+class Calibration:
+    """
+    Forward model and precomputed inverse of a voltage -> frequency calibration.
+    """
+
+    def __init__(self, model, voltage_min, voltage_max, grid_points=DEFAULT_GRID_POINTS,
+                 voltage_tolerance=DEFAULT_VOLTAGE_TOLERANCE):
+        """
+        Args:
+            model (callable): Vectorised forward model, frequency (GHz) = model(voltage (V)).
+            voltage_min (float): Lowest calibrated voltage.
+            voltage_max (float): Highest calibrated voltage.
+            grid_points (int): Size of the inverse table.
+            voltage_tolerance (float): Accuracy of the inverse in volts.
+        """
+        if not voltage_max > voltage_min:
+            raise ValueError("The calibrated voltage range is empty.")
+        self.model = model
+        self.voltage_tolerance = voltage_tolerance
+
+        grid = np.linspace(voltage_min, voltage_max, grid_points)
+        values = np.asarray(model(grid), dtype=float)
+        voltages, frequencies = _monotonic_branch(grid, values)
+        # Inverse table sorted by increasing frequency
+        order = np.argsort(frequencies)
+        self.table_frequencies = frequencies[order]
+        self.table_voltages = voltages[order]
+        self.voltage_range = (float(voltages.min()), float(voltages.max()))
+        self.frequency_range = (float(self.table_frequencies[0]), float(self.table_frequencies[-1]))
+        self._bisection_steps = int(np.ceil(np.log2(max(np.diff(grid[:2])[0] / voltage_tolerance, 1.0))))
+
+    @classmethod
+    def from_lut(cls, lut, **kwargs):
+        """
+        Builds the calibration of a LUT dict (utils/calibScan.py format): its model over
+        its valid voltage range (version 2), or the 'poly_coeffs' polynomial over the
+        range of the measured 'voltages' (version 1).
+        """
+        if lut.get('version', 1) >= 2:
+            low, high = lut['valid_range']
+            return cls(model_from_dict(lut['model']), low, high, **kwargs)
+        coeffs = np.array(lut['poly_coeffs'], dtype=float)
+        voltages = np.asarray(lut['voltages'], dtype=float)
+        return cls(PolynomialModel(coeffs), voltages.min(), voltages.max(), **kwargs)
+
+    def frequency_for(self, voltages):
+        """Model frequency (GHz) of voltages (scalar or array)."""
+        return self.model(np.asarray(voltages, dtype=float))
+
+    def voltage_for(self, frequencies):
+        """
+        Voltages giving the target frequencies, on the monotonic branch.
+
+        Args:
+            frequencies (float or array): Target frequencies in GHz.
+
+        Returns:
+            float or numpy.ndarray: Voltages, NaN where the target is out of range.
+        """
+        targets = np.asarray(frequencies, dtype=float)
+        flat = np.atleast_1d(targets).ravel()
+        table_f, table_v = self.table_frequencies, self.table_voltages
+        inside = (flat >= table_f[0]) & (flat <= table_f[-1])
+        result = np.full(flat.shape, np.nan)
+        if inside.any():
+            goal = flat[inside]
+            voltages = np.interp(goal, table_f, table_v)
+            # The interpolant is exact to the curvature of one table cell; the targets
+            # it misses by more than the tolerance are refined by bisection on the model
+            index = np.clip(np.searchsorted(table_f, goal), 1, len(table_f) - 1)
+            slope = np.abs(np.diff(table_f)[index - 1] / np.diff(table_v)[index - 1])
+            miss = np.abs(self.model(voltages) - goal) > self.voltage_tolerance * slope
+            if miss.any():
+                voltages[miss] = self._bisect(goal[miss], index[miss])
+            result[inside] = voltages
+        if targets.ndim == 0:
+            return float(result[0])
+        return result.reshape(targets.shape)
+
+    def _bisect(self, goal, index):
+        """Vectorised bisection of the model within the table cells index - 1 .. index."""
+        table_f, table_v = self.table_frequencies, self.table_voltages
+        low, high = table_v[index - 1], table_v[index]
+        f_low = table_f[index - 1]
+        for _ in range(self._bisection_steps):
+            middle = 0.5 * (low + high)
+            f_middle = self.model(middle)
+            # Keep the half whose frequency interval still contains the goal
+            same_side = (f_middle - goal) * (f_low - goal) > 0
+            low = np.where(same_side, middle, low)
+            f_low = np.where(same_side, f_middle, f_low)
+            high = np.where(same_side, high, middle)
+        return 0.5 * (low + high)
+
+    def voltage_for_detuning(self, detunings, ref_frequency):
+        """
+        Voltages for detunings (GHz) from the reference frequency (GHz), see voltage_for.
+        """
+        return self.voltage_for(ref_frequency + np.asarray(detunings, dtype=float))
+
+    def in_range(self, frequencies):
+        """Boolean mask of the target frequencies the calibration can reach."""
+        frequencies = np.asarray(frequencies, dtype=float)
+        return (frequencies >= self.frequency_range[0]) & (frequencies <= self.frequency_range[1])
+
+
+def _monotonic_branch(grid, values):
+    """
+    Longest run of the tabulated model that is strictly monotonic.
+
+    Returns:
+        tuple: (voltages, frequencies) of that run.
+    """
+    signs = np.sign(np.diff(values))
+    # Run boundaries wherever the slope changes sign or vanishes
+    breaks = np.flatnonzero((signs[1:] != signs[:-1]) | (signs[1:] == 0)) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(signs)]))
+    valid = signs[starts] != 0
+    if not valid.any():
+        raise ValueError("The calibration model is constant over the voltage range.")
+    lengths = np.where(valid, ends - starts, -1)
+    best = int(np.argmax(lengths))
+    start, end = starts[best], ends[best]
+    return grid[start:end + 1], values[start:end + 1]
+
+
+class PolynomialModel:
+    """Polynomial forward model, frequency = polyval(coeffs, voltage)."""
+
+    kind = "poly"
+
+    def __init__(self, coeffs):
+        self.coeffs = np.asarray(coeffs, dtype=float)
+
+    def __call__(self, voltages):
+        return np.polyval(self.coeffs, voltages)
+
+    def to_dict(self):
+        return {"kind": self.kind, "coeffs": self.coeffs.tolist()}
+
+
+class PchipModel:
+    """
+    Shape-preserving piecewise cubic Hermite interpolant (Fritsch-Carlson) through
+    knots. Monotonic knots give a monotonic model.
+    """
+
+    kind = "pchip"
+
+    def __init__(self, knots_voltage, knots_frequency):
+        self.x = np.asarray(knots_voltage, dtype=float)
+        self.y = np.asarray(knots_frequency, dtype=float)
+        if len(self.x) < 2 or np.any(np.diff(self.x) <= 0):
+            raise ValueError("PCHIP knots need at least 2 strictly increasing voltages.")
+        self.slopes = _pchip_slopes(self.x, self.y)
+
+    def __call__(self, voltages):
+        v = np.asarray(voltages, dtype=float)
+        x, y, d = self.x, self.y, self.slopes
+        i = np.clip(np.searchsorted(x, v, side="right") - 1, 0, len(x) - 2)
+        h = x[i + 1] - x[i]
+        t = (v - x[i]) / h
+        t2, t3 = t * t, t * t * t
+        return ((2 * t3 - 3 * t2 + 1) * y[i] + (t3 - 2 * t2 + t) * h * d[i]
+                + (-2 * t3 + 3 * t2) * y[i + 1] + (t3 - t2) * h * d[i + 1])
+
+    def to_dict(self):
+        return {"kind": self.kind, "knots_voltage": self.x.tolist(), "knots_frequency": self.y.tolist()}
+
+
+def model_from_dict(data):
+    """Rebuilds a model stored with to_dict()."""
+    if data["kind"] == PolynomialModel.kind:
+        return PolynomialModel(data["coeffs"])
+    if data["kind"] == PchipModel.kind:
+        return PchipModel(data["knots_voltage"], data["knots_frequency"])
+    raise ValueError(f"Unknown calibration model '{data['kind']}'.")
+
+
+def _pchip_slopes(x, y):
+    """Knot derivatives of the monotone PCHIP interpolant."""
+    h = np.diff(x)
+    delta = np.diff(y) / h
+    if len(x) == 2:
+        return np.array([delta[0], delta[0]])
+    d = np.zeros(len(x))
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    same_sign = delta[:-1] * delta[1:] > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+    d[1:-1] = np.where(same_sign, harmonic, 0.0)
+    d[0] = _pchip_end_slope(h[0], h[1], delta[0], delta[1])
+    d[-1] = _pchip_end_slope(h[-1], h[-2], delta[-1], delta[-2])
+    return d
+
+
+def _pchip_end_slope(h0, h1, delta0, delta1):
+    """Shape-preserving three-point end derivative."""
+    d = ((2 * h0 + h1) * delta0 - h0 * delta1) / (h0 + h1)
+    if np.sign(d) != np.sign(delta0):
+        return 0.0
+    if np.sign(delta0) != np.sign(delta1) and abs(d) > abs(3 * delta0):
+        return 3 * delta0
+    return d
+
+
+def isotonic_regression(values, weights=None, increasing=True):
+    """
+    Least-squares monotonic fit of a sequence (pool adjacent violators).
+
+    Returns:
+        tuple: (block values, block weights, block sizes), consecutive blocks of
+            equal fitted value merged.
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float)
+    sign = 1.0 if increasing else -1.0
+    block_values, block_weights, block_sizes = [], [], []
+    for value, weight in zip(sign * values, weights):
+        block_values.append(value)
+        block_weights.append(weight)
+        block_sizes.append(1)
+        # Merge while the last two blocks violate the order (ties merged as well)
+        while len(block_values) > 1 and block_values[-2] >= block_values[-1]:
+            value, weight, size = block_values.pop(), block_weights.pop(), block_sizes.pop()
+            total = block_weights[-1] + weight
+            block_values[-1] = (block_values[-1] * block_weights[-1] + value * weight) / total
+            block_weights[-1] = total
+            block_sizes[-1] += size
+    return sign * np.array(block_values), np.array(block_weights), np.array(block_sizes)
+
+
+def fit_model(voltages, frequencies, kind="pchip", poly_order=3):
+    """
+    Fits a calibration model to measured points.
+
+    Args:
+        voltages (array): Measured voltages (V).
+        frequencies (array): Measured frequencies (GHz).
+        kind (str): "pchip" (monotonic piecewise cubic) or "poly".
+        poly_order (int): Order of the "poly" fit.
+
+    Returns:
+        tuple: (model, residuals in GHz at each measured point, in the input order)
+    """
+    voltages = np.asarray(voltages, dtype=float)
+    frequencies = np.asarray(frequencies, dtype=float)
+    if kind == PolynomialModel.kind:
+        model = PolynomialModel(np.polyfit(voltages, frequencies, poly_order))
+    elif kind == PchipModel.kind:
+        order = np.argsort(voltages, kind="stable")
+        v, f = voltages[order], frequencies[order]
+        increasing = np.polyfit(v, f, 1)[0] >= 0
+        values, _, sizes = isotonic_regression(f, increasing=increasing)
+        if len(values) < 2:
+            raise ValueError("The measured frequencies show no monotonic trend to fit.")
+        # One knot per block of pooled points, at their mean voltage
+        bounds = np.concatenate(([0], np.cumsum(sizes)))
+        knots = np.array([v[a:b].mean() for a, b in zip(bounds[:-1], bounds[1:])])
+        model = PchipModel(knots, values)
+    else:
+        raise ValueError(f"Unknown calibration model '{kind}', use 'pchip' or 'poly'.")
+    return model, frequencies - model(voltages)
+
+
+def build_lut(voltages, frequencies, settle_times=None, kind="pchip", poly_order=3, measured_at=None,
+              **extra):
+    """
+    Fits a model and assembles a version 2 LUT dict.
+
+    The polynomial fit is always stored as 'poly_coeffs' too, for version 1 readers.
+
+    Args:
+        voltages (array): Measured voltages (V).
+        frequencies (array): Measured frequencies (GHz).
+        settle_times (list): Settle time of each point (s).
+        kind (str): Model kind, see fit_model.
+        poly_order (int): Order of the polynomial fit.
+        measured_at (str): ISO time of the measurement (default: now).
+        **extra: Additional entries (e.g. 'model_error', 'mode').
+
+    Returns:
+        dict: LUT.
+    """
+    voltages = np.asarray(voltages, dtype=float)
+    frequencies = np.asarray(frequencies, dtype=float)
+    model, residuals = fit_model(voltages, frequencies, kind, poly_order)
+    coeffs = np.polyfit(voltages, frequencies, poly_order)
+    if isinstance(model, PchipModel):
+        # Pooled end points have their knot inside the scan, do not extrapolate past it
+        valid_range = [float(model.x[0]), float(model.x[-1])]
+    else:
+        valid_range = [float(voltages.min()), float(voltages.max())]
+    lut = {
+        'version': LUT_VERSION,
+        'measured_at': measured_at or datetime.datetime.now().isoformat(timespec="seconds"),
+        'voltages': voltages.tolist(),
+        'frequencies': frequencies.tolist(),
+        'model': model.to_dict(),
+        'fit': kind,
+        'valid_range': valid_range,
+        'residuals': {
+            'per_point': residuals.tolist(),
+            'rms': float(np.sqrt(np.mean(residuals ** 2))),
+            'max': float(np.abs(residuals).max()),
+        },
+        'poly_coeffs': coeffs.tolist(),
+    }
+    if settle_times is not None:
+        lut['settle_times'] = list(settle_times)
+    lut.update(extra)
+    return lut
+
+
+_cache = {}  # Absolute path -> (modification time, size, LUT, Calibration or None)
+_cache_lock = threading.Lock()
+
+
+def _cached_entry(filename):
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            return path, entry
+    with open(path, 'r') as f:
+        lut = json.load(f)
+    entry = (stat.st_mtime_ns, stat.st_size, lut, None)
+    with _cache_lock:
+        _cache[path] = entry
+    return path, entry
+
+
+def load_lut_cached(filename):
+    """
+    Loads a LUT file, parsing it again only when it changed on disk.
+
+    The returned dict is shared between callers and must not be modified.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    return _cached_entry(filename)[1][2]
+
+
+def load_calibration(filename, **kwargs):
+    """
+    Calibration of a LUT file, rebuilt only when the file changed on disk.
+
+    Args:
+        filename (str): LUT file.
+        **kwargs: Calibration options (grid_points, voltage_tolerance), used when it is built.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    path, (mtime, size, lut, calibration) = _cached_entry(filename)
+    if calibration is None:
+        calibration = Calibration.from_lut(lut, **kwargs)
+        with _cache_lock:
+            if _cache.get(path, (None, None))[:2] == (mtime, size):
+                _cache[path] = (mtime, size, lut, calibration)
+    return calibration
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Detuning Sweep Procedure
+
+Visits a list of target detunings (relative to an absolute reference frequency) in one
+session: one Red Pitaya connection, one LUT load, and for each target a feed-forward
+voltage from the calibration followed by a few wavemeter feedback corrections until
+the frequency error is within tolerance.
+
+Targets are visited in order of their feed-forward voltage, starting from the end
+closest to the current voltage, so the total voltage travel (and the settling it
+causes) is minimal. For every point the iteration count, settle time and final error
+are logged.
+
+Example:
+    python utils/detuningSweep.py -2 -1 0 1 2 --tolerance 0.005
+"""
+
+import time
+import json
+import numpy as np
+import sys
+import os
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from devices.WaveMeter import Wavemeter
+from devices.RPSignalGenerator import RedPitayaSignalGenerator
+from utils.calibration import load_calibration
+from utils.settle import sampling, wait_until_settled
+
+DEFAULT_REFERENCE = 384229.0  # GHz, as in utils/setDetuning.py
+
+
+def plan_order(voltages, start_voltage=None):
+    """
+    Visiting order minimising the voltage travel: sorted by voltage, from the end
+    closest to start_voltage.
+
+    Args:
+        voltages (array): Feed-forward voltages of the targets.
+        start_voltage (float): Current voltage, None to start from the lowest.
+
+    Returns:
+        numpy.ndarray: Indices of the targets in visiting order.
+    """
+    order = np.argsort(voltages, kind="stable")
+    if start_voltage is not None and len(order) > 1:
+        if abs(voltages[order[-1]] - start_voltage) < abs(voltages[order[0]] - start_voltage):
+            order = order[::-1]
+    return order
+
+
+def sweep_detunings(rp, wm, calibration, detunings, ref_frequency=DEFAULT_REFERENCE, tolerance=0.005,
+                    max_iterations=5, settle_timeout=1.0, start_voltage=None, on_point=None):
+    """
+    Sets each target detuning in closed loop.
+
+    Args:
+        rp (RedPitayaSignalGenerator): Instance to control the RP.
+        wm (Wavemeter): Instance to fetch frequency from the wavemeter.
+        calibration (Calibration): Voltage/frequency calibration (utils/calibration.py).
+        detunings (list): Target detunings in GHz.
+        ref_frequency (float): Absolute reference frequency in GHz.
+        tolerance (float): Largest accepted frequency error in GHz.
+        max_iterations (int): Voltage settings per target, feed-forward included.
+        settle_timeout (float): Longest settling wait after each voltage change (s).
+        start_voltage (float): Current Channel 2 voltage, used to choose the sweep direction.
+        on_point (callable): Called with each point result as soon as it is done.
+
+    Returns:
+        list: One dict per target, in the order given: "detuning", "target_frequency",
+            "voltage", "frequency" (GHz, None without reading), "error" (GHz, target
+            minus measured), "iterations", "settle_time" (s, summed over iterations),
+            "converged" and "order" (visiting rank). Unreachable targets have
+            "voltage" None and "iterations" 0.
+    """
+    detunings = np.atleast_1d(np.asarray(detunings, dtype=float))
+    targets = ref_frequency + detunings
+    feed_forward = calibration.voltage_for(targets)
+    low, high = calibration.voltage_range
+    reachable = np.flatnonzero(~np.isnan(feed_forward))
+    results = [None] * len(detunings)
+
+    for index in np.flatnonzero(np.isnan(feed_forward)):
+        print(f"Detuning {detunings[index]:.3f} GHz is outside the calibrated range, skipped.")
+        results[index] = {"detuning": float(detunings[index]), "target_frequency": float(targets[index]),
+                          "voltage": None, "frequency": None, "error": None, "iterations": 0,
+                          "settle_time": 0.0, "converged": False, "order": None}
+
+    order = reachable[plan_order(feed_forward[reachable], start_voltage)]
+    with sampling(wm, channel=0):
+        for rank, index in enumerate(order):
+            target = targets[index]
+            voltage = float(feed_forward[index])
+            frequency, error, settle_time = None, None, 0.0
+            previous = None  # (voltage, frequency) of the last iteration, for the secant slope
+            iterations = 0
+            while iterations < max_iterations:
+                t0 = time.time()
+                rp.set_dc_voltage(voltage)
+                iterations += 1
+                result = wait_until_settled(wm, since=t0, channel=0, timeout=settle_timeout)
+                settle_time += result["settle_time"]
+                frequency = result["frequency"]
+                if frequency is None:
+                    break
+                error = target - frequency
+                if abs(error) <= tolerance or iterations >= max_iterations:
+                    break
+                # Newton step on the measured curve: secant slope once two points exist
+                slope = _model_slope(calibration, voltage)
+                if previous is not None and previous[0] != voltage:
+                    secant = (frequency - previous[1]) / (voltage - previous[0])
+                    if np.sign(secant) == np.sign(slope):
+                        slope = secant
+                previous = (voltage, frequency)
+                voltage = float(np.clip(voltage + error / slope, low, high))
+
+            point = {
+                "detuning": float(detunings[index]),
+                "target_frequency": float(target),
+                "voltage": voltage,
+                "frequency": frequency,
+                "error": error,
+                "iterations": iterations,
+                "settle_time": settle_time,
+                "converged": error is not None and abs(error) <= tolerance,
+                "order": rank,
+            }
+            results[index] = point
+            error_text = "no reading" if error is None else f"{error * 1e3:+.1f} MHz"
+            print(f"Detuning {point['detuning']:+.3f} GHz: {voltage:.4f} V, error {error_text}, "
+                  f"{iterations} iteration(s), settled in {settle_time:.2f} s"
+                  f"{'' if point['converged'] else ' (not converged)'}")
+            if on_point is not None:
+                on_point(point)
+    return results
+
+
+def _model_slope(calibration, voltage, step=1e-3):
+    """dF/dV of the calibration model at voltage (GHz/V), from a central difference."""
+    low, high = calibration.voltage_range
+    a, b = max(voltage - step, low), min(voltage + step, high)
+    return float((calibration.frequency_for(b) - calibration.frequency_for(a)) / (b - a))
+
+
+def main(detunings, lut_filename="frequency_lut.json", ref_frequency=DEFAULT_REFERENCE, tolerance=0.005,
+         max_iterations=5, log_filename=None):
+    rp = RedPitayaSignalGenerator("10.0.2.102")
+    rp.connect()
+    wm = Wavemeter(base_url="http://localhost:5000")
+
+    try:
+        calibration = load_calibration(lut_filename)
+    except FileNotFoundError:
+        print(f"Calibration LUT {lut_filename} not found. Exiting.")
+        wm.close()
+        rp.disconnect()
+        return
+
+    log = open(log_filename, "a") if log_filename else None
+    try:
+        def write_point(point):
+            if log is not None:
+                log.write(json.dumps(point) + "\n")
+                log.flush()
+
+        t0 = time.perf_counter()
+        results = sweep_detunings(rp, wm, calibration, detunings, ref_frequency, tolerance=tolerance,
+                                  max_iterations=max_iterations, on_point=write_point)
+        converged = sum(point["converged"] for point in results)
+        print(f"{converged}/{len(results)} detunings within {tolerance * 1e3:.1f} MHz "
+              f"in {time.perf_counter() - t0:.1f} s")
+    finally:
+        if log is not None:
+            log.close()
+        wm.close()
+        rp.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set a list of detunings (in GHz) in closed loop.")
+    parser.add_argument("detunings", type=float, nargs="+", help="Target detunings in GHz")
+    parser.add_argument("--lut", default="frequency_lut.json", help="Calibration LUT file")
+    parser.add_argument("--ref", type=float, default=DEFAULT_REFERENCE, help="Reference frequency in GHz")
+    parser.add_argument("--tolerance", type=float, default=0.005, help="Frequency tolerance in GHz")
+    parser.add_argument("--max-iterations", type=int, default=5, help="Voltage settings per detuning")
+    parser.add_argument("--log", default=None, help="JSON lines file receiving one line per detuning")
+    args = parser.parse_args()
+    main(args.detunings, args.lut, args.ref, args.tolerance, args.max_iterations, args.log)
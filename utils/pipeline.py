@@ -0,0 +1,150 @@
+"""
+Acquisition Pipeline
+--------------------
+Small dependency-driven engine used to overlap the stages of a stepped acquisition.
+
+Each stage runs on a "lane". A lane is a single worker thread, usually one per
+instrument, so commands to one device are never interleaved. Stages declare
+explicit dependencies on other stages of the same step (offset 0) or of earlier
+steps (offset -1, -2, ...). A stage only starts once all its dependencies have
+finished, so ordering constraints such as "do not change the voltage before the
+wavemeter has read the previous point" are preserved while independent work on
+other instruments runs in parallel.
+
+Example:
+    pipe = AcquisitionPipeline(depth=2)
+    pipe.add_stage("voltage", set_voltage, lane="signal_gen", after=[("wavemeter", -1)])
+    pipe.add_stage("wavemeter", read_wavemeter, lane="wavemeter", after=["voltage"])
+    results = pipe.run(num_steps=100)
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Stage:
+    """A named unit of work executed once per step on a given lane."""
+
+    def __init__(self, name, func, lane, after):
+        self.name = name
+        self.func = func
+        self.lane = lane
+        self.after = after
+
+
+class AcquisitionPipeline:
+    """
+    Runs a list of stages for a number of steps, overlapping independent stages.
+
+    Stages are added in dependency order with add_stage(). Each stage function is
+    called as func(step, values) where values maps the names of the stages already
+    finished for this step to their return value.
+    """
+
+    def __init__(self, depth=2):
+        """
+        Args:
+            depth (int): Number of earlier steps allowed to be unfinished when a new
+                step is submitted. Also bounds how far back a dependency may look.
+        """
+        if depth < 1:
+            raise ValueError("Pipeline depth must be at least 1.")
+        self.depth = depth
+        self.stages = []
+
+    def add_stage(self, name, func, lane=None, after=()):
+        """
+        Adds a stage to the pipeline.
+
+        Args:
+            name (str): Unique stage name.
+            func (callable): Called as func(step, values) and returns the stage value.
+            lane (str): Worker lane; stages on the same lane never run concurrently.
+                Defaults to the stage name.
+            after (list): Dependencies, either a stage name (same step) or a
+                (stage name, step offset) tuple with offset <= 0.
+        """
+        known = {stage.name for stage in self.stages}
+        if name in known:
+            raise ValueError(f"Stage '{name}' already defined.")
+
+        deps = []
+        for dep in after:
+            dep_name, offset = (dep, 0) if isinstance(dep, str) else dep
+            if offset > 0:
+                raise ValueError(f"Stage '{name}' cannot depend on a future step.")
+            if offset == 0 and dep_name not in known:
+                raise ValueError(f"Stage '{name}' depends on '{dep_name}', which must be added first.")
+            deps.append((dep_name, offset))
+
+        self.stages.append(Stage(name, func, lane or name, deps))
+
+    def run(self, num_steps, on_step=None, keep_results=True):
+        """
+        Executes all stages for num_steps steps.
+
+        Args:
+            num_steps (int): Number of steps.
+            on_step (callable): Optional callback on_step(step, values, timings) called
+                in step order as soon as a step has completed.
+            keep_results (bool): If False, step values are only passed to on_step and
+                dropped afterwards, so long runs use constant memory.
+
+        Returns:
+            list: One dict per step with the stage values and a "timings" entry holding
+                the (start, duration) of each stage in seconds. Empty if keep_results
+                is False.
+        """
+        # Stage names referenced with a negative offset must exist as well
+        names = {stage.name for stage in self.stages}
+        for stage in self.stages:
+            for dep_name, offset in stage.after:
+                if dep_name not in names:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep_name}'.")
+                if -offset > self.depth:
+                    raise ValueError(f"Stage '{stage.name}' looks back {-offset} steps, "
+                                     f"more than the pipeline depth {self.depth}.")
+
+        lanes = {stage.lane for stage in self.stages}
+        executors = {lane: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"lane-{lane}")
+                     for lane in lanes}
+        futures = {}
+        t0 = time.perf_counter()
+        results = []
+
+        def execute(stage, step, deps):
+            # Every dependency was submitted before this stage, so waiting cannot deadlock
+            values = {}
+            for (dep_name, offset), future in deps:
+                value, _ = future.result()
+                if offset == 0:
+                    values[dep_name] = value
+            start = time.perf_counter()
+            value = stage.func(step, values)
+            return value, (start - t0, time.perf_counter() - start)
+
+        def collect(step):
+            values, timings = {}, {}
+            for stage in self.stages:
+                values[stage.name], timings[stage.name] = futures.pop((stage.name, step)).result()
+            if on_step is not None:
+                on_step(step, values, timings)
+            if keep_results:
+                values["timings"] = timings
+                results.append(values)
+
+        try:
+            for step in range(num_steps):
+                for stage in self.stages:
+                    deps = [((dep_name, offset), futures[(dep_name, step + offset)])
+                            for dep_name, offset in stage.after if step + offset >= 0]
+                    futures[(stage.name, step)] = executors[stage.lane].submit(execute, stage, step, deps)
+                if step >= self.depth:
+                    collect(step - self.depth)
+            for step in range(max(0, num_steps - self.depth), num_steps):
+                collect(step)
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        return results
@@ -0,0 +1,209 @@
+"""
+Run Store
+---------
+Append-only, chunked on-disk storage for experiment runs.
+
+A run is a directory holding three files:
+  - meta.json   : run metadata (experiment parameters, trace length, dtypes)
+  - steps.bin   : packed records of STEP_DTYPE (step, voltage, laser_frequency)
+  - traces.bin  : float32 rows of `trace_points` samples, one row per step
+
+Steps are buffered in fixed-size chunks and appended to both binary files, so
+writing uses constant memory however long the scan is. The trace row is always
+written before its step record and the reader only exposes steps present in both
+files, so a crash loses at most the current chunk. Both binary files are raw
+little-endian arrays and are read back through numpy memory maps.
+
+Example:
+    with RunWriter("runs/scan_001", metadata=params) as writer:
+        writer.append(step, voltage, laser_frequency, trace)
+    run = RunReader("runs/scan_001")
+    run.voltage, run.traces[10]
+"""
+
+import datetime
+import json
+import os
+
+import numpy as np
+
+FORMAT_NAME = "bragg-run"
+FORMAT_VERSION = 1
+
+STEP_DTYPE = np.dtype([
+    ("step", "<i4"),
+    ("voltage", "<f8"),
+    ("laser_frequency", "<f8"),
+])
+TRACE_DTYPE = np.dtype("<f4")
+
+META_FILE = "meta.json"
+STEPS_FILE = "steps.bin"
+TRACES_FILE = "traces.bin"
+
+
+def _write_json_atomic(path, data):
+    """Writes JSON through a temporary file so a crash never leaves a truncated file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RunWriter:
+    """
+    Streams experiment steps to a run directory.
+    """
+
+    def __init__(self, path, metadata=None, chunk_size=16):
+        """
+        Creates the run directory and writes its metadata.
+
+        Args:
+            path (str): Run directory. Must not already contain a run.
+            metadata (dict): JSON-serialisable run parameters (e.g. set_experiment arguments).
+            chunk_size (int): Number of steps buffered before each append to disk.
+        """
+        if os.path.exists(os.path.join(path, META_FILE)):
+            raise FileExistsError(f"A run already exists in {path}")
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.chunk_size = chunk_size
+        self.meta = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "parameters": metadata or {},
+            "trace_points": None,
+            "steps_dtype": STEP_DTYPE.descr,
+            "trace_dtype": TRACE_DTYPE.str,
+        }
+        _write_json_atomic(os.path.join(path, META_FILE), self.meta)
+
+        self._steps_file = open(os.path.join(path, STEPS_FILE), "ab")
+        self._traces_file = open(os.path.join(path, TRACES_FILE), "ab")
+        self._steps = np.zeros(chunk_size, dtype=STEP_DTYPE)
+        self._traces = None
+        self._pending = 0
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append(self, step, voltage, laser_frequency, trace):
+        """
+        Appends one step to the run.
+
+        Args:
+            step (int): Step index.
+            voltage (float): Control voltage (V).
+            laser_frequency (float or None): Wavemeter reading (GHz); None is stored as NaN.
+            trace (array-like): Spectrum analyzer trace. Every trace of a run must have
+                the same number of points.
+        """
+        trace = np.asarray(trace, dtype=TRACE_DTYPE).ravel()
+        if self._traces is None:
+            self._traces = np.zeros((self.chunk_size, trace.size), dtype=TRACE_DTYPE)
+            self.meta["trace_points"] = int(trace.size)
+            _write_json_atomic(os.path.join(self.path, META_FILE), self.meta)
+        elif trace.size != self._traces.shape[1]:
+            raise ValueError(f"Trace has {trace.size} points, expected {self._traces.shape[1]}.")
+
+        self._steps[self._pending] = (step, voltage, np.nan if laser_frequency is None else laser_frequency)
+        self._traces[self._pending] = trace
+        self._pending += 1
+        self.count += 1
+        if self._pending == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Appends the buffered steps to disk and syncs the files."""
+        if self._pending == 0:
+            return
+        # Traces first: a step record is only visible once its trace is on disk
+        self._traces_file.write(self._traces[:self._pending].tobytes())
+        self._traces_file.flush()
+        os.fsync(self._traces_file.fileno())
+        self._steps_file.write(self._steps[:self._pending].tobytes())
+        self._steps_file.flush()
+        os.fsync(self._steps_file.fileno())
+        self._pending = 0
+
+    def close(self):
+        """Flushes the remaining steps and closes the files."""
+        if self._steps_file.closed:
+            return
+        self.flush()
+        self._steps_file.close()
+        self._traces_file.close()
+
+
+class RunReader:
+    """
+    Memory-mapped read access to a run directory.
+
+    Iterating yields one dict per step with the same keys as
+    ExperimentController.run_experiment() results.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Run directory written by RunWriter.
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} does not contain a run.")
+        self.parameters = self.meta["parameters"]
+
+        steps_path = os.path.join(path, STEPS_FILE)
+        traces_path = os.path.join(path, TRACES_FILE)
+        n_points = self.meta["trace_points"] or 0
+        n_steps = os.path.getsize(steps_path) // STEP_DTYPE.itemsize
+        if n_points:
+            n_steps = min(n_steps, os.path.getsize(traces_path) // (n_points * TRACE_DTYPE.itemsize))
+        else:
+            n_steps = 0
+
+        if n_steps:
+            self.records = np.memmap(steps_path, dtype=STEP_DTYPE, mode="r", shape=(n_steps,))
+            self.traces = np.memmap(traces_path, dtype=TRACE_DTYPE, mode="r", shape=(n_steps, n_points))
+        else:
+            self.records = np.zeros(0, dtype=STEP_DTYPE)
+            self.traces = np.zeros((0, n_points), dtype=TRACE_DTYPE)
+
+    @property
+    def steps(self):
+        return self.records["step"]
+
+    @property
+    def voltage(self):
+        return self.records["voltage"]
+
+    @property
+    def laser_frequency(self):
+        return self.records["laser_frequency"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        record = self.records[index]
+        return {
+            "step": int(record["step"]),
+            "voltage": float(record["voltage"]),
+            "laser_frequency": float(record["laser_frequency"]),
+            "spectrum": self.traces[index],
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
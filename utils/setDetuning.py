@@ -4,16 +4,15 @@ Set Detuning Procedure
 
 This script loads a calibration LUT (generated previously) that maps Channel 2 voltage to
 laser frequency (in GHz). It then calculates the voltage required to achieve a target detuning
-(relative to an absolute reference frequency, set here to 384229.0 GHz), sets that voltage on
-the Red Pitaya, verifies the resulting laser frequency via the wavemeter, and (optionally)
-plots the calibration LUT.
+(relative to a reference frequency, by default the centre of the calibrated frequency range, or
+given with --ref), sets that voltage on the Red Pitaya, verifies the resulting laser frequency via
+the wavemeter, and (optionally) plots the calibration LUT.
 
 The calibration LUT may be generated using a higher order polynomial fit (e.g. poly order 3).
-In this case the inversion is performed numerically.
+The inversion uses a precomputed monotonic inverse table (utils/calibration.py).
 """
 
 import time
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 import sys
@@ -24,24 +23,24 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from devices.WaveMeter import Wavemeter
 from devices.RPSignalGenerator import RedPitayaSignalGenerator
+from utils.calibration import Calibration, load_calibration, load_lut_cached
+from utils.settle import wait_until_settled
 
 def load_lut(filename):
     """
-    Loads the LUT from a JSON file.
+    Loads the LUT from a JSON file. The parsed file is cached until it changes on disk,
+    so the returned dict must not be modified.
     """
     if not os.path.exists(filename):
         print(f"File {filename} does not exist.")
         return None
-    with open(filename, 'r') as f:
-        lut = json.load(f)
-    return lut
+    return load_lut_cached(filename)
 
 def predict_frequency(voltage, lut):
     """
-    Uses the LUT's polynomial coefficients to predict the frequency (GHz) for a given voltage.
+    Uses the LUT's calibration model to predict the frequency (GHz) for a given voltage.
     """
-    coeffs = np.array(lut['poly_coeffs'])
-    return np.polyval(coeffs, voltage)
+    return Calibration.from_lut(lut).frequency_for(voltage)
 
 def plot_lut(lut):
     """
@@ -50,17 +49,16 @@ def plot_lut(lut):
     The LUT contains:
       - "voltages": list of voltage setpoints (V)
       - "frequencies": measured frequencies (GHz)
-      - "poly_coeffs": polynomial coefficients for the fit
+      - "model": fitted calibration model ("poly_coeffs" in version 1 files)
 
     This function plots the measured data points and the fitted calibration curve.
     """
     voltages = np.array(lut['voltages'])
     frequencies = np.array(lut['frequencies'])
-    coeffs = np.array(lut['poly_coeffs'])
     
     # Create a fine voltage axis for the fitted curve.
     voltage_fit = np.linspace(voltages.min(), voltages.max(), 100)
-    frequency_fit = np.polyval(coeffs, voltage_fit)
+    frequency_fit = Calibration.from_lut(lut).frequency_for(voltage_fit)
     
     plt.figure(figsize=(8, 6))
     plt.plot(voltages, frequencies, 'o', label='Measured Data')
@@ -80,74 +78,78 @@ def set_target_detuning(rp, detuning, lut, ref_frequency):
     Args:
         rp (RedPitayaSignalGenerator): Instance to control the RP.
         detuning (float): Desired detuning in GHz (e.g. 2 for 2 GHz).
-        lut (dict): Calibration LUT. Its "poly_coeffs" may represent a linear (order 1) or higher
-                    order polynomial fit.
+        lut (dict or Calibration): Calibration LUT, or a Calibration built from it once
+                    (utils/calibration.py) to skip rebuilding the inverse table.
         ref_frequency (float): The absolute reference frequency (GHz) to use.
     
     The target frequency is calculated as:
           target_frequency = ref_frequency + detuning
-    And the required voltage is determined by solving:
-          poly(voltage) = target_frequency
+    And the required voltage is read from the inverse of the calibration, on the monotonic
+    branch of the fit within the calibrated voltage range.
     """
-    coeffs = lut.get('poly_coeffs', [])
+    calibration = lut if isinstance(lut, Calibration) else Calibration.from_lut(lut)
     target_frequency = ref_frequency + detuning
-
-    if len(coeffs) == 2:
-        # Linear case: frequency = a * voltage + b, so voltage = (target_frequency - b) / a
-        a, b = coeffs[0], coeffs[1]
-        voltage = (target_frequency - b) / a
-    else:
-        # Higher order: Solve poly(voltage) - target_frequency = 0
-        poly_coeffs = np.array(coeffs)
-        poly_coeffs[-1] -= target_frequency
-        roots = np.roots(poly_coeffs)
-        # Filter to only real roots
-        real_roots = [r.real for r in roots if np.isreal(r)]
-        if not real_roots:
-            raise ValueError("No real voltage solution found for the given target frequency.")
-        # Optionally, choose the real root within the typical voltage range [-5, 5]
-        valid_roots = [r for r in real_roots if -5 <= r <= 5]
-        if valid_roots:
-            voltage = min(valid_roots, key=lambda r: abs(r))
-        else:
-            voltage = min(real_roots, key=lambda r: abs(r))
+    voltage = calibration.voltage_for(target_frequency)
+    if np.isnan(voltage):
+        low, high = calibration.frequency_range
+        raise ValueError(f"Target frequency {target_frequency:.3f} GHz is outside the calibrated range "
+                         f"[{low:.3f}, {high:.3f}] GHz.")
     print(f"Setting target frequency: {target_frequency:.3f} GHz (detuning: {detuning:.3f} GHz) requires voltage: {voltage:.3f} V")
     rp.set_dc_voltage(voltage)
     return voltage, target_frequency
 
-def main(detuning):
+def main(detuning, ref_frequency=None, lut_filename="frequency_lut.json"):
     rp = RedPitayaSignalGenerator("10.0.2.102")
     rp.connect()
     wm = Wavemeter(base_url="http://localhost:5000")
-    
-    lut_filename = "frequency_lut.json"
-    lut = load_lut(lut_filename)
-    if lut is None:
-        print("Calibration LUT not found. Exiting.")
+
+    try:
+        lut = load_lut(lut_filename)
+        if lut is None:
+            print("Calibration LUT not found. Exiting.")
+            return
+
+        # Optionally, plot the calibration LUT for visual inspection:
+        # plot_lut(lut)
+
+        calibration = load_calibration(lut_filename)
+        low, high = calibration.frequency_range
+        if ref_frequency is None:
+            # Detunings are only reachable inside the calibrated range
+            ref_frequency = (low + high) / 2
+            print(f"Using the centre of the calibrated range as reference frequency: {ref_frequency:.3f} GHz")
+        else:
+            print(f"Using absolute reference frequency: {ref_frequency:.3f} GHz")
+
+        wm.start_sampling(channel=0, rate=20)
+        t0 = time.time()
+        try:
+            voltage, target_frequency = set_target_detuning(rp, detuning, calibration, ref_frequency)
+        except ValueError as e:
+            print(f"{e} Reachable detunings: [{low - ref_frequency:+.3f}, {high - ref_frequency:+.3f}] GHz. Exiting.")
+            return
+
+        # Wait for the frequency to be stable (at most 1 s) instead of a fixed delay
+        result = wait_until_settled(wm, since=t0, channel=0, timeout=1.0)
+        print(f"Settled in {result['settle_time']:.2f} s" if result["settled"] else "Frequency not settled after 1 s")
+
+        measured_frequency = result["frequency"]
+        if measured_frequency is None:
+            print("Measured frequency from wavemeter: no reading")
+            return
+        print(f"Measured frequency from wavemeter: {measured_frequency:.3f} GHz")
+
+        error = (target_frequency - measured_frequency) * 1000
+        print(f"Frequency error: {error:.0f} MHz")
+    finally:
+        wm.close()
         rp.disconnect()
-        return
-    
-    # Optionally, plot the calibration LUT for visual inspection:
-    # plot_lut(lut)
-    
-    absolute_ref = 384229.0  # GHz
-    ref_frequency = absolute_ref
-    print(f"Using absolute reference frequency: {ref_frequency:.3f} GHz")
-    
-    voltage, target_frequency = set_target_detuning(rp, detuning, lut, ref_frequency)
-    
-    time.sleep(1.0)
-    
-    measured_frequency = wm.get_frequency(channel=0)
-    print(f"Measured frequency from wavemeter: {measured_frequency:.3f} GHz")
-    
-    error = (target_frequency - measured_frequency) * 1000
-    print(f"Frequency error: {error:.0f} MHz") 
-    
-    rp.disconnect()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Set detuning (in GHz) for the laser.")
     parser.add_argument("detuning", type=float, help="Desired detuning in GHz (e.g., 1 for 1 GHz)")
+    parser.add_argument("--ref", type=float, default=None,
+                        help="Reference frequency in GHz (default: centre of the calibrated range)")
+    parser.add_argument("--lut", default="frequency_lut.json", help="Calibration LUT file")
     args = parser.parse_args()
-    main(args.detuning)
\ No newline at end of file
+    main(args.detuning, args.ref, args.lut)
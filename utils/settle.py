@@ -0,0 +1,93 @@
+"""
+Settle Detection
+----------------
+Waits for the laser frequency to settle after a setpoint change instead of sleeping
+a fixed time.
+
+The wavemeter channel is sampled in the background (devices.WaveMeter.WavemeterSampler).
+After the change, the readings are watched until every valid reading of the last
+`window` seconds lies within `tolerance` (peak to peak), or until `timeout`.
+
+Example:
+    with sampling(wm, channel=0):
+        t0 = time.time()
+        rp.set_dc_voltage(1.0)
+        result = wait_until_settled(wm, since=t0, tolerance=0.005, timeout=1.0)
+        print(result["frequency"], result["settle_time"])
+"""
+
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from devices.WaveMeter import STATUS_OK
+
+DEFAULT_TOLERANCE = 0.005  # GHz peak to peak
+DEFAULT_WINDOW = 0.2  # s
+DEFAULT_RATE = 50.0  # Hz, wavemeter sampling rate while waiting
+
+
+@contextmanager
+def sampling(wm, channel=0, rate=DEFAULT_RATE):
+    """
+    Runs the wavemeter sampler on channel for the duration of the block. A sampler
+    already running on that channel is used as is and left running.
+
+    Yields:
+        WavemeterSampler: The running sampler.
+    """
+    sampler = wm.sampler
+    if sampler is not None and sampler.channel == channel and sampler.running:
+        yield sampler
+        return
+    sampler = wm.start_sampling(channel=channel, rate=rate)
+    try:
+        yield sampler
+    finally:
+        wm.stop_sampling()
+
+
+def wait_until_settled(wm, since=None, channel=0, tolerance=DEFAULT_TOLERANCE, window=DEFAULT_WINDOW,
+                       timeout=1.0, min_samples=3, poll_interval=0.01):
+    """
+    Blocks until the wavemeter reading is stable after a setpoint change.
+
+    The wavemeter must be sampling channel (see sampling()).
+
+    Args:
+        wm (Wavemeter): Wavemeter with a running sampler.
+        since (float): time.time() of the setpoint change (default: now).
+        channel (int): Wavemeter channel.
+        tolerance (float): Largest peak-to-peak spread of a settled window, in GHz.
+        window (float): Length of the window that must be stable, in seconds.
+        timeout (float): Longest wait in seconds, counted from since.
+        min_samples (int): Valid readings needed in the window.
+        poll_interval (float): Time between checks in seconds.
+
+    Returns:
+        dict: "settled" (bool), "settle_time" (s from since to the end of the stable
+            window, or to the timeout), "frequency" (mean of the window in GHz, None
+            without a valid reading), "spread" (peak to peak in GHz) and "samples".
+    """
+    sampler = wm.sampler
+    if sampler is None or sampler.channel != channel or not sampler.running:
+        raise RuntimeError(f"Wavemeter channel {channel} is not being sampled.")
+    since = time.time() if since is None else since
+    deadline = since + timeout
+    while True:
+        now = time.time()
+        samples = sampler.since(max(since, now - window))
+        valid = samples["value"][samples["status"] == STATUS_OK]
+        # Only judge once a full window of readings after the change is available
+        full = now - since >= window
+        if full and len(valid) >= min_samples and len(valid) == len(samples):
+            spread = float(np.ptp(valid))
+            if spread <= tolerance:
+                return {"settled": True, "settle_time": now - since, "frequency": float(valid.mean()),
+                        "spread": spread, "samples": int(len(valid))}
+        if now >= deadline:
+            return {"settled": False, "settle_time": now - since,
+                    "frequency": float(valid.mean()) if len(valid) else None,
+                    "spread": float(np.ptp(valid)) if len(valid) else None, "samples": int(len(valid))}
+        time.sleep(min(poll_interval, max(deadline - now, 0.0)))